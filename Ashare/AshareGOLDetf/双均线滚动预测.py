@@ -0,0 +1,150 @@
+# 双均线线性预测的滚动训练(walk-forward)版本
+# 每个调仓日只用当时已知的数据重新拟合 次日价格 = a*S1 + b*S2 + c
+# 不再每次从头调用sklearn，而是维护累计的充分统计量(Σx, Σy, ΣxxT, Σxy)，
+# 任意训练区间的统计量都由累计和相减得到，两因子的最小二乘解有闭式解，上千次重新拟合也只是一次向量运算
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 指标库在上一级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 指标库 import IndicatorSet
+
+
+def build_features(close, fast=55, slow=60):
+    """
+    计算均线因子和次日价格
+    参数:
+        close: 收盘价Series
+        fast: 短均线窗口
+        slow: 长均线窗口
+    返回:
+        DataFrame，列为Close、S1、S2、next_day_price(最后一行为NaN)，去掉了均线未形成的行
+    """
+    df = pd.DataFrame({'Close': close})
+    # 均线从指标库取，同一份数据上的同一窗口只计算一次
+    ind = IndicatorSet(close)
+    df['S1'] = ind.sma(fast).iloc[:, 0]
+    df['S2'] = ind.sma(slow).iloc[:, 0]
+    df['next_day_price'] = close.shift(-1)
+    return df.dropna(subset=['S1', 'S2'])
+
+
+def _rolling_sum(cumsum, window):
+    """累计和(前面补0)得到截至每一行(不含)的训练区间之和，window为None表示扩展窗口"""
+    n = len(cumsum) - 1
+    if window is None:
+        return cumsum[:-1]
+    lagged = np.zeros_like(cumsum[:-1])
+    if window < n:
+        lagged[window:] = cumsum[:n - window]
+    return cumsum[:-1] - lagged
+
+
+def walk_forward_fit(features, min_train=250, refit_every=1, window=None):
+    """
+    滚动训练并给出样本外预测
+    参数:
+        features: build_features的返回值
+        min_train: 第一次拟合所需的最少样本数
+        refit_every: 每隔多少个交易日重新拟合一次，1表示每天
+        window: 训练窗口长度，None表示扩展窗口(使用全部历史)
+    返回:
+        DataFrame，在features的基础上增加:
+        coef_S1, coef_S2, intercept(预测时使用的系数), predicted_price(样本外预测的次日价格)
+    """
+    x = features[['S1', 'S2']].to_numpy(dtype=np.float64)
+    y = features['next_day_price'].to_numpy(dtype=np.float64)
+    n = len(x)
+
+    # 第i行的标签(次日价格)在第i+1行收盘后才知道，所以第t行之前可用的训练样本是第0..t-1行
+    known = ~np.isnan(y)
+    w = known.astype(np.float64)
+    y0 = np.where(known, y, 0.0)
+    stats = np.column_stack([
+        w,                      # 样本数
+        x[:, 0] * w,            # Σx1
+        x[:, 1] * w,            # Σx2
+        y0,                     # Σy
+        x[:, 0] * x[:, 0] * w,  # Σx1²
+        x[:, 1] * x[:, 1] * w,  # Σx2²
+        x[:, 0] * x[:, 1] * w,  # Σx1x2
+        x[:, 0] * y0,           # Σx1y
+        x[:, 1] * y0,           # Σx2y
+    ])
+    cumsum = np.vstack([np.zeros((1, stats.shape[1])), np.cumsum(stats, axis=0)])
+    s = _rolling_sum(cumsum, window)
+    cnt, sx1, sx2, sy, sx11, sx22, sx12, sx1y, sx2y = s.T
+
+    # 中心化后的2×2正规方程，闭式求解
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m1, m2, my = sx1 / cnt, sx2 / cnt, sy / cnt
+        c11 = sx11 - cnt * m1 * m1
+        c22 = sx22 - cnt * m2 * m2
+        c12 = sx12 - cnt * m1 * m2
+        c1y = sx1y - cnt * m1 * my
+        c2y = sx2y - cnt * m2 * my
+        det = c11 * c22 - c12 * c12
+        b1 = (c22 * c1y - c12 * c2y) / det
+        b2 = (c11 * c2y - c12 * c1y) / det
+        b0 = my - b1 * m1 - b2 * m2
+    coef = np.column_stack([b1, b2, b0])
+    coef[(cnt < min_train) | ~np.isfinite(det) | (np.abs(det) < 1e-12)] = np.nan
+
+    # 只在调仓日更新系数，其余日子沿用上一次的系数
+    refit = np.zeros(n, dtype=bool)
+    first = np.flatnonzero(cnt >= min_train)
+    if len(first):
+        refit[first[0]::refit_every] = True
+    coef = pd.DataFrame(np.where(refit[:, None], coef, np.nan)).ffill().to_numpy()
+
+    result = features.copy()
+    result['coef_S1'] = coef[:, 0]
+    result['coef_S2'] = coef[:, 1]
+    result['intercept'] = coef[:, 2]
+    result['predicted_price'] = coef[:, 0] * x[:, 0] + coef[:, 1] * x[:, 1] + coef[:, 2]
+    return result
+
+
+def walk_forward_strategy(result):
+    """
+    按样本外预测生成信号和策略收益，规则与双均线脚本相同：预测价格比前一个预测高则持有，否则空仓
+    参数:
+        result: walk_forward_fit的返回值
+    返回:
+        增加gold_returns、signal、strategy_returns、strategy_nv、bmk_nv列的DataFrame
+    """
+    df = result.dropna(subset=['predicted_price']).copy()
+    df['gold_returns'] = df['Close'].pct_change()
+    predicted = df['predicted_price']
+    df['signal'] = np.where(predicted.shift(1) < predicted, 1, 0)
+    df['strategy_returns'] = df['signal'].shift(1) * df['gold_returns']
+    df['strategy_nv'] = (df['strategy_returns'] + 1).cumprod()
+    df['bmk_nv'] = (df['gold_returns'] + 1).cumprod()
+    return df
+
+
+def out_of_sample_r2(result, freq='YE'):
+    """
+    按周期统计样本外决定系数
+    参数:
+        result: walk_forward_fit的返回值
+        freq: 统计周期，'YE'按年，'QE'按季度，None只算整体
+    返回:
+        DataFrame，列为n、r2，最后一行'all'为整体
+    """
+    def r2(part):
+        actual, predicted = part['next_day_price'], part['predicted_price']
+        return 1 - ((actual - predicted) ** 2).sum() / ((actual - actual.mean()) ** 2).sum()
+
+    df = result.dropna(subset=['predicted_price', 'next_day_price'])
+    rows = {}
+    if freq is not None:
+        for period, part in df.groupby(pd.Grouper(freq=freq)):
+            if len(part) >= 2:
+                rows[period.strftime('%Y-%m-%d')] = {'n': len(part), 'r2': r2(part)}
+    rows['all'] = {'n': len(df), 'r2': r2(df)}
+    return pd.DataFrame.from_dict(rows, orient='index')
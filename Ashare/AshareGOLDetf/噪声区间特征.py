@@ -0,0 +1,103 @@
+# 噪声区间特征：论文 An Effective Intraday Momentum Strategy for SP500 中的噪声区间边界和日内VWAP
+# 把分钟K线整理成 交易日×当日时刻 的矩阵，所有计算都是矩阵上的向量运算，不按交易日循环
+#   move[d, t]  = |第d天t时刻收盘价 / 第d天开盘价 - 1|
+#   sigma[d, t] = 过去lookback天(不含当天)同一时刻move的平均值
+#   upper[d, t] = max(第d天开盘价, 前一天收盘价) * (1 + sigma[d, t])
+#   lower[d, t] = min(第d天开盘价, 前一天收盘价) * (1 - sigma[d, t])
+#   vwap[d, t]  = 当天截至t时刻的成交量加权平均价(典型价格(H+L+C)/3)
+
+import numpy as np
+import pandas as pd
+
+
+def to_day_time_matrix(bars, fields=('close',)):
+    """
+    把K线数组的字段整理成 交易日×当日时刻 的矩阵
+    参数:
+        bars: 日内事件回测.BAR_DTYPE结构化数组
+        fields: 字段名列表，例如('open', 'close')
+    返回:
+        (matrices, day, slot)，matrices为{字段: 矩阵}，缺失的位置为NaN，
+        day和slot是每根K线在矩阵中的行号和列号
+    """
+    day, _ = pd.factorize(bars['session'], sort=True)
+    slot, minutes = pd.factorize(bars['minute'], sort=True)
+    matrices = {}
+    for field in fields:
+        matrix = np.full((day.max() + 1, len(minutes)), np.nan)
+        matrix[day, slot] = bars[field]
+        matrices[field] = matrix
+    return matrices, day, slot
+
+
+def _rolling_past_mean(matrix, lookback, min_periods):
+    """按列计算过去lookback行(不含当前行)的均值，忽略NaN"""
+    valid = ~np.isnan(matrix)
+    cs = np.vstack([np.zeros((1, matrix.shape[1])), np.cumsum(np.where(valid, matrix, 0.0), axis=0)])
+    cnt = np.vstack([np.zeros((1, matrix.shape[1])), np.cumsum(valid, axis=0)])
+    rows = np.arange(matrix.shape[0])
+    lo = np.maximum(rows - lookback, 0)
+    total = cs[rows] - cs[lo]
+    count = cnt[rows] - cnt[lo]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+    mean[count < min_periods] = np.nan
+    return mean
+
+
+def noise_area_features(bars, lookback=14, min_periods=None):
+    """
+    计算每根K线的噪声区间和VWAP
+    参数:
+        bars: 日内事件回测.BAR_DTYPE结构化数组
+        lookback: 计算平均波动的天数，论文中为14
+        min_periods: 至少需要多少天的数据，默认等于lookback
+    返回:
+        DataFrame，索引为K线时间，列为day_open、prev_close、sigma、upper、lower、vwap
+    """
+    min_periods = lookback if min_periods is None else min_periods
+    m, day, slot = to_day_time_matrix(bars, ('open', 'high', 'low', 'close', 'volume'))
+    open_, high, low, close, volume = m['open'], m['high'], m['low'], m['close'], m['volume']
+
+    # 每天的开盘价是当天第一根K线的开盘价，前收盘是前一天最后一根K线的收盘价
+    n_days, n_slots = close.shape
+    first_slot = np.argmax(~np.isnan(open_), axis=1)
+    day_open = open_[np.arange(n_days), first_slot]
+    last_slot = n_slots - 1 - np.argmax(~np.isnan(close[:, ::-1]), axis=1)
+    prev_close = np.full(n_days, np.nan)
+    prev_close[1:] = close[np.arange(n_days - 1), last_slot[:-1]]
+
+    move = np.abs(close / day_open[:, None] - 1)
+    sigma = _rolling_past_mean(move, lookback, min_periods)
+    top = np.fmax(day_open, prev_close)[:, None]
+    bottom = np.fmin(day_open, prev_close)[:, None]
+    upper = top * (1 + sigma)
+    lower = bottom * (1 - sigma)
+
+    # 日内VWAP，缺失的K线不计入
+    typical = (high + low + close) / 3
+    pv = np.cumsum(np.nan_to_num(typical * volume), axis=1)
+    vol = np.cumsum(np.nan_to_num(volume), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vwap = np.where(vol > 0, pv / vol, np.nan)
+
+    return pd.DataFrame({
+        'day_open': day_open[day],
+        'prev_close': prev_close[day],
+        'sigma': sigma[day, slot],
+        'upper': upper[day, slot],
+        'lower': lower[day, slot],
+        'vwap': vwap[day, slot],
+    }, index=pd.to_datetime(bars['ts']))
+
+
+def stop_lines(features):
+    """
+    论文中的止损线: 多头为max(上沿, VWAP)，空头为min(下沿, VWAP)
+    返回:
+        (stop_long, stop_short)
+    """
+    upper = features['upper'].to_numpy()
+    lower = features['lower'].to_numpy()
+    vwap = features['vwap'].to_numpy()
+    return np.fmax(upper, vwap), np.fmin(lower, vwap)
@@ -0,0 +1,203 @@
+# 在线信号引擎：每天收盘后只把新K线推进去，O(1)更新均线和动量，给出明天的操作
+# 状态(环形缓冲区、滚动和、最近的预测值、模型系数)保存在json里，下次运行直接接着用，
+# 不用重新下载历史数据，也不用重新计算55/60日均线
+#
+# 用法: python 在线信号.py
+#   第一次运行会用本地行情库的历史数据拟合模型并初始化状态，之后每次只处理新增的K线
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+# 本地行情库在上一级目录
+ASHARE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ASHARE_DIR)
+
+STATE_PATH = os.path.join(ASHARE_DIR, 'A股ETF', 'online_state_{symbol}.json')
+
+
+class OnlineSignalEngine:
+    """
+    双均线线性预测的在线版本
+    参数:
+        fast: 短均线窗口(S1)
+        slow: 长均线窗口(S2)
+        momentum_window: 动量窗口
+        coef: 模型系数(a, b)，预测价格 = a*S1 + b*S2 + intercept
+        intercept: 模型截距
+    """
+
+    def __init__(self, fast=55, slow=60, momentum_window=20, coef=(0.0, 0.0), intercept=0.0):
+        self.fast = fast
+        self.slow = slow
+        self.momentum_window = momentum_window
+        self.coef = list(coef)
+        self.intercept = float(intercept)
+        # 环形缓冲区，要能回看slow根和momentum_window根K线
+        self.capacity = max(fast, slow, momentum_window + 1)
+        self.buffer = [0.0] * self.capacity
+        self.pos = 0        # 下一个写入位置
+        self.count = 0      # 已经推入的K线数量
+        self.sum_fast = 0.0
+        self.sum_slow = 0.0
+        self.last_date = None
+        # 最近两根K线的均线因子，模型系数更新时用来重新计算预测值
+        self.features = []
+
+    # ---------- 内部工具 ----------
+    def _back(self, k):
+        """k根K线之前的收盘价，k=0为最新一根"""
+        return self.buffer[(self.pos - 1 - k) % self.capacity]
+
+    def _recompute_sums(self):
+        # 定期从缓冲区重算滚动和，消除长期累加的浮点误差，摊销后仍然是O(1)
+        n_fast = min(self.count, self.fast)
+        n_slow = min(self.count, self.slow)
+        self.sum_fast = sum(self._back(k) for k in range(n_fast))
+        self.sum_slow = sum(self._back(k) for k in range(n_slow))
+
+    def _predict(self, s1, s2):
+        return self.coef[0] * s1 + self.coef[1] * s2 + self.intercept
+
+    # ---------- 对外接口 ----------
+    def set_model(self, coef, intercept):
+        """更新模型系数，最近的预测值会按新系数重新计算"""
+        self.coef = [float(coef[0]), float(coef[1])]
+        self.intercept = float(intercept)
+
+    def update(self, date, close):
+        """
+        推入一根新的日K线
+        参数:
+            date: 日期，'YYYY-MM-DD'或datetime
+            close: 收盘价
+        返回:
+            当前的信号，见signal()；日期不晚于最后一根K线时忽略，同一天则视为修正最后一根K线
+        """
+        date = str(date)[:10]
+        close = float(close)
+        if self.last_date is not None and date < self.last_date:
+            return self.signal()
+        if date == self.last_date:
+            # 修正最后一根K线: 它在两个窗口里都有，只需要替换差值
+            old = self._back(0)
+            self.buffer[(self.pos - 1) % self.capacity] = close
+            self.sum_fast += close - old
+            self.sum_slow += close - old
+        else:
+            # 先减去滑出窗口的值，再写入新值
+            if self.count >= self.fast:
+                self.sum_fast -= self._back(self.fast - 1)
+            if self.count >= self.slow:
+                self.sum_slow -= self._back(self.slow - 1)
+            self.buffer[self.pos] = close
+            self.pos = (self.pos + 1) % self.capacity
+            self.count += 1
+            self.sum_fast += close
+            self.sum_slow += close
+            self.last_date = date
+            if self.count % self.capacity == 0:
+                self._recompute_sums()
+
+        if self.count >= self.slow:
+            feature = [self.sum_fast / self.fast, self.sum_slow / self.slow]
+            if self.features and self.features[-1][0] == date:
+                self.features[-1] = [date] + feature
+            else:
+                self.features = (self.features + [[date] + feature])[-2:]
+        return self.signal()
+
+    def warm_up(self, dates, closes):
+        """用历史K线初始化状态"""
+        for date, close in zip(dates, closes):
+            self.update(date, close)
+        return self.signal()
+
+    def signal(self):
+        """
+        当前的信号
+        返回:
+            dict: date, close, S1, S2, predicted_price(预测的下一日价格), momentum,
+            signal('买入'/'空仓'，预测价格比上一个预测高则买入)
+        """
+        if self.count == 0:
+            return None
+        result = {'date': self.last_date, 'close': self._back(0)}
+        if self.count > self.momentum_window:
+            result['momentum'] = self._back(0) / self._back(self.momentum_window) - 1
+        if self.features and self.features[-1][0] == self.last_date:
+            _, s1, s2 = self.features[-1]
+            predicted = self._predict(s1, s2)
+            result.update({'S1': s1, 'S2': s2, 'predicted_price': predicted})
+            if len(self.features) == 2:
+                previous = self._predict(self.features[0][1], self.features[0][2])
+                result['signal'] = '买入' if previous < predicted else '空仓'
+        return result
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, state):
+        engine = cls(state['fast'], state['slow'], state['momentum_window'])
+        engine.__dict__.update(state)
+        return engine
+
+    def save(self, path):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """读取保存的状态，文件不存在时返回None"""
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+def main(symbol='518880'):
+    from 本地行情库 import LocalStore
+    from 数据源 import daily_fetcher
+    from 双均线滚动预测 import build_features, walk_forward_fit
+
+    fetch_daily = daily_fetcher()
+    store = LocalStore()
+    path = STATE_PATH.format(symbol=symbol)
+    today = datetime.now().strftime('%Y%m%d')
+    engine = OnlineSignalEngine.load(path)
+
+    if engine is None:
+        # 第一次运行: 用全部历史拟合模型并初始化状态
+        print("未找到在线状态，使用历史数据初始化...")
+        history = store.get(symbol, fetch_daily, start_date='20130801', end_date=today)
+        close = history.set_index('date')['close']
+        last = walk_forward_fit(build_features(close), refit_every=1).iloc[-1]
+        engine = OnlineSignalEngine(coef=(last['coef_S1'], last['coef_S2']), intercept=last['intercept'])
+        engine.warm_up(close.index.strftime('%Y-%m-%d'), close.to_numpy())
+    else:
+        # 之后从最后一根K线当天开始取: 盘中运行时推入的是不完整的K线，
+        # 本地行情库会重新请求这一天，update()对同一天的K线做修正
+        start = datetime.strptime(engine.last_date, '%Y-%m-%d').strftime('%Y%m%d')
+        new_bars = store.get(symbol, fetch_daily, start_date=start, end_date=today) if start <= today else None
+        if new_bars is not None and len(new_bars) > 0:
+            t = time.perf_counter()
+            for date, close in zip(new_bars['date'].dt.strftime('%Y-%m-%d'), new_bars['close']):
+                engine.update(date, close)
+            elapsed = (time.perf_counter() - t) * 1e6
+            print(f"推入 {len(new_bars)} 根新K线，耗时 {elapsed:.1f} 微秒")
+        else:
+            print("没有新的K线")
+
+    engine.save(path)
+    print(engine.signal())
+
+
+if __name__ == "__main__":
+    main()
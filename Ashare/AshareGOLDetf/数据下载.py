@@ -9,7 +9,6 @@ from datetime import datetime, timedelta
 # 用于获取数据
 import os
 import yfinance as yf #国外的，要梯子；国内的使用akshare
-import matplotlib.pyplot as plt
 
 
 # 设置代理，指定HTTP 请求的代理服务器
@@ -31,19 +30,23 @@ aapl.info['forwardPE']
 # 新闻数据
 print(aapl.news)
 
-# 获取美股黄金ETF (GLD) 的历史行情数据
-etf_data = yf.download('GLD', start='2013-08-01', end='2025-08-08')
+# 获取美股黄金ETF (GLD) 的历史行情数据，通过统一数据源，结果会缓存到本地
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 数据源 import get_bars
+# 图表在最后生成，不阻塞；环境变量QUANT_REPORT=off时不画图
+from 报告 import Report
+report = Report('数据下载')
+etf_data = get_bars('GLD', '20130801', '20250807', source='yfinance').set_index('date')
 # 只需要收盘价序列
-Df = etf_data[['Close']]
+Df = etf_data[['close']].rename(columns={'close': 'Close'})
 # yfinance已自动设置Index为datetime格式的日期
 # 去除空值
 Df = Df.dropna()
 # 去除空值
 Df = Df.dropna()
 # 画出黄金ETF的价格走势图
-Df.Close.plot(figsize=(15, 8), color='red')
-plt.ylabel('黄金ETF价格')
-plt.title('黄金ETF价格序列')
-plt.show()
+report.line('黄金ETF价格序列', Df[['Close']], ylabel='黄金ETF价格', colors=['red'], legend=False)
 # 查看Df的数据形式
-print(Df)
\ No newline at end of file
+print(Df)
+report.finish()
\ No newline at end of file
@@ -0,0 +1,233 @@
+# 日内事件驱动回测：逐根K线处理，支持交易日边界、只在指定时刻交易、收盘前强制平仓
+# 论文：An Effective Intraday Momentum Strategy for SP500
+# 价格突破噪声区间上沿做多、跌破下沿做空，持仓期间价格回到止损线(区间边界或VWAP)内则平仓，收盘一律平仓
+#
+# K线和成交记录都用numpy结构化数组保存，逐K线的循环在安装了numba时会被编译，每秒可以处理上千万根K线；
+# 没有numba时退化为纯Python循环，结果相同但慢很多
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+# K线: 时间戳(纳秒)、交易日序号、当日分钟数、OHLCV
+BAR_DTYPE = np.dtype([
+    ('ts', 'i8'),
+    ('session', 'i4'),
+    ('minute', 'i2'),
+    ('open', 'f8'),
+    ('high', 'f8'),
+    ('low', 'f8'),
+    ('close', 'f8'),
+    ('volume', 'f8'),
+])
+
+# 成交记录: 第几根K线、方向(1买入/-1卖出)、数量、价格、原因
+FILL_DTYPE = np.dtype([
+    ('bar', 'i4'),
+    ('side', 'i1'),
+    ('qty', 'f8'),
+    ('price', 'f8'),
+    ('reason', 'i1'),
+])
+
+# 成交原因
+ENTRY, STOP, CLOSE = 0, 1, 2
+REASONS = {ENTRY: 'entry', STOP: 'stop', CLOSE: 'close'}
+
+
+def bars_from_frame(df):
+    """
+    把以datetime为索引、包含open/high/low/close/volume列的DataFrame转换成K线数组
+    参数:
+        df: get_high_frequency_data返回的DataFrame
+    返回:
+        BAR_DTYPE结构化数组，按时间排序
+    """
+    df = df.sort_index()
+    index = pd.DatetimeIndex(df.index).as_unit('ns')
+    bars = np.empty(len(df), dtype=BAR_DTYPE)
+    bars['ts'] = index.asi8
+    bars['session'] = (index.normalize().asi8 // 86_400_000_000_000).astype(np.int32)
+    bars['minute'] = index.hour * 60 + index.minute
+    for col in ('open', 'high', 'low', 'close'):
+        bars[col] = df[col].to_numpy(dtype=np.float64) if col in df.columns else df['close'].to_numpy()
+    bars['volume'] = df['volume'].to_numpy(dtype=np.float64) if 'volume' in df.columns else 0.0
+    return bars
+
+
+def session_last_bar(bars):
+    """每个交易日最后一根K线的位置"""
+    session = bars['session']
+    last = np.ones(len(bars), dtype=bool)
+    last[:-1] = session[1:] != session[:-1]
+    return last
+
+
+def decision_mask(bars, trade_times=None):
+    """
+    允许交易的K线
+    参数:
+        bars: K线数组
+        trade_times: 允许交易的时刻列表，例如['10:00', '10:30', '11:00']，None表示每根K线都可以交易
+    返回:
+        布尔数组
+    """
+    if trade_times is None:
+        return np.ones(len(bars), dtype=bool)
+    minutes = [int(t[:2]) * 60 + int(t[3:5]) for t in trade_times]
+    return np.isin(bars['minute'], minutes)
+
+
+def simple_bands(bars, width=0.005):
+    """
+    固定宽度的噪声区间: 上沿 = max(今开, 昨收) * (1 + width)，下沿 = min(今开, 昨收) * (1 - width)
+    论文中按时刻变化的宽度见 噪声区间特征.py
+    返回:
+        (upper, lower)
+    """
+    session = bars['session']
+    first = np.ones(len(bars), dtype=bool)
+    first[1:] = session[1:] != session[:-1]
+    starts = np.flatnonzero(first)
+    day = np.cumsum(first) - 1
+    day_open = bars['open'][starts]
+    prev_close = np.full(len(starts), np.nan)
+    prev_close[1:] = bars['close'][starts[1:] - 1]
+    top = np.fmax(day_open, prev_close)[day]
+    bottom = np.fmin(day_open, prev_close)[day]
+    return top * (1 + width), bottom * (1 - width)
+
+
+@njit(cache=True)
+def _run(decision, last, close, upper, lower, stop_long, stop_short, allow_short, flatten,
+         position, fill_bar, fill_side, fill_price, fill_reason):
+    pos = 0
+    nf = 0
+    for i in range(len(close)):
+        price = close[i]
+        if decision[i]:
+            # 先检查止损
+            if pos == 1 and price < stop_long[i]:
+                fill_bar[nf] = i
+                fill_side[nf] = -1
+                fill_price[nf] = price
+                fill_reason[nf] = 1
+                nf += 1
+                pos = 0
+            elif pos == -1 and price > stop_short[i]:
+                fill_bar[nf] = i
+                fill_side[nf] = 1
+                fill_price[nf] = price
+                fill_reason[nf] = 1
+                nf += 1
+                pos = 0
+            # 空仓时检查是否突破噪声区间
+            if pos == 0:
+                if price > upper[i]:
+                    pos = 1
+                elif allow_short and price < lower[i]:
+                    pos = -1
+                if pos != 0:
+                    fill_bar[nf] = i
+                    fill_side[nf] = pos
+                    fill_price[nf] = price
+                    fill_reason[nf] = 0
+                    nf += 1
+        # 收盘平仓
+        if flatten and last[i] and pos != 0:
+            fill_bar[nf] = i
+            fill_side[nf] = -pos
+            fill_price[nf] = price
+            fill_reason[nf] = 2
+            nf += 1
+            pos = 0
+        position[i] = pos
+    return nf
+
+
+def simulate(bars, upper, lower, stop_long=None, stop_short=None, trade_times=None,
+             allow_short=True, flatten_at_close=True):
+    """
+    逐K线模拟日内突破策略
+    参数:
+        bars: K线数组(BAR_DTYPE)
+        upper: 每根K线的噪声区间上沿，收盘价突破则做多
+        lower: 每根K线的噪声区间下沿，收盘价跌破则做空
+        stop_long: 多头止损线，收盘价低于它则平仓，默认用upper
+        stop_short: 空头止损线，收盘价高于它则平仓，默认用lower
+        trade_times: 允许交易的时刻列表，None表示每根K线
+        allow_short: 是否允许做空
+        flatten_at_close: 是否在每个交易日最后一根K线平仓
+    返回:
+        dict:
+        position: 每根K线收盘后的持仓(1/0/-1)
+        strategy_return: 每根K线的策略收益率(上一根K线的持仓 × 本根K线的涨跌幅)
+        fills: 成交记录DataFrame
+    """
+    n = len(bars)
+    close = np.ascontiguousarray(bars['close'])
+    upper = np.asarray(upper, dtype=np.float64)
+    lower = np.asarray(lower, dtype=np.float64)
+    stop_long = upper if stop_long is None else np.asarray(stop_long, dtype=np.float64)
+    stop_short = lower if stop_short is None else np.asarray(stop_short, dtype=np.float64)
+    decision = decision_mask(bars, trade_times)
+    last = session_last_bar(bars)
+
+    # 成交次数的上限: 每个交易时刻最多一次止损加一次开仓，每天最多一次收盘平仓
+    capacity = 2 * int(decision.sum()) + int(last.sum())
+    position = np.zeros(n, dtype=np.int8)
+    fill_bar = np.empty(capacity, dtype=np.int32)
+    fill_side = np.empty(capacity, dtype=np.int8)
+    fill_price = np.empty(capacity, dtype=np.float64)
+    fill_reason = np.empty(capacity, dtype=np.int8)
+    nf = _run(decision, last, close, upper, lower, stop_long, stop_short, allow_short,
+              flatten_at_close, position, fill_bar, fill_side, fill_price, fill_reason)
+
+    fills = np.empty(nf, dtype=FILL_DTYPE)
+    fills['bar'] = fill_bar[:nf]
+    fills['side'] = fill_side[:nf]
+    fills['qty'] = 1.0
+    fills['price'] = fill_price[:nf]
+    fills['reason'] = fill_reason[:nf]
+    fills = pd.DataFrame(fills)
+    fills['time'] = pd.to_datetime(bars['ts'][fills['bar'].to_numpy()])
+    fills['reason'] = fills['reason'].map(REASONS)
+
+    ret = np.zeros(n)
+    ret[1:] = close[1:] / close[:-1] - 1
+    strategy_return = np.zeros(n)
+    strategy_return[1:] = position[:-1] * ret[1:]
+    return {'position': position, 'strategy_return': strategy_return, 'fills': fills}
+
+
+def main():
+    import time
+    from 黄金etf高频动量策略 import get_high_frequency_data
+    from 噪声区间特征 import noise_area_features, stop_lines
+
+    df = get_high_frequency_data(symbol='518880', freq='5min')
+    bars = bars_from_frame(df)
+    # 噪声区间按过去14天同一时刻的平均波动计算，止损线为区间边界和VWAP中更紧的一个
+    features = noise_area_features(bars, lookback=14)
+    stop_long, stop_short = stop_lines(features)
+    # 每半小时决策一次
+    trade_times = ['10:00', '10:30', '11:00', '11:30', '13:30', '14:00', '14:30']
+    t = time.perf_counter()
+    result = simulate(bars, features['upper'], features['lower'], stop_long, stop_short,
+                      trade_times=trade_times)
+    elapsed = time.perf_counter() - t
+    nav = np.cumprod(1 + result['strategy_return'])
+    print(f"处理 {len(bars)} 根K线，耗时 {elapsed * 1000:.1f} 毫秒，{len(bars) / elapsed:,.0f} 根/秒")
+    print(f"成交 {len(result['fills'])} 笔，策略总收益率: {nav[-1] - 1:.2%}")
+    print(result['fills'].tail())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+# 论文：使用基于树的分类器预测黄金和白银价格方向
+# 用滞后的技术指标预测次日涨跌，随机森林和梯度提升树按时间序列交叉验证(每折只用之前的数据训练)，
+# 各个(模型, 折)在多个进程里并行训练，输出样本外准确率和按预测方向持仓的策略收益
+#
+# 特征矩阵按 数据版本+特征参数 缓存为Parquet，同一份行情上重复实验(换模型、换超参数)直接读取；
+# 交叉验证的折只由样本数和折数决定，进程内缓存，不同模型共用同一组折
+#
+# 用法:
+#   df = get_bars('518880', '20130801', '20250808')
+#   dataset = load_dataset(df.set_index('date'), symbol='518880')
+#   predictions, summary = cross_validate(dataset, n_splits=5)
+
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import TimeSeriesSplit
+
+# 指标库等公共模块在上一级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 指标库 import IndicatorSet, data_version
+from 数据源 import get_bars
+from 绩效指标 import print_summary, tear_sheet
+
+FEATURE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'A股ETF', '特征')
+
+# 默认的模型和超参数，每个模型只用一个线程，并行放在(模型, 折)这一层
+DEFAULT_MODELS = {
+    'random_forest': (RandomForestClassifier, {'n_estimators': 300, 'max_depth': 6, 'min_samples_leaf': 20,
+                                               'random_state': 0, 'n_jobs': 1}),
+    'gradient_boosting': (GradientBoostingClassifier, {'n_estimators': 200, 'max_depth': 3,
+                                                       'learning_rate': 0.05, 'subsample': 0.8,
+                                                       'random_state': 0}),
+}
+
+# 黄金和白银ETF: (代码, 数据源)
+SYMBOLS = {
+    '黄金ETF': ('518880', 'akshare'),
+    '白银LOF': ('161226', 'akshare'),
+    'GLD': ('GLD', 'yfinance'),
+    'SLV': ('SLV', 'yfinance'),
+}
+
+# 进程内缓存
+_FEATURES = {}
+_FOLDS = {}
+
+# 子进程中的训练数据，由_init_worker设置
+_data = None
+
+
+def build_features(df, lags=(1, 2, 3, 5, 10), windows=(5, 10, 20, 60)):
+    """
+    计算第t天收盘时已知的技术特征，以及第t+1天的涨跌标签
+    参数:
+        df: 以日期为索引，包含close列的DataFrame，有high/low/volume时增加对应特征
+        lags: 滞后收益率的阶数
+        windows: 动量、均线偏离、波动率的窗口
+    返回:
+        DataFrame，特征列之外还有target(次日上涨为1)和forward_return(次日收益率)，
+        去掉了特征未形成和最后一天(没有标签)的行
+    """
+    has_range = 'high' in df and 'low' in df
+
+    def column(name):
+        # 指标库按列名对齐计算，最高价、最低价和收盘价用同一个列名
+        return df[[name]].astype(np.float64).set_axis(['close'], axis=1)
+
+    close = column('close')
+    ind = IndicatorSet(close, column('high') if has_range else None, column('low') if has_range else None)
+    c = close['close']
+    ret = ind.returns()['close']
+    features = {}
+    for k in lags:
+        features[f'ret_lag{k}'] = ret.shift(k - 1)
+    for w in windows:
+        features[f'momentum_{w}'] = ind.momentum(w)['close']
+        features[f'sma_gap_{w}'] = c / ind.sma(w)['close'] - 1
+        features[f'volatility_{w}'] = ret.rolling(w).std()
+    macd = ind.macd()
+    features['macd_dif'] = macd['dif']['close'] / c
+    features['macd_hist'] = macd['macd']['close'] / c
+    features['rsi_14'] = ind.rsi(14)['close']
+    if has_range:
+        kdj = ind.kdj()
+        features['kdj_k'] = kdj['k']['close']
+        features['kdj_j'] = kdj['j']['close']
+        high, low = df['high'].astype(np.float64), df['low'].astype(np.float64)
+        features['range'] = (high - low) / c
+        features['close_location'] = (c - low) / (high - low)
+    if 'volume' in df:
+        volume = column('volume')
+        features['volume_ratio'] = volume['close'] / IndicatorSet(volume).sma(20)['close'] - 1
+
+    out = pd.DataFrame(features, index=df.index)
+    out['forward_return'] = ret.shift(-1)
+    out['target'] = (out['forward_return'] > 0).astype(np.int8)
+    return out.replace([np.inf, -np.inf], np.nan).dropna()
+
+
+def load_dataset(df, symbol='', lags=(1, 2, 3, 5, 10), windows=(5, 10, 20, 60), cache_dir=FEATURE_DIR):
+    """
+    读取或计算特征矩阵，先查进程内缓存，再查磁盘缓存
+    参数:
+        df: 以日期为索引的日线数据
+        symbol: 代码，只用于缓存文件名
+        cache_dir: 磁盘缓存目录，None表示只缓存在内存里
+    返回:
+        build_features的结果
+    """
+    columns = [col for col in ('close', 'high', 'low', 'volume') if col in df]
+    text = f'{data_version(df[columns])}|{tuple(lags)}|{tuple(windows)}'
+    digest = hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+    if digest in _FEATURES:
+        return _FEATURES[digest]
+    path = None if cache_dir is None else os.path.join(cache_dir, f'{symbol}_{digest}.parquet')
+    if path is not None and os.path.exists(path):
+        dataset = pd.read_parquet(path)
+    else:
+        dataset = build_features(df, lags, windows)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            dataset.to_parquet(path + '.tmp')
+            os.replace(path + '.tmp', path)
+    _FEATURES[digest] = dataset
+    return dataset
+
+
+def time_series_folds(n_samples, n_splits=5, gap=1):
+    """
+    时间序列交叉验证的折，每折用之前的全部样本训练，训练集和测试集之间隔开gap个样本
+    返回:
+        [(train_index, test_index), ...]
+    """
+    key = (n_samples, n_splits, gap)
+    if key not in _FOLDS:
+        _FOLDS[key] = list(TimeSeriesSplit(n_splits=n_splits, gap=gap).split(np.empty((n_samples, 1))))
+    return _FOLDS[key]
+
+
+def _init_worker(x, y, folds):
+    # 训练数据和折每个子进程只传一次，之后的任务只传模型名、超参数和折的编号
+    global _data
+    _data = (x, y, folds)
+
+
+def _fit_fold(model, params, fold, data=None):
+    """
+    训练一折并预测测试集
+    返回:
+        测试集上涨的概率
+    """
+    x, y, folds = _data if data is None else data
+    train, test = folds[fold]
+    cls, defaults = DEFAULT_MODELS[model]
+    estimator = cls(**{**defaults, **(params or {})})
+    estimator.fit(x[train], y[train])
+    return estimator.predict_proba(x[test])[:, 1]
+
+
+def cross_validate(dataset, models=None, n_splits=5, gap=1, max_workers=None, threshold=0.5,
+                   short=False, periods=252):
+    """
+    时间序列交叉验证
+    参数:
+        dataset: load_dataset的返回值
+        models: {模型名: 超参数}，模型名为DEFAULT_MODELS中的键，默认全部模型使用默认参数
+        n_splits: 折数
+        gap: 训练集和测试集之间隔开的样本数
+        max_workers: 进程数，默认CPU核数；为1时在当前进程中训练
+        threshold: 上涨概率超过这个值时持有
+        short: 预测下跌时是否做空，A股ETF不能做空
+        periods: 年化周期数
+    返回:
+        (predictions, summary):
+        predictions: 测试集上每天每个模型的上涨概率、信号和策略收益
+        summary: 每个模型一行，样本外的准确率、AUC、上涨日占比和策略绩效，最后一行为买入持有
+    """
+    models = models or {name: {} for name in DEFAULT_MODELS}
+    feature_columns = [col for col in dataset.columns if col not in ('target', 'forward_return')]
+    x = dataset[feature_columns].to_numpy(dtype=np.float64)
+    y = dataset['target'].to_numpy()
+    folds = time_series_folds(len(dataset), n_splits, gap)
+    tasks = [(model, params, fold) for model, params in models.items() for fold in range(len(folds))]
+
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1:
+        outputs = [_fit_fold(*task, data=(x, y, folds)) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                 initargs=(x, y, folds)) as executor:
+            futures = [executor.submit(_fit_fold, *task) for task in tasks]
+            outputs = [future.result() for future in futures]
+
+    # 所有折的测试集拼起来就是完整的样本外区间
+    test_rows = np.concatenate([test for _, test in folds])
+    predictions = dataset.iloc[test_rows][['target', 'forward_return']].copy()
+    returns = {}
+    stats = {}
+    for i, model in enumerate(models):
+        proba = np.concatenate(outputs[i * len(folds):(i + 1) * len(folds)])
+        signal = np.where(proba > threshold, 1.0, -1.0 if short else 0.0)
+        predictions[f'{model}_proba'] = proba
+        predictions[f'{model}_signal'] = signal
+        # 第t天收盘按预测建仓，赚第t+1天的收益，记在第t+1天
+        returns[model] = pd.Series(signal * predictions['forward_return'].to_numpy(), index=predictions.index)
+        stats[model] = {
+            'accuracy': accuracy_score(predictions['target'], proba > 0.5),
+            'auc': roc_auc_score(predictions['target'], proba),
+        }
+    returns['buy_and_hold'] = predictions['forward_return']
+    stats['buy_and_hold'] = {'accuracy': predictions['target'].mean(), 'auc': 0.5}
+
+    returns = pd.DataFrame(returns).shift(1)
+    performance = tear_sheet(returns, periods=periods)
+    summary = pd.DataFrame(stats).T.join(performance[['total_return', 'annual_return', 'sharpe',
+                                                      'max_drawdown', 'calmar', 'hit_rate']])
+    summary['up_rate'] = predictions['target'].mean()
+    for model in models:
+        predictions[f'{model}_return'] = returns[model]
+    return predictions, summary
+
+
+def main():
+    for name, (symbol, source) in SYMBOLS.items():
+        print(f"正在获取{name}({symbol})日线...")
+        try:
+            df = get_bars(symbol, '20130801', source=source).set_index('date')
+        except Exception as exc:
+            print(f"{name}获取失败: {exc}")
+            continue
+        dataset = load_dataset(df, symbol=symbol)
+        print(f"{name}: {len(dataset)} 个样本，{dataset.shape[1] - 2} 个特征")
+        predictions, summary = cross_validate(dataset, n_splits=5, short=source == 'yfinance')
+        print(summary[['accuracy', 'auc', 'up_rate']].round(4))
+        print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
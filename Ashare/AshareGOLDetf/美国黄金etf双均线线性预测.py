@@ -1,9 +1,14 @@
 # 用于数据处理
 import numpy as np
 import pandas as pd
-# 用于获取数据
+# 用于获取数据，统一数据源在上一级目录
 import os
-import yfinance as yf #国外的，要梯子
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 图表统一在最后生成，不会中途阻塞；没有图形界面时保存为图片，环境变量QUANT_REPORT=off时不画图
+from 报告 import Report
+report = Report('美国黄金ETF双均线', style='seaborn-v0_8-darkgrid')
+from 数据源 import get_bars #yfinance是国外的，要梯子
 # 设置代理，指定HTTP 请求的代理服务器
 proxy = 'http://127.0.0.1:10090' #本机的代理端口
 os.environ['HTTP_PROXY'] = proxy 
@@ -11,11 +16,6 @@ os.environ['HTTPS_PROXY'] = proxy
 
 # 导入线性回归模型
 from sklearn.linear_model import LinearRegression
-# 导入画图库、设置主题和中文显示
-import matplotlib.pyplot as plt
-plt.style.use('seaborn-v0_8-darkgrid')
-plt.rcParams['font.sans-serif'] = ['SimHei'] # 中文显示
-plt.rcParams['axes.unicode_minus'] = False   # 负数显示
 # 设置忽略警告
 import warnings
 warnings.filterwarnings('ignore')
@@ -23,8 +23,9 @@ from datetime import datetime
 
 
 
-# 获取黄金ETF的历史行情数据
-etf_data = yf.download('GLD', start='2013-08-01', end='2025-08-08')
+# 获取黄金ETF的历史行情数据，第二次运行直接读磁盘缓存
+etf_data = get_bars('GLD', '20130801', '20250807', source='yfinance').set_index('date')
+etf_data = etf_data.rename(columns={'close': 'Close'})
 # 只需要收盘价序列
 Df = etf_data[['Close']]
 # 将Index设置为datetime格式的日期
@@ -32,10 +33,7 @@ Df = etf_data[['Close']]
 # 去除空值
 Df = Df.dropna()
 # 画出黄金ETF的价格走势图
-Df.Close.plot(figsize=(15, 8), color='red')
-plt.ylabel('黄金ETF价格')
-plt.title('黄金ETF价格序列')
-plt.show()
+report.line('黄金ETF价格序列', Df[['Close']], ylabel='黄金ETF价格', colors=['red'], legend=False)
 # 查看Df的数据形式
 print(Df)
 
@@ -75,11 +73,8 @@ print('黄金ETF价格(y) = %.2f * 55日移动平均线(x1) \
  # 预测黄金ETF第二日的价格
 predicted_price = linear.predict(X_test)
 predicted_price = pd.DataFrame(predicted_price, index=y_test.index, columns=['price'])
-predicted_price.plot(figsize=(15, 8))
-y_test.plot()
-plt.legend(['预测的价格', '实际的价格'])
-plt.ylabel('黄金ETF的价格')
-plt.show()
+report.line('预测价格和实际价格', pd.DataFrame({'预测的价格': predicted_price['price'], '实际的价格': y_test}),
+            title='', ylabel='黄金ETF的价格')
 
 # 决定系数R2
 r2_train = linear.score(X_train, y_train)
@@ -101,25 +96,35 @@ gold['strategy_returns'] = gold['signal'].shift(1) * gold['gold_returns']
 gold['strategy_nv'] = (gold['strategy_returns'] + 1).cumprod()
 gold['bmk_nv'] = (gold['gold_returns'] + 1).cumprod()
 # 绘制净值曲线图
-gold[['strategy_nv','bmk_nv']].plot(figsize=(15, 8), color=['SteelBlue', 'Yellow'],
-                                    title='黄金ETF价格择时策略净值曲线图')
-plt.legend(['策略净值', '基准净值'])
-plt.ylabel('净值')
-plt.show()
-
-# 计算夏普率
-strategy_sharpe = gold['strategy_returns'].mean() / gold['strategy_returns'].std() * (252**0.5)
-bmk_sharpe = gold['gold_returns'].mean() / gold['gold_returns'].std() * (252**0.5)
-print('策略夏普率: %.2f' %strategy_sharpe)
-print('基准夏普率: %.2f' %bmk_sharpe)
+report.line('黄金ETF价格择时策略净值曲线图', gold[['strategy_nv','bmk_nv']], colors=['SteelBlue', 'Yellow'],
+            legend=['策略净值', '基准净值'], ylabel='净值')
+
+# 计算夏普率、最大回撤、卡玛比率、胜率等指标
+from 绩效指标 import print_summary, tear_sheet
+stats = tear_sheet(gold[['strategy_returns', 'gold_returns']].rename(
+    columns={'strategy_returns': '策略', 'gold_returns': '基准'}))
+print_summary(stats)
+
+# 滚动训练模式：每个交易日只用当时已知的数据重新拟合模型，得到真正样本外的预测、信号和决定系数
+# refit_every可以改成21(每月重新拟合)，window=None为扩展窗口，也可以改成固定长度的滚动窗口
+from 双均线滚动预测 import build_features, walk_forward_fit, walk_forward_strategy, out_of_sample_r2
+wf = walk_forward_fit(build_features(etf_data['Close'], fast=55, slow=60),
+                      min_train=250, refit_every=1, window=None)
+wf_gold = walk_forward_strategy(wf)
+print('滚动训练样本外决定系数:')
+print(out_of_sample_r2(wf, freq='YE'))
+wf_stats = tear_sheet(wf_gold[['strategy_returns']].rename(columns={'strategy_returns': '滚动训练策略'}))
+print_summary(wf_stats)
+report.line('黄金ETF滚动训练择时策略净值曲线图', wf_gold[['strategy_nv','bmk_nv']], colors=['SteelBlue', 'Yellow'],
+            legend=['策略净值', '基准净值'], ylabel='净值')
 
 #当你确认这个模型可用之后，以后日常就是每天来看一下明天的预测值是多少，对应的交易操作是什么。
 # 当前日期
 current_date = datetime.now().strftime('%Y%m%d')
-# 获取数据
-etf_data = ak.fund_etf_hist_em(symbol='518880', period='daily', start_date='20230101', end_date=current_date)
-data = etf_data[['收盘']].rename(columns={'收盘':'Close'})
-data.index = pd.to_datetime(etf_data['日期']).tolist()
+# 获取数据(akshare，原来这里用了ak却没有导入)
+etf_data = get_bars('518880', '20230101', current_date, source='akshare')
+data = etf_data[['close']].rename(columns={'close':'Close'})
+data.index = etf_data['date'].tolist()
 # 计算均线因子
 data['S1'] = data['Close'].rolling(window=55).mean()
 data['S2'] = data['Close'].rolling(window=60).mean()
@@ -129,3 +134,6 @@ data['predicted_gold_price'] = linear.predict(data[['S1', 'S2']])
 data['signal'] = np.where(data.predicted_gold_price.shift(1) < data.predicted_gold_price, '买入' , '空仓')
 # 输出预测值
 data.tail(1)[['signal','predicted_gold_price']].T
+
+# 所有计算完成后再生成图表
+report.finish()
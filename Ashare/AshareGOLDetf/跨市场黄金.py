@@ -0,0 +1,226 @@
+# 跨市场黄金：把A股黄金ETF(518880，akshare)和美股黄金ETF(GLD，yfinance)对齐成一张表，一次完成两个市场的比较研究
+# 两个市场的收盘时刻换算成UTC后做as-of连接: 518880在北京时间15:00收盘(UTC 07:00)，GLD在纽约16:00收盘(UTC 20:00/21:00)，
+# 所以A股第D天收盘时能看到的是美股第D-1天(遇到美股休市再往前)的收盘价，夏令时由时区换算自动处理；
+# 用两个市场的交易日历区分"休市"和"缺数据": us_stale为应该已经收盘、但表中没有的美股交易日数
+# 人民币价格按收盘时已知的最近一个美元兑人民币汇率(CNY=X)换算成美元
+#
+#   basis      = log(518880美元价格) - log(GLD)，两只ETF每份对应的黄金克数不同，只看它的变化
+#   premium    = basis - 过去window天basis的均值(不含当天)，即国内金价相对海外的溢价变化
+#   premium_z  = premium / 过去window天basis的标准差
+#
+# 用法:
+#   panel = build_panel(cn_bars, us_bars, fx_bars)          # 以A股交易日为索引
+#   table = lead_lag(panel, max_lag=5)                      # 滞后相关系数
+#   result = spread_strategy(panel, entry_z=2.0, exit_z=0.5)    # 溢价均值回复
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# 数据源等公共模块在上一级目录
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 数据源 import get_bars
+from 交易日历 import get_calendar
+from 绩效指标 import print_summary, tear_sheet
+from 报告 import Report
+
+# 市场: (时区, 收盘时刻, 交易日历)；汇率按UTC当天结束时才算已知，避免用到收盘之后的汇率
+MARKETS = {
+    'SSE': ('Asia/Shanghai', '15:00', 'SSE'),
+    'US': ('America/New_York', '16:00', 'US'),
+    'FX': ('UTC', '23:59', None),
+}
+
+# 代码: (数据源, 市场)
+SYMBOLS = {
+    '518880': ('akshare', 'SSE'),
+    'GLD': ('yfinance', 'US'),
+    'CNY=X': ('yfinance', 'FX'),
+}
+
+
+def close_times(dates, market):
+    """
+    每个交易日收盘时刻的UTC时间(int64纳秒)
+    参数:
+        dates: 交易日(当地日期)
+        market: MARKETS中的键
+    """
+    tz, close, _ = MARKETS[market]
+    local = pd.DatetimeIndex(dates).normalize() + pd.Timedelta(f'{close}:00')
+    return local.tz_localize(tz, ambiguous='NaT', nonexistent='shift_forward').tz_convert('UTC') \
+        .tz_localize(None).as_unit('ns').asi8
+
+
+def asof_rows(left_dates, left_market, right_dates, right_market):
+    """
+    as-of连接的行号: 左边每个交易日收盘时，右边已经收盘的最近一个交易日
+    参数:
+        left_dates, right_dates: 升序的交易日
+    返回:
+        int64数组，右边的行号，没有时为-1
+    """
+    left = close_times(left_dates, left_market)
+    right = close_times(right_dates, right_market)
+    return np.searchsorted(right, left, side='right') - 1
+
+
+def _stale_days(left_dates, left_market, right_dates, right_market, rows):
+    """
+    右边缺了多少个应该已经收盘的交易日: 用右边市场的交易日历找出左边收盘时最近已收盘的交易日，
+    和实际连接到的交易日之间隔了几个交易日；休市不算缺失
+    """
+    calendar_name = MARKETS[right_market][2]
+    if calendar_name is None:
+        return np.zeros(len(rows), dtype=np.int32)
+    calendar = get_calendar(calendar_name)
+    # 左边收盘时刻在右边时区的日期，这一天如果还没收盘就往前一个交易日
+    left_utc = pd.DatetimeIndex(close_times(left_dates, left_market)).tz_localize('UTC')
+    local_day = left_utc.tz_convert(MARKETS[right_market][0]).tz_localize(None).normalize()
+    expected = calendar.ordinals(local_day)
+    not_closed = close_times(calendar.dates[np.maximum(expected, 0)], right_market) > left_utc.asi8
+    expected = expected - not_closed
+    matched = calendar.ordinals(np.asarray(right_dates)[np.maximum(rows, 0)], 'exact')
+    stale = np.where((rows >= 0) & (matched >= 0), expected - matched, -1)
+    return stale.astype(np.int32)
+
+
+def _closes(bars):
+    """get_bars返回的日线 -> (交易日, 收盘价)，按日期排序"""
+    bars = bars.dropna(subset=['close']).sort_values('date')
+    return pd.DatetimeIndex(bars['date']).normalize(), bars['close'].to_numpy(dtype=np.float64)
+
+
+def build_panel(cn_bars, us_bars, fx_bars=None, window=60, cn_market='SSE', us_market='US'):
+    """
+    以A股交易日为索引的跨市场对齐表
+    参数:
+        cn_bars: 518880日线(get_bars的结果，包含date、close)
+        us_bars: GLD日线
+        fx_bars: 美元兑人民币汇率日线(CNY=X)，None时不换算(basis里多一个汇率项)
+        window: 溢价均值和标准差的窗口
+    返回:
+        DataFrame，列为:
+        cn_close(人民币)、cn_usd(美元)、us_close、us_date(连接到的美股交易日)、us_stale、fx、fx_date、
+        cn_return、cn_usd_return、us_return(两次A股收盘之间GLD的收益)、basis、premium、premium_z
+    """
+    cn_dates, cn_close = _closes(cn_bars)
+    us_dates, us_close = _closes(us_bars)
+    rows = asof_rows(cn_dates, cn_market, us_dates, us_market)
+    valid = rows >= 0
+    panel = pd.DataFrame({'cn_close': cn_close}, index=pd.DatetimeIndex(cn_dates, name='date'))
+    panel['us_close'] = np.where(valid, us_close[np.maximum(rows, 0)], np.nan)
+    panel['us_date'] = np.where(valid, us_dates.to_numpy()[np.maximum(rows, 0)], np.datetime64('NaT'))
+    panel['us_stale'] = _stale_days(cn_dates, cn_market, us_dates, us_market, rows)
+
+    if fx_bars is not None:
+        fx_dates, fx_close = _closes(fx_bars)
+        fx_rows = asof_rows(cn_dates, cn_market, fx_dates, 'FX')
+        fx_valid = fx_rows >= 0
+        panel['fx'] = np.where(fx_valid, fx_close[np.maximum(fx_rows, 0)], np.nan)
+        panel['fx_date'] = np.where(fx_valid, fx_dates.to_numpy()[np.maximum(fx_rows, 0)], np.datetime64('NaT'))
+    else:
+        panel['fx'] = 1.0
+    panel['cn_usd'] = panel['cn_close'] / panel['fx']
+
+    panel['cn_return'] = panel['cn_close'].pct_change(fill_method=None)
+    panel['cn_usd_return'] = panel['cn_usd'].pct_change(fill_method=None)
+    panel['us_return'] = panel['us_close'].pct_change(fill_method=None)
+    panel['basis'] = np.log(panel['cn_usd']) - np.log(panel['us_close'])
+    past = panel['basis'].shift(1).rolling(window, min_periods=window // 2)
+    panel['premium'] = panel['basis'] - past.mean()
+    panel['premium_z'] = panel['premium'] / past.std()
+    return panel
+
+
+def lead_lag(panel, max_lag=5, x='us_return', y='cn_usd_return'):
+    """
+    滞后相关系数: corr(y[t], x[t-k])，k>0表示x领先y
+    所有滞后阶数在一个 T×(2*max_lag+1) 的滑动窗口视图上一次算完
+    参数:
+        panel: build_panel的结果
+        max_lag: 最大滞后阶数
+    返回:
+        以lag为索引的DataFrame，列为corr、beta(y对x的回归系数)、hit_rate(符号相同的比例)、n
+    """
+    xv = panel[x].to_numpy(dtype=np.float64)
+    yv = panel[y].to_numpy(dtype=np.float64)
+    T = len(xv)
+    padded = np.concatenate([np.full(max_lag, np.nan), xv, np.full(max_lag, np.nan)])
+    # 窗口第t行第j列是x[t + j - max_lag]，反转列之后第j列就是x[t - (j - max_lag)]，即滞后k = j - max_lag
+    lagged = sliding_window_view(padded, 2 * max_lag + 1)[:T][:, ::-1]
+    yy = np.broadcast_to(yv[:, None], lagged.shape)
+    mask = ~np.isnan(lagged) & ~np.isnan(yy)
+    n = mask.sum(axis=0)
+    xs = np.where(mask, lagged, 0.0)
+    ys = np.where(mask, yy, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mx, my = xs.sum(axis=0) / n, ys.sum(axis=0) / n
+        cov = (xs * ys).sum(axis=0) / n - mx * my
+        vx = (xs * xs).sum(axis=0) / n - mx * mx
+        vy = (ys * ys).sum(axis=0) / n - my * my
+        corr = cov / np.sqrt(vx * vy)
+        beta = cov / vx
+        moved = mask & (xs != 0) & (ys != 0)
+        hit_rate = ((np.sign(xs) == np.sign(ys)) & moved).sum(axis=0) / moved.sum(axis=0)
+    return pd.DataFrame({'corr': corr, 'beta': beta, 'hit_rate': hit_rate, 'n': n},
+                        index=pd.Index(np.arange(-max_lag, max_lag + 1), name='lag'))
+
+
+def spread_strategy(panel, entry_z=2.0, exit_z=0.5, short=False):
+    """
+    溢价均值回复: 国内溢价显著为负(premium_z < -entry_z)时持有518880，回到-exit_z以上时平仓；
+    short=True时溢价显著为正(premium_z > entry_z)也做空，回到exit_z以下时平仓(A股ETF普通账户不能做空，只作研究)
+    多头和空头的持仓状态分别用前向填充延续，没有逐日循环；信号滞后一天，第t天收盘决定、第t+1天持有
+    返回:
+        DataFrame，列为signal、strategy_return、benchmark_return
+    """
+    z = panel['premium_z']
+    # premium_z缺失的日期(窗口未形成)空仓
+    long = pd.Series(np.nan, index=panel.index)
+    long[(z > -exit_z) | z.isna()] = 0.0
+    long[z < -entry_z] = 1.0
+    state = long.ffill().fillna(0.0)
+    if short:
+        # 做空条件z > entry_z同时满足多头的平仓条件，两者不会同时持有
+        shorts = pd.Series(np.nan, index=panel.index)
+        shorts[(z < exit_z) | z.isna()] = 0.0
+        shorts[z > entry_z] = -1.0
+        state = state + shorts.ffill().fillna(0.0)
+    signal = state.shift(1).fillna(0.0)
+    return pd.DataFrame({
+        'signal': signal,
+        'strategy_return': signal * panel['cn_return'],
+        'benchmark_return': panel['cn_return'],
+    })
+
+
+def main(start_date='20130801'):
+    bars = {}
+    for symbol, (source, _) in SYMBOLS.items():
+        print(f"正在获取{symbol}日线...")
+        bars[symbol] = get_bars(symbol, start_date, source=source)
+    panel = build_panel(bars['518880'], bars['GLD'], bars['CNY=X'])
+    print(f"对齐后 {len(panel)} 个A股交易日，美股数据缺失 {(panel['us_stale'] > 0).sum()} 天")
+
+    # 两个市场(统一按美元计)和溢价策略的绩效一次输出
+    returns = pd.DataFrame({'518880(美元)': panel['cn_usd_return'], 'GLD': panel['us_return']})
+    strategy = spread_strategy(panel)
+    returns['溢价回复策略'] = strategy['strategy_return']
+    print_summary(tear_sheet(returns))
+    print("美股收益领先A股的滞后相关系数:")
+    print(lead_lag(panel).round(4))
+    print(panel[['basis', 'premium', 'premium_z']].describe().round(4))
+
+    report = Report('跨市场黄金')
+    report.line('溢价', panel[['premium']], legend=False, ylabel='对数溢价', title='518880相对GLD的溢价(去均值)')
+    report.line('净值', (1 + returns.fillna(0)).cumprod(), ylabel='净值', title='518880、GLD和溢价回复策略净值')
+    report.finish()
+    return panel
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,25 @@
 # 黄金ETF日频动量策略
 # 论文：An Effective Intraday Momentum Strategy for SP500
 
-import akshare as ak
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
-
-# 设置中文显示
-plt.rcParams["font.family"] = ["SimHei", "WenQuanYi Micro Hei", "Heiti TC"]
-plt.rcParams["axes.unicode_minus"] = False  # 解决负号显示问题
+# 本地行情库在上一级目录
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 本地行情库 import LocalStore
+from 向量化回测 import momentum_backtest
+from 数据源 import daily_fetcher
+from 绩效指标 import print_summary, tear_sheet
+from 交易成本 import CostModel
+from 交易日历 import parse_dates
+# 图表由报告模块统一生成(中文字体也在那里设置)
+from 报告 import Report, get_mode
+# 环境变量QUANT_PROFILE=1时记录各阶段的耗时和行数，关闭时几乎没有开销
+from 性能剖析 import profiled
 
 # 1. 获取黄金ETF日频数据
+@profiled(symbol_arg='symbol')
 def get_daily_data(symbol='518880', start_date=None, end_date=None):
     """
     使用akshare获取黄金ETF的日频数据
@@ -22,7 +30,8 @@ def get_daily_data(symbol='518880', start_date=None, end_date=None):
     返回:
         日频数据DataFrame
     """
-    # 检查akshare版本
+    # 检查akshare版本，只在真正获取数据时导入，策略函数可以离线使用
+    import akshare as ak
     print(f"akshare版本: {ak.__version__}")
     
     # 如果未指定日期，默认获取最近1年数据
@@ -33,9 +42,9 @@ def get_daily_data(symbol='518880', start_date=None, end_date=None):
         
     print(f"尝试获取{start_date}至{end_date}的日频数据...")
     
-    # 使用akshare获取日频数据
+    # 通过统一数据源获取日频数据，本地行情库只请求本地没有的日期
     try:
-        df = ak.fund_etf_hist_em(symbol=symbol, period='daily', start_date=start_date, end_date=end_date)
+        df = LocalStore().get(symbol, daily_fetcher(), start_date, end_date)
         print("成功获取日频数据!")
     except Exception as e:
         print(f"获取日频数据失败: {str(e)[:100]}")
@@ -44,8 +53,9 @@ def get_daily_data(symbol='518880', start_date=None, end_date=None):
             df = ak.fund_etf_hist(symbol=symbol)
             # 转换日期并筛选
             if '净值日期' in df.columns:
-                df['date'] = pd.to_datetime(df['净值日期'])
-                df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
+                df['date'] = parse_dates(df['净值日期'])
+                # 区间两端也转换成日期再比较，不直接和'YYYYMMDD'字符串比较
+                df = df[(df['date'] >= pd.Timestamp(start_date)) & (df['date'] <= pd.Timestamp(end_date))]
             else:
                 raise Exception("数据中没有日期列")
         except Exception as e:
@@ -56,11 +66,14 @@ def get_daily_data(symbol='518880', start_date=None, end_date=None):
     print(f"数据列名: {df.columns.tolist()}")
     
     # 处理数据
-    if '日期' in df.columns:
-        df['date'] = pd.to_datetime(df['日期'])
+    if 'date' in df.columns:
+        # 本地行情库返回的数据已经是英文列名和datetime类型
+        df.set_index('date', inplace=True)
+    elif '日期' in df.columns:
+        df['date'] = parse_dates(df['日期'])
         df.set_index('date', inplace=True)
     elif '净值日期' in df.columns:
-        df['date'] = pd.to_datetime(df['净值日期'])
+        df['date'] = parse_dates(df['净值日期'])
         df.set_index('date', inplace=True)
     else:
         raise Exception("数据中没有日期列")
@@ -74,7 +87,13 @@ def get_daily_data(symbol='518880', start_date=None, end_date=None):
         '收盘': 'close',  # 增加可能的列名映射
         '单位净值': 'close',  # 考虑ETF可能使用净值
         '成交量': 'volume',
-        '成交额': 'volume'  # 增加成交额作为成交量的备选
+        '成交额': 'amount',  # 成交额用于估算冲击成本
+        'open': 'open',
+        'high': 'high',
+        'low': 'low',
+        'close': 'close',
+        'volume': 'volume',
+        'amount': 'amount'
     }
     
     # 寻找收盘价列
@@ -97,63 +116,51 @@ def get_daily_data(symbol='518880', start_date=None, end_date=None):
     return df
 
 # 2. 日频动量策略
-def daily_momentum_strategy(df, window=20):
+@profiled(rows_arg='df')
+def daily_momentum_strategy(df, window=20, cost_model=None):
     """
     实现日频动量策略
     参数:
-        df: 包含'close'列的DataFrame
+        df: 包含'close'列的DataFrame，有'amount'列时用于估算冲击成本
         window: 动量计算窗口大小
+        cost_model: 交易成本.CostModel，None表示不计交易成本
     返回:
-        包含策略信号的DataFrame
+        包含策略信号的DataFrame，计成本时signal为实际持仓、strategy_return已扣除成本，并增加cost列
     """
-    # 计算动量 (收益率)
-    df['momentum'] = df['close'].pct_change(periods=window)
-    
-    # 生成信号: 动量为正则买入(1)，否则卖出(0)
-    df['signal'] = np.where(df['momentum'] > 0, 1, 0)
-    
-    # 滞后信号以避免未来函数
-    df['signal'] = df['signal'].shift(1)
-    df['signal'].fillna(0, inplace=True)
-    
-    # 计算策略收益
-    df['strategy_return'] = df['signal'] * df['close'].pct_change()
-    df['cumulative_strategy'] = (1 + df['strategy_return']).cumprod()
-    df['cumulative_benchmark'] = (1 + df['close'].pct_change()).cumprod()
-    
-    return df
+    # 单列价格矩阵上的多标的回测: 动量为正则买入(1)，否则卖出(0)，信号已滞后一日
+    amount = df[['amount']] if 'amount' in df else None
+    result = momentum_backtest(df[['close']], window=window, cost_model=cost_model, amount=amount)
+    columns = ['momentum', 'signal', 'strategy_return', 'cumulative_strategy', 'cumulative_benchmark']
+    if cost_model is not None:
+        columns.append('cost')
+    return df.assign(**{col: result[col]['close'] for col in columns})
 
 # 3. 策略评估
-def evaluate_strategy(df):
+@profiled(rows_arg='df')
+def evaluate_strategy(df, report=None):
     """
     评估策略性能
     参数:
         df: 包含策略信号和收益的DataFrame
+        report: 报告.Report，累计收益图登记到其中统一生成；None时立即保存到当前目录
+    返回:
+        策略和基准的绩效指标表，见 绩效指标.tear_sheet
     """
-    # 计算总收益率
-    total_strategy_return = (df['cumulative_strategy'].iloc[-1] - 1) * 100
-    total_benchmark_return = (df['cumulative_benchmark'].iloc[-1] - 1) * 100
-    
-    # 计算夏普率 (假设无风险利率为0)
-    daily_strategy_return = df['strategy_return'].dropna()
-    sharpe_ratio = np.sqrt(252) * daily_strategy_return.mean() / daily_strategy_return.std()
-    
-    print(f"策略总收益率: {total_strategy_return:.2f}%")
-    print(f"基准总收益率: {total_benchmark_return:.2f}%")
-    print(f"夏普率: {sharpe_ratio:.2f}")
+    # 策略和基准的收益、夏普率(假设无风险利率为0)、回撤等指标一次算完
+    returns = pd.DataFrame({'策略': df['strategy_return'], '基准': df['close'].pct_change()})
+    positions = pd.DataFrame({'策略': df['signal'], '基准': 1.0}, index=df.index)
+    stats = tear_sheet(returns, periods=252, positions=positions)
+    print_summary(stats)
     
     # 绘制累计收益曲线
-    plt.figure(figsize=(12, 6))
-    plt.plot(df['cumulative_strategy'], label='策略累计收益')
-    plt.plot(df['cumulative_benchmark'], label='基准累计收益')
-    plt.title('黄金ETF日频动量策略表现')
-    plt.xlabel('日期')
-    plt.ylabel('累计收益')
-    plt.legend()
-    plt.grid(True)
-    plt.savefig('黄金ETF日频动量策略表现.png')
-    plt.close()
-    print("策略表现图已保存为'黄金ETF日频动量策略表现.png'")
+    own = report is None
+    if own:
+        report = Report(out_dir=os.getcwd(), mode='off' if get_mode() == 'off' else 'save')
+    report.line('黄金ETF日频动量策略表现', df[['cumulative_strategy', 'cumulative_benchmark']],
+                legend=['策略累计收益', '基准累计收益'], xlabel='日期', ylabel='累计收益', grid=True, figsize=(12, 6))
+    if own and report.finish():
+        print("策略表现图已保存为'黄金ETF日频动量策略表现.png'")
+    return stats
 
 # 4. 主函数
 def main():
@@ -166,15 +173,17 @@ def main():
     if len(df) > 0:
         # 应用策略
         print("正在应用日频动量策略...")
-        df = daily_momentum_strategy(df, window=20)
+        # 黄金ETF为T+0，按佣金、价差和冲击成本扣费
+        df = daily_momentum_strategy(df, window=20, cost_model=CostModel.gold_etf())
         
         # 评估策略
         print("正在评估策略性能...")
         evaluate_strategy(df)
         
         # 输出最新信号
+        # 计成本时signal是整手成交后的实际持仓(例如0.9996)，按是否持有判断
         latest_signal = df['signal'].iloc[-1]
-        signal_text = '买入' if latest_signal == 1 else '卖出'
+        signal_text = '买入' if latest_signal > 0 else '卖出'
         print(f"最新交易信号: {signal_text}")
     else:
         print("未获取到足够数据，无法运行策略")
@@ -2,33 +2,37 @@
 # 用于数据处理
 import numpy as np
 import pandas as pd
-# 用于获取高频数据
-import akshare as ak
-# 用于可视化
-import matplotlib.pyplot as plt
-# 设置中文显示
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
+# 用于获取高频数据，统一数据源在上一级目录
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from 数据源 import get_bars
+from 重采样 import get_finest_bars, resample_bars
+from 绩效指标 import print_summary, tear_sheet
+from 交易成本 import CostModel
+# 用于可视化，图表由报告模块统一生成(中文字体也在那里设置)
+from 报告 import Report
+# 环境变量QUANT_PROFILE=1时记录各阶段的耗时和行数，关闭时几乎没有开销
+from 性能剖析 import profiled
 # 忽略警告
 import warnings
 warnings.filterwarnings('ignore')
 from datetime import datetime, timedelta
 
 # 1. 获取黄金ETF高频数据 好像不能下载高频数据，暂时搁置这个方法，还是继续日频。
+@profiled(symbol_arg='symbol')
 def get_high_frequency_data(symbol='518880', start_date=None, end_date=None, freq='60min'):
     """
-    使用akshare获取黄金ETF的高频数据
+    通过统一数据源(默认akshare)获取黄金ETF的高频数据: 只下载最细的分钟线，目标频率在本地聚合，
+    换频率研究时不需要重新下载，重复请求同一区间直接读磁盘缓存
     参数:
         symbol: ETF代码，默认518880(华安黄金ETF)
         start_date: 开始日期，格式'YYYYMMDD'
         end_date: 结束日期，格式'YYYYMMDD'
-        freq: 频率，可选'5min', '15min', '30min', '60min' (1min可能不支持)
+        freq: 频率，可选'5min', '15min', '30min', '60min'
     返回:
-        高频数据DataFrame
+        以datetime为索引的高频数据DataFrame，列为open、high、low、close、volume，数据源有成交额时还有amount
     """
-    # 检查akshare版本
-    print(f"akshare版本: {ak.__version__}")
-    
     # 验证频率参数
     supported_freqs = ['5min', '15min', '30min', '60min']
     if freq not in supported_freqs:
@@ -43,77 +47,35 @@ def get_high_frequency_data(symbol='518880', start_date=None, end_date=None, fre
         
     print(f"尝试获取{start_date}至{end_date}的{freq}数据...")
     
-    # 使用akshare获取高频数据
-    # 根据akshare 1.17.31版本调整接口
     try:
-        # 尝试方法1: 使用fund_etf_hist_em获取数据 (支持的频率)
-        print(f"方法1: 使用fund_etf_hist_em获取{freq}数据...")
-        df = ak.fund_etf_hist_em(symbol=symbol, period=freq, start_date=start_date, end_date=end_date)
-        print("成功获取高频数据!")
+        bars, base = get_finest_bars(symbol, start_date, end_date)
+        df = bars if base == freq else resample_bars(bars, freq)
+        print(f"成功获取高频数据! 由{base}线聚合为{freq}线")
     except Exception as e:
-        print(f"fund_etf_hist_em失败: {str(e)[:100]}")
-        try:
-            # 尝试方法2: 不指定start_date和end_date，获取所有可用数据后再筛选
-            print(f"方法2: 使用fund_etf_hist_em获取所有{freq}数据后筛选...")
-            df = ak.fund_etf_hist_em(symbol=symbol, period=freq)
-            # 转换日期并筛选
-            if '日期' in df.columns:
-                df['date'] = pd.to_datetime(df['日期'])
-                df = df[(df['date'] >= start_date) & (df['date'] <= end_date)]
-            else:
-                raise Exception("数据中没有日期列")
-        except Exception as e:
-            print(f"方法2失败: {str(e)[:100]}")
-            # 如果所有高频接口都失败，尝试获取日线数据作为备选
-            print(" fallback到日线数据...")
-            df = ak.fund_etf_hist_em(symbol=symbol, period='daily', start_date=start_date, end_date=end_date)
-            df['date'] = pd.to_datetime(df['日期'])
-            df.set_index('date', inplace=True)
-            df.rename(columns={'收盘': 'close'}, inplace=True)
-            return df
-    
-    # 处理成功获取的高频数据
-    # 转换时间格式
-    if '日期' in df.columns and '时间' in df.columns:
-        df['datetime'] = pd.to_datetime(df['日期'] + ' ' + df['时间'])
-    elif 'datetime' not in df.columns:
-        df['datetime'] = pd.to_datetime(df.index)
-    
-    df.set_index('datetime', inplace=True)
-    
-    # 重命名列
-    column_mapping = {
-        '开盘价': 'open',
-        '最高价': 'high',
-        '最低价': 'low',
-        '收盘价': 'close',
-        '成交量': 'volume',
-        'open': 'open',
-        'high': 'high',
-        'low': 'low',
-        'close': 'close',
-        'volume': 'volume'
-    }
-    
-    # 只保留需要的列
-    valid_columns = [col for col in df.columns if col in column_mapping]
-    df = df[valid_columns]
-    df.rename(columns={col: column_mapping[col] for col in valid_columns}, inplace=True)
-    
-    # 移除重复索引
-    df = df[~df.index.duplicated(keep='last')]
-    
-    return df
+        print(f"获取分钟线失败: {str(e)[:200]}")
+        # 分钟线接口都失败时，获取日线数据作为备选
+        print(" fallback到日线数据...")
+        df = get_bars(symbol, start_date, end_date, freq='daily')
+    
+    # 统一数据源返回的数据已经是英文列名、datetime类型并且去过重
+    df = df.set_index('date').rename_axis('datetime')
+    # 数据源有成交额时保留，交易成本模型用它估算冲击成本
+    columns = ['open', 'high', 'low', 'close', 'volume']
+    if 'amount' in df and df['amount'].notna().any():
+        columns.append('amount')
+    return df[columns]
 
 # 2. 实现日内动量策略
-def intraday_momentum_strategy(df, window=30):
+@profiled(rows_arg='df')
+def intraday_momentum_strategy(df, window=30, cost_model=None):
     """
     基于论文《An Effective Intraday Momentum Strategy for SP500》实现的日内动量策略
     参数:
         df: 高频数据DataFrame
         window: 动量计算窗口
+        cost_model: 交易成本.CostModel，None表示不计交易成本
     返回:
-        带有交易信号的DataFrame
+        带有交易信号的DataFrame，计成本时signal为按交易规则实际成交后的持仓，并增加cost列
     """
     # 计算日内收益率
     df['return'] = df['close'].pct_change()
@@ -129,6 +91,12 @@ def intraday_momentum_strategy(df, window=30):
     
     # 计算策略收益率
     df['strategy_return'] = df['signal'] * df['return']
+    if cost_model is not None:
+        # 按交易规则成交(A股不能做空、整手、涨跌停)，收益扣除佣金和滑点
+        executed = cost_model.backtest(df['signal'], df['close'], df.get('amount'), returns=df['return'])
+        df['signal'] = executed['position']
+        df['cost'] = executed['cost']
+        df['strategy_return'] = executed['net_return']
     
     # 计算累计收益率
     df['cumulative_return'] = (1 + df['strategy_return']).cumprod()
@@ -137,37 +105,41 @@ def intraday_momentum_strategy(df, window=30):
     return df
 
 # 3. 策略评估与可视化
-def evaluate_strategy(df):
+@profiled(rows_arg='df')
+def evaluate_strategy(df, report=None):
     """
     评估策略性能并可视化结果
     参数:
         df: 带有策略信号和收益率的DataFrame
+        report: 报告.Report，累计收益率图登记到其中统一生成；None时立即生成
+    返回:
+        策略和基准的绩效指标表，见 绩效指标.tear_sheet
     """
-    # 计算策略指标
-    total_days = len(df)
-    strategy_return = df['cumulative_return'].iloc[-1] - 1
-    benchmark_return = df['benchmark_return'].iloc[-1] - 1
-    
-    # 计算夏普率 (假设无风险利率为0)
-    sharpe_ratio = np.sqrt(252) * df['strategy_return'].mean() / df['strategy_return'].std()
-    
-    # 输出评估结果
-    print(f"策略总收益率: {strategy_return:.2%}")
-    print(f"基准总收益率: {benchmark_return:.2%}")
-    print(f"夏普率: {sharpe_ratio:.2f}")
-    
-    # 绘制累计收益率曲线
-    plt.figure(figsize=(15, 8))
-    plt.plot(df['cumulative_return'], label='策略累计收益率')
-    plt.plot(df['benchmark_return'], label='基准累计收益率')
-    plt.title('黄金ETF高频动量策略表现')
-    plt.xlabel('时间')
-    plt.ylabel('累计收益率')
-    plt.legend()
-    plt.show()
+    # 按每天的K线数量年化，之前直接用252会把分钟级的夏普率低估sqrt(每天K线数)倍
+    bars_per_day = df.groupby(df.index.normalize()).size().median()
+    returns = pd.DataFrame({'策略': df['strategy_return'], '基准': df['return']})
+    positions = pd.DataFrame({'策略': df['signal'], '基准': 1.0}, index=df.index)
+    stats = tear_sheet(returns, periods=252 * bars_per_day, positions=positions)
+    
+    # 输出评估结果(假设无风险利率为0)
+    print_summary(stats)
+    
+    # 绘制累计收益率曲线，不再直接plt.show()阻塞进程
+    own = report is None
+    report = Report() if own else report
+    report.line('黄金ETF高频动量策略表现', df[['cumulative_return', 'benchmark_return']],
+                legend=['策略累计收益率', '基准累计收益率'], xlabel='时间', ylabel='累计收益率')
+    if own:
+        report.finish()
+    return stats
 
 # 4. 主函数
-def main():
+def main(with_costs=False):
+    """
+    参数:
+        with_costs: 是否按黄金ETF的交易规则和成本回测(python 黄金etf高频动量策略.py --costs)；
+            A股ETF不能做空，计成本时做空信号按空仓处理，策略变成只做多
+    """
     # 获取高频数据
     print("正在获取黄金ETF高频数据...")
     # 使用60分钟频率，这是akshare可能支持的较高频率
@@ -187,7 +159,11 @@ def main():
             window = 30
         else:
             window = 10
-        df = intraday_momentum_strategy(df, window=window)
+        cost_model = None
+        if with_costs:
+            cost_model = CostModel.gold_etf()
+            print("按黄金ETF交易规则计入成本: 不能做空，做空信号按空仓处理(只做多)")
+        df = intraday_momentum_strategy(df, window=window, cost_model=cost_model)
         
         # 评估策略
         print("正在评估策略性能...")
@@ -195,10 +171,11 @@ def main():
         
         # 输出最新信号
         latest_signal = df['signal'].iloc[-1]
-        signal_text = '买入' if latest_signal == 1 else '卖出'
+        # 计成本时signal是整手成交后的实际持仓(不一定是整数)，按符号判断
+        signal_text = {1: '买入', 0: '空仓', -1: '卖出(做空)'}.get(np.sign(latest_signal), '无')
         print(f"最新交易信号: {signal_text}")
     else:
         print("未获取到足够数据，无法运行策略")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(with_costs='--costs' in sys.argv)
\ No newline at end of file
@@ -1,4 +1,134 @@
+# ETF筛选：对整个ETF池一次性计算流动性、波动率、动量、回撤和上市时长，过滤后排序
+# 所有指标都在按(symbol, date)排序的长表上用分段的numpy运算完成，没有按代码的Python循环
+
+import numpy as np
 import pandas as pd
 
-#读取all_etf_data.csv
-df = pd.read_csv('A股ETF/all_etf_data.csv')
\ No newline at end of file
+from 紧凑面板 import load_universe
+
+
+def compute_metrics(df, momentum_window=20, liquidity_window=20):
+    """
+    在长表上一次性计算每只ETF的筛选指标
+    参数:
+        df: 长表，包含symbol、date、close、amount(成交额)列，按(symbol, date)排序
+        momentum_window: 动量计算窗口(交易日)
+        liquidity_window: 流动性(日均成交额)计算窗口(交易日)
+    返回:
+        以symbol为索引的DataFrame，列为:
+        first_date, last_date, days(交易日数), close, amount_mean(日均成交额),
+        volatility(年化波动率), momentum, max_drawdown
+    """
+    # 缺失或非正的收盘价会让累计运算串到后面的代码上，先去掉
+    df = df[df['close'] > 0]
+    if len(df) == 0:
+        # 空的回看窗口(例如流程里还没有数据)返回列相同的空表
+        dates = df['date'].to_numpy()
+        return pd.DataFrame({'first_date': dates, 'last_date': dates, 'days': np.empty(0, dtype=np.int64),
+                             **{col: np.empty(0) for col in ('close', 'amount_mean', 'volatility',
+                                                             'momentum', 'max_drawdown')}},
+                            index=pd.Index(df['symbol'].to_numpy(), name='symbol'))
+    codes = df['symbol'].cat.codes.to_numpy() if hasattr(df['symbol'], 'cat') \
+        else pd.factorize(df['symbol'])[0]
+    close = df['close'].to_numpy(dtype=np.float64)
+    amount = df['amount'].to_numpy(dtype=np.float64)
+    dates = df['date'].to_numpy()
+    n = len(close)
+
+    # 每只ETF在长表中的起止位置
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    counts = ends - starts + 1
+    group = np.repeat(np.arange(len(starts)), counts)
+
+    # 日收益率，每段的第一行没有前一日，记为缺失
+    ret = np.empty(n)
+    ret[0] = np.nan
+    ret[1:] = close[1:] / close[:-1] - 1
+    ret[starts] = np.nan
+    valid = ~np.isnan(ret)
+    ret0 = np.where(valid, ret, 0.0)
+    ret_count = np.add.reduceat(valid.astype(np.int64), starts)
+    ret_sum = np.add.reduceat(ret0, starts)
+    ret_sq = np.add.reduceat(ret0 * ret0, starts)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ret_mean = ret_sum / ret_count
+        ret_var = (ret_sq - ret_count * ret_mean ** 2) / (ret_count - 1)
+        volatility = np.sqrt(np.maximum(ret_var, 0)) * np.sqrt(252)
+
+    # 动量: 最新收盘价相对momentum_window个交易日前的涨幅，历史不够时为缺失
+    base = np.maximum(ends - momentum_window, starts)
+    momentum = np.where(counts > momentum_window, close[ends] / close[base] - 1, np.nan)
+
+    # 最大回撤: 给每段的对数价格加上递增的偏移量，一次累计最大值就不会跨段
+    log_close = np.log(close)
+    span = np.nanmax(log_close) - np.nanmin(log_close) + 1
+    running_max = np.maximum.accumulate(log_close + group * span) - group * span
+    drawdown = np.exp(log_close - running_max) - 1
+    max_drawdown = np.minimum.reduceat(drawdown, starts)
+
+    # 流动性: 最近liquidity_window个交易日的日均成交额
+    recent = (ends[group] - np.arange(n)) < liquidity_window
+    amount_sum = np.bincount(group, weights=np.where(recent, amount, 0.0), minlength=len(starts))
+    amount_mean = amount_sum / np.minimum(counts, liquidity_window)
+
+    symbols = df['symbol'].to_numpy()[starts]
+    return pd.DataFrame({
+        'first_date': dates[starts],
+        'last_date': dates[ends],
+        'days': counts,
+        'close': close[ends],
+        'amount_mean': amount_mean,
+        'volatility': volatility,
+        'momentum': momentum,
+        'max_drawdown': max_drawdown,
+    }, index=pd.Index(symbols, name='symbol'))
+
+
+def screen_etfs(metrics, min_amount=1e7, min_days=120, max_volatility=None, min_momentum=None,
+                max_drawdown=None, sort_by='momentum', top_n=20):
+    """
+    按条件过滤并排序
+    参数:
+        metrics: compute_metrics的结果
+        min_amount: 最小日均成交额(元)
+        min_days: 最少交易日数，用来排除新上市的ETF
+        max_volatility: 最大年化波动率，None表示不限制
+        min_momentum: 最小动量，None表示不限制
+        max_drawdown: 最大回撤的下限，例如-0.2表示回撤不能超过20%，None表示不限制
+        sort_by: 排序指标，'momentum'或'sharpe'(动量/波动率)等metrics中的列
+        top_n: 返回前多少只，None表示全部
+    返回:
+        排序后的DataFrame，带rank列
+    """
+    mask = (metrics['amount_mean'] >= min_amount) & (metrics['days'] >= min_days)
+    if max_volatility is not None:
+        mask &= metrics['volatility'] <= max_volatility
+    if min_momentum is not None:
+        mask &= metrics['momentum'] >= min_momentum
+    if max_drawdown is not None:
+        mask &= metrics['max_drawdown'] >= max_drawdown
+    shortlist = metrics[mask].copy()
+    if sort_by == 'sharpe':
+        shortlist['sharpe'] = shortlist['momentum'] / shortlist['volatility']
+    shortlist = shortlist.sort_values(sort_by, ascending=False, na_position='last')
+    shortlist['rank'] = np.arange(1, len(shortlist) + 1)
+    return shortlist if top_n is None else shortlist.head(top_n)
+
+
+def main():
+    # 从本地行情库读取数据，只读取需要的列和最近一年
+    # 也可以只取部分代码，例如: panel.select(symbols=['518880', '510300'])
+    start_date = (pd.Timestamp.now() - pd.Timedelta(days=365)).strftime('%Y%m%d')
+    # 紧凑面板是内存映射的float32矩阵，转成长表后只保留有数据的行
+    panel = load_universe(['close', 'amount'], start_date=start_date)
+    df = panel.to_long()
+    print(f"读取 {panel.shape[1]} 只ETF，共 {len(df)} 行")
+
+    metrics = compute_metrics(df, momentum_window=20, liquidity_window=20)
+    shortlist = screen_etfs(metrics, min_amount=1e7, min_days=120, max_drawdown=-0.3, top_n=20)
+    print(shortlist)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,128 @@
-import akshare as ak
-import pandas as pd
-
-# 获取新浪财经的ETF分类列表
-etf_list = ak.fund_etf_category_sina(symbol="ETF基金")
-# 去掉前两个字母
-etf_list["代码"] = etf_list["代码"].str[2:]
-print(etf_list.head())  
-# etf_list.to_csv("etf_list.csv", encoding='utf-8-sig', index=False)
-etf_codes=etf_list["代码"]
-
-
-all_etf_data = []  
-for code in etf_codes:
-    try:
-        # # 使用新浪接口获取单只ETF历史数据
-        # df = ak.fund_etf_hist_sina(symbol=str(code),start_date="20240901",end_date="20250901")
-        # 不复权
-        df = ak.fund_etf_hist_em(symbol=str(code), period="daily", start_date="20240901",end_date="20250901", adjust="")
-        # # 前复权
-        # df = ak.fund_etf_hist_em(symbol=str(code), period="daily", start_date="20240901",end_date="20250901", adjust="qfq")
-        # # 后复权
-        # df = ak.fund_etf_hist_em(symbol=str(code), period="daily", start_date="20240901", end_date="20250901", adjust="hfq")
-        df['symbol'] = code  # 在DataFrame中添加一列记录ETF代码
-        all_etf_data.append(df)  # 将当前ETF的数据添加到列表中
-    except Exception as e:
-        print(f"获取 {code} 数据时出错: {e}")
-
-# 合并所有ETF的数据
-combined_df = pd.concat(all_etf_data, ignore_index=True)
-combined_df.to_csv('A股ETF/all_etf_data.csv', index=False, encoding='utf-8-sig')
+import os
+import re
+import sys
+from datetime import datetime
+
+import akshare as ak
+import pandas as pd
+
+from 批量下载 import load_failed_codes
+from 本地行情库 import LocalStore
+from 紧凑面板 import PANEL_ADJUST, PANEL_DIR, CompactPanel
+from 性能剖析 import frame_bytes, span
+
+START_DATE = "20240901"
+END_DATE = "20250901"
+# 旧版本生成的整体csv，第一次运行时导入到本地行情库
+LEGACY_CSV_PATH = 'A股ETF/all_etf_data.csv'
+# 失败清单，下次可以用 python ETF获取.py --retry 只重试这些代码
+MANIFEST_PATH = 'A股ETF/failed_codes.json'
+
+
+def get_etf_codes():
+    """获取新浪财经的ETF分类列表，返回ETF代码"""
+    etf_list = ak.fund_etf_category_sina(symbol="ETF基金")
+    # 去掉前两个字母
+    etf_list["代码"] = etf_list["代码"].str[2:]
+    print(etf_list.head())
+    # etf_list.to_csv("etf_list.csv", encoding='utf-8-sig', index=False)
+    return etf_list["代码"].tolist()
+
+
+def make_fetch_func(adjust="", ak_module=ak):
+    """
+    生成单只ETF的区间获取函数
+    参数:
+        adjust: 复权方式，""不复权，"qfq"前复权，"hfq"后复权；
+            本地行情库只保存不复权数据，复权价格由get_adjust_events的事件在本地计算，不需要再下载复权行情
+        ak_module: akshare模块，测试时可以传入本地的假接口
+    返回:
+        fetch(code, start_date, end_date) -> DataFrame
+    """
+    def fetch(code, start_date, end_date):
+        # # 使用新浪接口获取单只ETF历史数据
+        # df = ak.fund_etf_hist_sina(symbol=str(code),start_date="20240901",end_date="20250901")
+        # 每只ETF一条记录(QUANT_PROFILE=1时)，在Chrome trace里按下载线程排开，慢的代码一眼能看出来
+        with span('fetch_etf', symbol=str(code)) as s:
+            df = ak_module.fund_etf_hist_em(symbol=str(code), period="daily", start_date=start_date,
+                                            end_date=end_date, adjust=adjust)
+            s.add(rows=len(df), bytes=frame_bytes(df))
+        return df
+    return fetch
+
+
+def _number(text):
+    """从'每份派现金0.0230元'、'1:1.0235'这样的文字中取数字，两个数字时为后者除以前者"""
+    numbers = [float(x) for x in re.findall(r'\d+(?:\.\d+)?', str(text))]
+    if not numbers:
+        return float('nan')
+    return numbers[-1] / numbers[0] if len(numbers) == 2 and numbers[0] else numbers[-1]
+
+
+def get_adjust_events(years, ak_module=ak):
+    """
+    天天基金网的基金分红和拆分折算记录，每年一次请求覆盖全市场的基金，代替逐只下载前复权、后复权行情
+    参数:
+        years: 年份列表
+        ak_module: akshare模块，测试时可以传入本地的假接口
+    返回:
+        DataFrame，列为symbol、date(除权除息日)、cash(每份派现)、split(拆分折算比例)
+    """
+    frames = []
+    for year in years:
+        dividends = ak_module.fund_fh_em(year=str(year))
+        frames.append(pd.DataFrame({'symbol': dividends['基金代码'], 'date': dividends['除息日期'],
+                                    'cash': dividends['分红'].map(_number), 'split': 1.0}))
+        splits = ak_module.fund_cf_em(year=str(year))
+        frames.append(pd.DataFrame({'symbol': splits['基金代码'], 'date': splits['拆分折算日'],
+                                    'cash': 0.0, 'split': splits['拆分折算'].map(_number)}))
+    events = pd.concat(frames, ignore_index=True)
+    events['date'] = pd.to_datetime(events['date'], errors='coerce')
+    return events.dropna(subset=['date', 'cash', 'split'])
+
+
+def update_adjust_events(store, start_date=START_DATE):
+    """
+    更新本地的复权因子: 第一次获取start_date以来的全部年份，之后获取去年和今年的；
+    年底的除权除息日可能到第二年才公布或才被取到，去年的也要重新获取，更早的不会再变
+    返回:
+        新增的事件数
+    """
+    this_year = datetime.now().year
+    first = int(start_date[:4]) if store.factors().empty else this_year - 1
+    return store.update_factors(get_adjust_events(range(first, this_year + 1)))
+
+
+def main(retry_failed=False):
+    if retry_failed:
+        etf_codes = load_failed_codes(MANIFEST_PATH)
+        print(f"重试上次失败的 {len(etf_codes)} 只ETF")
+    else:
+        etf_codes = get_etf_codes()
+
+    # 数据写入按年份分区的本地行情库(Parquet)，不再生成整体的all_etf_data.csv
+    # 本地已有的数据不会重复下载，只补齐缺失的部分；中断后重新运行会从中断处继续
+    store = LocalStore()
+    if os.path.exists(LEGACY_CSV_PATH) and not store.symbols():
+        print(f"导入旧数据 {LEGACY_CSV_PATH}")
+        store.import_long_csv(LEGACY_CSV_PATH)
+    with span('update_universe', codes=len(etf_codes)) as s:
+        rows, failed, stats = store.update_universe(etf_codes, make_fetch_func(), START_DATE, END_DATE,
+                                                    host='eastmoney', max_workers=8, rate=5.0,
+                                                    manifest_path=MANIFEST_PATH)
+        s.add(rows=sum(rows.values()))
+    print(f"新增 {sum(rows.values())} 行，本地共有 {len(store.symbols())} 只ETF")
+    # 只下载不复权行情，前复权/后复权由分红和拆分事件在本地计算: store.load(adjust='qfq')
+    with span('update_adjust_events'):
+        print(f"新增 {update_adjust_events(store)} 个分红/拆分事件")
+
+    # 保存整个ETF池的前复权紧凑面板，筛选和回测脚本直接内存映射读取
+    with span('compact_panel') as s:
+        panel = CompactPanel.from_store(root=store.root, adjust=PANEL_ADJUST)
+        panel.save(PANEL_DIR)
+        s.add(rows=panel.shape[0] * panel.shape[1], bytes=panel.nbytes)
+    print(f"紧凑面板: {panel.shape[0]} 个交易日 × {panel.shape[1]} 只ETF，{panel.nbytes / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main(retry_failed='--retry' in sys.argv)
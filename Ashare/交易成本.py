@@ -0,0 +1,273 @@
+# 交易成本和A股交易规则：佣金(含最低佣金)、印花税、过户费等、按成交额估算的买卖价差和冲击成本、
+# 整手交易、涨跌停无法成交、T+1(当天买入的份额当天不能卖出)、不能做空
+#
+# 约定和各个策略相同: signal[t]是第t根K线期间的持仓(已经滞后一根)，它在第t-1根K线收盘时成交，
+# 成本计入第t根K线的收益: net_return[t] = signal[t] * return[t] - cost[t]
+# 持仓用权重表示(1为满仓)，金额按固定的初始资金capital换算，用于整手取整、最低佣金和冲击成本
+#
+# 用法:
+#   model = CostModel.etf()                     # 普通ETF: T+1，免印花税
+#   model = CostModel.gold_etf()                # 黄金ETF: T+0
+#   result = model.backtest(signal, close, amount)
+#   result['net_return'], result['cost'], result['position']
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+@njit(cache=True)
+def _execute(decision, block_buy, block_sell, new_session, t_plus_one, out):
+    """
+    逐根K线执行目标持仓
+    decision[e]: 第e根K线收盘时的目标持仓，NaN表示不调整
+    block_buy/block_sell: 第e根K线收盘是否涨停/跌停(无法买入/卖出)
+    new_session[e]: 第e根K线是否是新交易日的第一根
+    """
+    T, N = decision.shape
+    for j in range(N):
+        pos = 0.0
+        bought = 0.0
+        for e in range(T):
+            if new_session[e]:
+                bought = 0.0
+            target = decision[e, j]
+            if target != target:
+                target = pos
+            if target > pos and block_buy[e, j]:
+                target = pos
+            if target < pos and block_sell[e, j]:
+                target = pos
+            # T+1: 当天买入的部分当天不能卖出
+            if t_plus_one and target < pos and target < bought:
+                target = min(pos, bought)
+            if target > pos:
+                bought += target - pos
+            pos = target
+            out[e, j] = pos
+
+
+class CostModel:
+    """
+    交易成本和交易规则
+    参数:
+        commission: 佣金费率(双边)，万分之三为0.0003
+        min_commission: 每笔最低佣金(元)，0表示不限
+        stamp_duty: 印花税(卖出单边)，股票为0.0005，ETF免征
+        transfer_fee: 过户费等其他费用(双边)
+        tick: 最小报价单位，ETF为0.001元，股票为0.01元；买卖各付半个价差
+        impact: 冲击成本系数，冲击成本 = impact * sqrt(成交金额 / 当根K线成交额)
+        lot_size: 每手股数，持仓按整手向下取整；0表示不取整
+        capital: 初始资金(元)
+        t_plus: 0为T+0，1为T+1
+        price_limit: 涨跌停幅度，0.1为10%，None表示没有涨跌停
+        allow_short: 是否允许做空，A股普通账户不能做空
+    """
+
+    def __init__(self, commission=0.0003, min_commission=5.0, stamp_duty=0.0, transfer_fee=0.0,
+                 tick=0.001, impact=0.01, lot_size=100, capital=1_000_000, t_plus=1, price_limit=0.1,
+                 allow_short=False):
+        self.commission = commission
+        self.min_commission = min_commission
+        self.stamp_duty = stamp_duty
+        self.transfer_fee = transfer_fee
+        self.tick = tick
+        self.impact = impact
+        self.lot_size = lot_size
+        self.capital = capital
+        self.t_plus = t_plus
+        self.price_limit = price_limit
+        self.allow_short = allow_short
+
+    @classmethod
+    def etf(cls, **kwargs):
+        """普通股票型ETF: T+1，免印花税，涨跌停10%"""
+        return cls(**{'t_plus': 1, 'stamp_duty': 0.0, 'tick': 0.001, **kwargs})
+
+    @classmethod
+    def gold_etf(cls, **kwargs):
+        """黄金ETF(如518880): T+0，免印花税，涨跌停10%"""
+        return cls(**{'t_plus': 0, 'stamp_duty': 0.0, 'tick': 0.001, **kwargs})
+
+    @classmethod
+    def stock(cls, **kwargs):
+        """A股股票: T+1，卖出印花税0.05%，过户费0.001%，报价单位0.01元"""
+        return cls(**{'t_plus': 1, 'stamp_duty': 0.0005, 'transfer_fee': 0.00001, 'tick': 0.01, **kwargs})
+
+    @classmethod
+    def frictionless(cls):
+        """没有任何成本和限制，结果和signal * return相同"""
+        return cls(commission=0.0, min_commission=0.0, tick=0.0, impact=0.0, lot_size=0, t_plus=0,
+                   price_limit=None, allow_short=True)
+
+    # ---------- 规则 ----------
+    @staticmethod
+    def _sessions(index, n):
+        """每根K线所属交易日的编号，日线每根K线是一个交易日"""
+        if isinstance(index, pd.DatetimeIndex):
+            return pd.factorize(index.normalize())[0]
+        return np.arange(n)
+
+    def _limit_flags(self, close, session):
+        """收盘价是否涨停/跌停，涨跌停价按前一交易日收盘价计算"""
+        T, N = close.shape
+        if self.price_limit is None:
+            no = np.zeros((T, N), dtype=np.bool_)
+            return no, no
+        # 前一交易日的收盘价: 上一个交易日最后一根K线的收盘价
+        first = np.r_[True, session[1:] != session[:-1]]
+        last_rows = np.flatnonzero(np.r_[first[1:], True])
+        day = np.cumsum(first) - 1
+        prev_close = np.full((T, N), np.nan)
+        has_prev = day > 0
+        prev_close[has_prev] = close[last_rows[day[has_prev] - 1]]
+        # 涨跌停价四舍五入到最小报价单位
+        up = prev_close * (1 + self.price_limit)
+        down = prev_close * (1 - self.price_limit)
+        if self.tick:
+            up, down = np.round(up / self.tick) * self.tick, np.round(down / self.tick) * self.tick
+        half_tick = self.tick / 2 if self.tick else 1e-9
+        with np.errstate(invalid='ignore'):
+            return close >= up - half_tick, close <= down + half_tick
+
+    def _round_lots(self, decision, close):
+        """
+        目标权重按整手向下取整
+        只在目标变化的K线上按当时的价格取整，之后沿用，否则价格每变一次持仓都会被重新取整，产生大量零碎交易
+        """
+        if not self.lot_size:
+            return decision
+        prev = np.full_like(decision, np.nan)
+        prev[1:] = decision[:-1]
+        changed = (decision != prev) & ~np.isnan(decision)
+        rows, cols = np.nonzero(changed)
+        lot_value = close[rows, cols] * self.lot_size
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rounded = np.trunc(decision[rows, cols] * self.capital / lot_value) * lot_value / self.capital
+        out = np.full_like(decision, np.nan)
+        out[rows, cols] = rounded
+        return pd.DataFrame(out).ffill().to_numpy()
+
+    def execute(self, signal, close, index=None):
+        """
+        按交易规则得到实际持仓
+        参数:
+            signal: T×N的目标持仓(已滞后一根，即第t根K线期间想要的持仓)
+            close: T×N的收盘价
+            index: K线时间，分钟线时用来划分交易日(T+1和涨跌停需要)
+        返回:
+            T×N的实际持仓
+        """
+        signal = np.asarray(signal, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        T, N = signal.shape
+        # 第e根K线收盘时的决策就是第e+1根K线的持仓
+        decision = np.full((T, N), np.nan)
+        decision[:-1] = signal[1:]
+        if not self.allow_short:
+            decision = np.where(decision < 0, 0.0, decision)
+        decision = self._round_lots(decision, close)
+
+        session = self._sessions(index, T)
+        block_buy, block_sell = self._limit_flags(close, session)
+        new_session = np.r_[True, session[1:] != session[:-1]]
+        if not block_buy.any() and not block_sell.any() and not (self.t_plus and new_session.sum() < T):
+            # 没有涨跌停并且不受T+1约束(日线)时，执行结果就是目标持仓，不需要逐根递推
+            executed = pd.DataFrame(decision).ffill().fillna(0.0).to_numpy()
+        else:
+            executed = np.empty((T, N))
+            _execute(decision, block_buy, block_sell, new_session, bool(self.t_plus), executed)
+
+        position = np.zeros((T, N))
+        position[1:] = executed[:-1]
+        return position
+
+    # ---------- 成本 ----------
+    def costs(self, position, close, amount=None):
+        """
+        每根K线的交易成本(占资金的比例)
+        参数:
+            position: T×N的实际持仓(第t根K线期间)
+            close: T×N的收盘价，成交价为前一根K线的收盘价
+            amount: T×N的成交额(元)，用于估算冲击成本；None时只计价差
+        返回:
+            T×N数组，cost[t]为第t-1根K线收盘调仓的成本
+        """
+        position = np.asarray(position, dtype=np.float64)
+        close = np.asarray(close, dtype=np.float64)
+        T, N = position.shape
+        change = np.diff(position, axis=0, prepend=0.0)
+        # 调仓通常很稀疏，只在有成交的位置计算
+        rows, cols = np.nonzero(change)
+        delta = change[rows, cols]
+        notional = np.abs(delta) * self.capital
+        # 成交发生在前一根K线收盘
+        prev = np.maximum(rows - 1, 0)
+        price = np.where(rows > 0, close[prev, cols], np.nan)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            commission = np.maximum(notional * self.commission, self.min_commission)
+            fees = notional * self.transfer_fee + np.where(delta < 0, notional * self.stamp_duty, 0.0)
+            slip_rate = np.where(price > 0, self.tick / 2 / price, 0.0)
+            if amount is not None and self.impact:
+                traded_amount = np.where(rows > 0, np.asarray(amount, dtype=np.float64)[prev, cols], np.nan)
+                participation = np.where(traded_amount > 0, notional / traded_amount, 0.0)
+                slip_rate = slip_rate + self.impact * np.sqrt(participation)
+            slippage = notional * np.nan_to_num(slip_rate)
+        cost = np.zeros((T, N))
+        cost[rows, cols] = (commission + fees + slippage) / self.capital
+        return cost
+
+    def backtest(self, signal, close, amount=None, returns=None):
+        """
+        带成本和交易规则的回测
+        参数:
+            signal: 目标持仓，DataFrame/Series(日期×代码)或数组，已滞后一根
+            close: 收盘价，形状同signal
+            amount: 成交额，形状同signal，可选
+            returns: 每根K线的收益率，默认由close计算
+        返回:
+            dict: position(实际持仓)、gross_return(不含成本)、cost、net_return、cumulative_net，
+            输入为DataFrame/Series时返回同样索引的DataFrame/Series
+        """
+        frame = isinstance(signal, (pd.DataFrame, pd.Series))
+        index = signal.index if frame else None
+        series = isinstance(signal, pd.Series)
+
+        def matrix(x):
+            x = np.asarray(x, dtype=np.float64)
+            return x[:, None] if x.ndim == 1 else x
+
+        s, c = matrix(signal), matrix(close)
+        if returns is None:
+            r = np.full_like(c, np.nan)
+            r[1:] = c[1:] / c[:-1] - 1
+        else:
+            r = matrix(returns)
+        position = self.execute(s, c, index)
+        cost = self.costs(position, c, None if amount is None else matrix(amount))
+        gross = position * r
+        net = np.nan_to_num(gross) - cost
+        # 收益率缺失(停牌、未上市)且没有交易的位置保持缺失
+        net = np.where(np.isnan(gross) & (cost == 0), np.nan, net)
+        result = {
+            'position': position,
+            'gross_return': gross,
+            'cost': cost,
+            'net_return': net,
+            'cumulative_net': np.cumprod(1 + np.nan_to_num(net), axis=0),
+        }
+        if frame:
+            for key, value in result.items():
+                if series:
+                    result[key] = pd.Series(value[:, 0], index=index, name=signal.name)
+                else:
+                    result[key] = pd.DataFrame(value, index=index, columns=signal.columns)
+        return result
@@ -0,0 +1,278 @@
+# 交易日历：交易日和int32序号互相转换
+# 日期先变成自1970-01-01起的天数(int64，和日内事件回测中的session相同)，再查一张按自然日展开的表得到交易日序号，
+# 一次数组索引完成，不需要逐个解析日期或二分查找；字符串日期只解析不重复的值，并在进程内缓存
+# 日历:
+#   SSE: 上交所，akshare的新浪交易日历(包含今年剩下的交易日)，取不到时用本地行情库中出现过的交易日
+#   US:  纽交所，按节假日规则和历史上的临时休市生成，用于GLD等美股ETF
+# 构造好的日历保存为.npy，进程内也只构造一次
+#
+# 用法:
+#   cal = get_calendar('SSE')
+#   rows = cal.ordinals(df['date'])                     # 日期 -> 交易日序号，非交易日取之前最近的交易日
+#   cal.dates[rows]                                     # 序号 -> 日期
+#   us_rows = get_calendar('US').ordinals(cal.dates)    # 每个A股交易日当天或之前最近的美股交易日
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay, USThanksgivingDay,
+                                    nearest_workday, sunday_to_monday)
+from pandas.tseries.offsets import CustomBusinessDay
+
+CALENDAR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A股ETF', '日历')
+
+NS_PER_DAY = 86_400_000_000_000
+# 缺失日期对应的天数
+NAT_DAY = np.iinfo(np.int64).min
+
+# 进程内缓存: 已解析的日期字符串 -> 天数，已构造的日历
+_PARSED = {}
+_PARSED_LIMIT = 1_000_000
+_CALENDARS = {}
+
+
+def to_days(values):
+    """
+    日期 -> 自1970-01-01起的天数，带时间的取所在的日期，带时区的按当地日期
+    参数:
+        values: Series、Index、数组或列表，元素可以是datetime64、Timestamp、date或'YYYYMMDD'/'YYYY-MM-DD'字符串
+    返回:
+        int64数组，缺失值为NAT_DAY
+    """
+    if isinstance(values, (pd.Series, pd.Index)) and isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = (values.dt if isinstance(values, pd.Series) else values).tz_localize(None)
+    arr = values.to_numpy() if isinstance(values, (pd.Series, pd.Index)) else np.asarray(values)
+    if arr.dtype.kind != 'M':
+        arr = _parse(arr)
+    ns = arr.astype('datetime64[ns]').view(np.int64)
+    return np.where(ns == NAT_DAY, NAT_DAY, np.floor_divide(ns, NS_PER_DAY))
+
+
+def _parse(arr):
+    """只解析不重复的值，解析结果缓存在进程内"""
+    codes, uniques = pd.factorize(arr.ravel())
+    parsed = np.empty(len(uniques), dtype='datetime64[ns]')
+    todo = []
+    for i, value in enumerate(uniques):
+        hit = _PARSED.get(value)
+        if hit is None:
+            todo.append(i)
+        else:
+            parsed[i] = hit
+    if todo:
+        if len(_PARSED) > _PARSED_LIMIT:
+            _PARSED.clear()
+        values = [uniques[i] for i in todo]
+        # 'YYYYMMDD'按固定格式解析，其他格式交给pandas推断
+        fixed = all(isinstance(v, str) and len(v) == 8 and v.isdigit() for v in values)
+        result = pd.to_datetime(pd.Index(values), format='%Y%m%d' if fixed else None, errors='coerce')
+        result = result.as_unit('ns').to_numpy()
+        parsed[todo] = result
+        _PARSED.update(zip(values, result))
+    out = np.full(len(codes), np.datetime64('NaT'), dtype='datetime64[ns]')
+    out[codes >= 0] = parsed[codes[codes >= 0]]
+    return out.reshape(arr.shape)
+
+
+def parse_dates(values):
+    """日期 -> datetime64[ns]数组，规则见to_days，但保留时间部分"""
+    if isinstance(values, (pd.Series, pd.Index)) and isinstance(values.dtype, pd.DatetimeTZDtype):
+        values = (values.dt if isinstance(values, pd.Series) else values).tz_localize(None)
+    arr = values.to_numpy() if isinstance(values, (pd.Series, pd.Index)) else np.asarray(values)
+    return arr.astype('datetime64[ns]') if arr.dtype.kind == 'M' else _parse(arr)
+
+
+def unique_days(days):
+    """
+    不重复的天数，升序；跨度不太大时用按天展开的标记数组，O(n)，不排序
+    """
+    days = np.asarray(days, dtype=np.int64)
+    days = days[days != NAT_DAY]
+    if len(days) == 0:
+        return days
+    lo, hi = days.min(), days.max()
+    if hi - lo > 10 * len(days) + 100_000:
+        return np.unique(days)
+    mask = np.zeros(hi - lo + 1, dtype=np.bool_)
+    mask[days - lo] = True
+    return np.flatnonzero(mask) + lo
+
+
+class TradingCalendar:
+    """
+    交易日历
+    参数:
+        dates: 交易日，任意顺序，可以重复，带时间的取所在日期
+        name: 日历名
+    """
+
+    def __init__(self, dates, name=''):
+        self.name = name
+        self.days = unique_days(to_days(dates))
+        self.dates = (self.days * NS_PER_DAY).view('datetime64[ns]')
+        self._index = None
+        # 从第一个交易日起按自然日展开: 当天是否交易，以及当天或之前最近的交易日序号
+        self._first = int(self.days[0]) if len(self.days) else 0
+        span = int(self.days[-1]) - self._first + 1 if len(self.days) else 0
+        self._open = np.zeros(span, dtype=np.bool_)
+        self._open[self.days - self._first] = True
+        self._previous = (np.cumsum(self._open) - 1).astype(np.int32)
+
+    def __len__(self):
+        return len(self.days)
+
+    def __repr__(self):
+        if not len(self):
+            return f"TradingCalendar({self.name!r}, 空)"
+        return f"TradingCalendar({self.name!r}, {len(self)}个交易日, {str(self.dates[0])[:10]}至{str(self.dates[-1])[:10]})"
+
+    @property
+    def index(self):
+        """全部交易日的DatetimeIndex，只构造一次"""
+        if self._index is None:
+            self._index = pd.DatetimeIndex(self.dates, name='date')
+        return self._index
+
+    def ordinals(self, dates, how='previous'):
+        """
+        日期 -> int32交易日序号
+        参数:
+            dates: 日期，见to_days；已经是天数(int64)时直接使用
+            how: 非交易日的处理，'previous'取之前最近的交易日(早于第一个交易日为-1)，
+                'next'取之后最近的交易日(晚于最后一个交易日为len)，'exact'为-1
+        返回:
+            int32数组
+        """
+        days = np.asarray(dates)
+        days = days if days.dtype == np.int64 else to_days(dates)
+        offset = days - self._first
+        before = offset < 0
+        after = offset >= len(self._open)
+        pos = np.clip(offset, 0, max(len(self._open) - 1, 0))
+        previous = self._previous[pos] if len(self._open) else np.full(len(days), -1, dtype=np.int32)
+        previous = np.where(before, -1, np.where(after, len(self) - 1, previous)).astype(np.int32)
+        if how == 'previous':
+            return previous
+        is_open = ~before & ~after & (self._open[pos] if len(self._open) else False)
+        if how == 'exact':
+            return np.where(is_open, previous, -1).astype(np.int32)
+        if how == 'next':
+            return np.where(is_open, previous, np.where(after, len(self), previous + 1)).astype(np.int32)
+        raise ValueError(f"不支持的方式{how}，可选: previous、next、exact")
+
+    def is_trading_day(self, dates):
+        """每个日期是否是交易日"""
+        return self.ordinals(dates, 'exact') >= 0
+
+    def between(self, start_date=None, end_date=None):
+        """区间内的交易日(DatetimeIndex)，包含两端"""
+        lo = 0 if start_date is None else int(self.ordinals([start_date], 'next')[0])
+        hi = len(self) if end_date is None else int(self.ordinals([end_date], 'previous')[0]) + 1
+        return self.index[lo:hi]
+
+    def shift(self, dates, n):
+        """每个日期(非交易日先取之前最近的交易日)往后数n个交易日的日期，超出日历为NaT"""
+        target = self.ordinals(dates).astype(np.int64) + n
+        valid = (target >= 0) & (target < len(self))
+        out = np.full(len(target), np.datetime64('NaT'), dtype='datetime64[ns]')
+        out[valid] = self.dates[target[valid]]
+        return out
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, self.days)
+
+    @classmethod
+    def load(cls, path, name=''):
+        days = np.load(path)
+        return cls((days * NS_PER_DAY).view('datetime64[ns]'), name)
+
+
+# ---------- 各市场的日历 ----------
+class NYSEHolidayCalendar(AbstractHolidayCalendar):
+    """纽交所的固定节假日"""
+    rules = [
+        # 元旦落在周六时不补休
+        Holiday('NewYearsDay', month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday('Juneteenth', month=6, day=19, start_date='2022-01-01', observance=nearest_workday),
+        Holiday('IndependenceDay', month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday('Christmas', month=12, day=25, observance=nearest_workday),
+    ]
+
+
+# 纽交所历史上的临时休市(国丧、9·11、飓风桑迪)
+US_SPECIAL_CLOSURES = ['1994-04-27', '2001-09-11', '2001-09-12', '2001-09-13', '2001-09-14',
+                       '2004-06-11', '2007-01-02', '2012-10-29', '2012-10-30', '2018-12-05', '2025-01-09']
+
+
+def us_trading_days(start_date='19930101', end_date=None):
+    """
+    纽交所交易日
+    参数:
+        end_date: 默认到明年年底
+    """
+    end_date = end_date or f'{datetime.now().year + 1}1231'
+    days = pd.date_range(start_date, end_date, freq=CustomBusinessDay(calendar=NYSEHolidayCalendar()))
+    return days[~days.isin(pd.DatetimeIndex(US_SPECIAL_CLOSURES))]
+
+
+def sse_trading_days():
+    """
+    上交所交易日，优先使用akshare的新浪交易日历，取不到时用本地行情库中出现过的交易日(只到最新一根K线)
+    """
+    try:
+        import akshare as ak
+        return pd.DatetimeIndex(pd.to_datetime(ak.tool_trade_date_hist_sina()['trade_date']))
+    except Exception as exc:
+        print(f"获取交易日历失败，使用本地行情库的交易日: {str(exc)[:100]}")
+        from 本地行情库 import LocalStore
+        return pd.DatetimeIndex(LocalStore().load(columns=['date'])['date'].unique())
+
+
+CALENDAR_BUILDERS = {
+    'SSE': sse_trading_days,
+    'US': us_trading_days,
+}
+
+
+def register_calendar(name, builder):
+    """注册新的日历，builder() -> 交易日"""
+    CALENDAR_BUILDERS[name] = builder
+    _CALENDARS.pop(name, None)
+
+
+def get_calendar(name='SSE', refresh=False, cache_dir=CALENDAR_DIR):
+    """
+    读取日历，进程内缓存，磁盘缓存在日历覆盖到今天之后仍然有效
+    参数:
+        name: 'SSE'、'US'或者register_calendar注册的名字
+        refresh: 是否重新构造
+        cache_dir: 磁盘缓存目录，None表示不保存
+    返回:
+        TradingCalendar
+    """
+    if name not in CALENDAR_BUILDERS:
+        raise ValueError(f"没有日历{name}，可选: {list(CALENDAR_BUILDERS)}")
+    if not refresh and name in _CALENDARS:
+        return _CALENDARS[name]
+    today = int(to_days([np.datetime64(datetime.now().date())])[0])
+    path = None if cache_dir is None else os.path.join(cache_dir, f'{name}.npy')
+    calendar = None
+    if not refresh and path is not None and os.path.exists(path):
+        calendar = TradingCalendar.load(path, name)
+    # 磁盘上的日历只覆盖到过去的日期时(例如跨年)重新构造
+    if calendar is None or not len(calendar) or calendar.days[-1] < today:
+        calendar = TradingCalendar(CALENDAR_BUILDERS[name](), name)
+        if path is not None:
+            calendar.save(path)
+    _CALENDARS[name] = calendar
+    return calendar
@@ -0,0 +1,204 @@
+# 参数寻优：多进程并行评估动量/日内动量/双均线策略的参数网格
+# 价格矩阵和它的累计和只计算一次，放在共享内存里，各进程直接映射使用，不会复制到每个进程
+# 任意窗口的滚动均值/滚动和都由累计和相减得到，同一窗口的参数组合在一个任务里复用同一份滚动结果
+
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from 绩效指标 import max_drawdown, nav, sharpe_ratio
+
+# 共享数组中各层的含义
+PRICE, RETURN, PRICE_CUMSUM, RETURN_CUMSUM, VALID_CUMSUM, VALID_RETURN_CUMSUM = range(6)
+
+# 每种策略按哪个参数分组，同一组共用滚动统计
+GROUP_KEYS = {
+    'momentum': 'window',
+    'intraday': 'window',
+    'dual_ma': 'fast',
+}
+
+_shared = None
+_shm = None
+
+
+def prepare_arrays(prices):
+    """
+    计算共享给各进程的数组
+    参数:
+        prices: 日期×代码的价格矩阵(ndarray)
+    返回:
+        形状为(6, T+1, N)的数组，依次为价格、收益率、价格累计和、收益率累计和、有效价格计数和有效收益率计数的累计和
+        累计和在最前面补了一行0，窗口w在t处的和为 cs[t+1] - cs[t+1-w]
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    T, N = prices.shape
+    arrays = np.zeros((6, T + 1, N))
+    arrays[PRICE, 1:] = prices
+    ret = np.full((T, N), np.nan)
+    ret[1:] = prices[1:] / prices[:-1] - 1
+    arrays[RETURN, 1:] = ret
+    arrays[PRICE_CUMSUM, 1:] = np.cumsum(np.nan_to_num(prices), axis=0)
+    arrays[RETURN_CUMSUM, 1:] = np.cumsum(np.nan_to_num(ret), axis=0)
+    arrays[VALID_CUMSUM, 1:] = np.cumsum(~np.isnan(prices), axis=0)
+    arrays[VALID_RETURN_CUMSUM, 1:] = np.cumsum(~np.isnan(ret), axis=0)
+    return arrays
+
+
+def _init_worker(name, shape):
+    # 子进程映射父进程创建的共享内存
+    global _shared, _shm
+    _shm = shared_memory.SharedMemory(name=name)
+    _shared = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+
+
+def _rolling(cumsum, valid, window):
+    """由累计和计算滚动和，窗口内有缺失值的位置为NaN"""
+    total = np.full(cumsum[1:].shape, np.nan)
+    if window <= len(total):
+        total[window - 1:] = cumsum[window:] - cumsum[:-window]
+        count = valid[window:] - valid[:-window]
+        total[window - 1:][count < window] = np.nan
+    return total
+
+
+def _lagged_returns(condition, ret, short_condition=None):
+    """把当日信号滞后一日乘以收益率，得到策略收益率"""
+    signal = np.zeros_like(ret)
+    signal[1:] = condition[:-1]
+    if short_condition is not None:
+        signal[1:] -= short_condition[:-1]
+    return signal * ret
+
+
+def evaluate_returns(strategy_return, periods=252):
+    """
+    计算每列策略收益率的总收益、年化夏普率和最大回撤
+    参数:
+        strategy_return: T×N的策略收益率，NaN按0计
+        periods: 年化周期数
+    返回:
+        (total_return, sharpe, max_drawdown)，每项都是长度N的数组
+    """
+    r = np.nan_to_num(strategy_return)
+    curve = nav(r)
+    return curve[-1] - 1, sharpe_ratio(r, periods), max_drawdown(r, curve)
+
+
+def _run_group(strategy, key_value, params_list, periods, arrays=None):
+    """
+    评估同一分组下的所有参数组合
+    返回:
+        [(params, total_return, sharpe, max_drawdown), ...]
+    """
+    a = _shared if arrays is None else arrays
+    price, ret = a[PRICE, 1:], a[RETURN, 1:]
+    valid = a[VALID_CUMSUM]
+    results = []
+
+    if strategy == 'momentum':
+        window = key_value
+        momentum = np.full_like(price, np.nan)
+        momentum[window:] = price[window:] / price[:-window] - 1
+        for params in params_list:
+            short = momentum < 0 if params.get('short', False) else None
+            strategy_return = _lagged_returns(momentum > 0, ret, short)
+            results.append((params,) + evaluate_returns(strategy_return, periods))
+
+    elif strategy == 'intraday':
+        # 日内动量: 窗口内收益率之和为正做多，为负做空
+        momentum = _rolling(a[RETURN_CUMSUM], a[VALID_RETURN_CUMSUM], key_value)
+        for params in params_list:
+            strategy_return = _lagged_returns(momentum > 0, ret, momentum < 0)
+            results.append((params,) + evaluate_returns(strategy_return, periods))
+
+    elif strategy == 'dual_ma':
+        # 双均线: 短均线在长均线之上持有，否则空仓；短均线在同一分组内只算一次
+        fast = _rolling(a[PRICE_CUMSUM], valid, key_value) / key_value
+        for params in params_list:
+            slow = _rolling(a[PRICE_CUMSUM], valid, params['slow']) / params['slow']
+            strategy_return = _lagged_returns(fast > slow, ret)
+            results.append((params,) + evaluate_returns(strategy_return, periods))
+
+    else:
+        raise ValueError(f"不支持的策略: {strategy}")
+    return results
+
+
+def expand_grid(grid):
+    """把{参数: 取值列表}展开成参数组合列表"""
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def run_sweep(prices, grid, strategy='momentum', max_workers=None, periods=252):
+    """
+    并行评估参数网格
+    参数:
+        prices: 日期×代码的价格宽表(DataFrame)，单个标的时也可以是Series
+        grid: 参数网格，例如
+            momentum: {'window': [5, 10, 20, 60], 'short': [False, True]}
+            intraday: {'window': [10, 20, 30]}
+            dual_ma:  {'fast': [5, 10, 55], 'slow': [20, 60, 120]}，只保留fast < slow的组合
+        strategy: 'momentum'、'intraday'或'dual_ma'
+        max_workers: 进程数，默认CPU核数；为1时在当前进程中计算
+        periods: 年化周期数
+    返回:
+        整理好的长表，每行是一个(参数组合, 代码)，列为参数、symbol、total_return、sharpe、max_drawdown
+    """
+    if isinstance(prices, pd.Series):
+        prices = prices.to_frame()
+    symbols = [str(col) for col in prices.columns]
+    key = GROUP_KEYS[strategy]
+    params_all = expand_grid(grid)
+    if strategy == 'dual_ma':
+        params_all = [p for p in params_all if p['fast'] < p['slow']]
+
+    # 按分组参数归类，同一窗口的组合在同一个任务里计算
+    groups = {}
+    for params in params_all:
+        groups.setdefault(params[key], []).append(params)
+
+    arrays = prepare_arrays(prices.to_numpy())
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers == 1 or len(groups) == 1:
+        outputs = [_run_group(strategy, k, v, periods, arrays) for k, v in groups.items()]
+    else:
+        shm = shared_memory.SharedMemory(create=True, size=arrays.nbytes)
+        try:
+            np.ndarray(arrays.shape, dtype=np.float64, buffer=shm.buf)[:] = arrays
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                     initargs=(shm.name, arrays.shape)) as executor:
+                futures = [executor.submit(_run_group, strategy, k, v, periods) for k, v in groups.items()]
+                outputs = [future.result() for future in futures]
+        finally:
+            shm.close()
+            shm.unlink()
+
+    rows = []
+    for output in outputs:
+        for params, total_return, sharpe, max_drawdown in output:
+            for i, symbol in enumerate(symbols):
+                rows.append({**params, 'symbol': symbol, 'total_return': total_return[i],
+                             'sharpe': sharpe[i], 'max_drawdown': max_drawdown[i]})
+    return pd.DataFrame(rows)
+
+
+def main():
+    from 本地行情库 import load_panel
+    from 向量化回测 import to_wide
+
+    prices = to_wide(load_panel(symbols=['518880'], columns=['close']))
+    table = run_sweep(prices, {'window': [5, 10, 20, 40, 60, 120], 'short': [False, True]},
+                      strategy='momentum')
+    print(table.sort_values('sharpe', ascending=False).head(10))
+    table = run_sweep(prices, {'fast': [5, 10, 20, 55], 'slow': [30, 60, 120]}, strategy='dual_ma')
+    print(table.sort_values('sharpe', ascending=False).head(10))
+
+
+if __name__ == "__main__":
+    main()
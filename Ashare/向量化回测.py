@@ -0,0 +1,129 @@
+# 多标的向量化回测：在 日期×代码 的价格矩阵上一次性计算所有标的的动量信号、收益和净值
+# 黄金etf日频动量策略.daily_momentum_strategy 就是这里只有一列时的特例
+
+import numpy as np
+import pandas as pd
+
+from 紧凑面板 import load_universe
+from 绩效指标 import tear_sheet
+from 报告 import Report
+
+
+def to_wide(df, value='close'):
+    """
+    长表转成 日期×代码 的宽表
+    参数:
+        df: 包含symbol、date和value列的长表
+        value: 要展开的列
+    返回:
+        以date为索引、symbol为列的DataFrame，没有数据的位置为NaN
+    """
+    wide = df.pivot(index='date', columns='symbol', values=value)
+    wide.columns = wide.columns.astype(str)
+    return wide.sort_index()
+
+
+def momentum_backtest(prices, window=20, short=False, cost_model=None, amount=None):
+    """
+    动量策略回测：window日涨幅为正则持有，否则空仓(short=True时做空)
+    参数:
+        prices: 日期×代码的价格宽表
+        window: 动量计算窗口
+        short: 动量为负时是否做空
+        cost_model: 交易成本.CostModel，None表示不计成本
+        amount: 日期×代码的成交额宽表，用于估算冲击成本，可选
+    返回:
+        dict，每项都是和prices同形状的DataFrame:
+        return(标的日收益率), momentum, signal(已滞后一日的持仓), strategy_return,
+        cumulative_strategy, cumulative_benchmark；
+        提供cost_model时signal为按交易规则实际成交后的持仓，strategy_return已扣除成本，并增加cost
+    """
+    values = prices.to_numpy(dtype=np.float64)
+
+    # 日收益率只算一次，后面的信号收益和基准净值都复用它
+    ret = np.full_like(values, np.nan)
+    ret[1:] = values[1:] / values[:-1] - 1
+    momentum = np.full_like(values, np.nan)
+    momentum[window:] = values[window:] / values[:-window] - 1
+
+    # 滞后信号以避免未来函数，NaN动量视为无信号
+    signal = np.zeros_like(values)
+    signal[1:] = np.where(momentum[:-1] > 0, 1.0, -1.0 if short else 0.0)
+    signal[1:][np.isnan(momentum[:-1])] = 0.0
+
+    strategy_return = signal * ret
+    cost = None
+    if cost_model is not None:
+        executed = cost_model.backtest(signal, values, amount, returns=ret)
+        signal, strategy_return, cost = executed['position'], executed['net_return'], executed['cost']
+    # 未上市或停牌的日期收益按0计，净值保持不变
+    cumulative_strategy = np.cumprod(1 + np.nan_to_num(strategy_return), axis=0)
+    cumulative_benchmark = np.cumprod(1 + np.nan_to_num(ret), axis=0)
+
+    def frame(a):
+        return pd.DataFrame(a, index=prices.index, columns=prices.columns)
+
+    result = {
+        'return': frame(ret),
+        'momentum': frame(momentum),
+        'signal': frame(signal),
+        'strategy_return': frame(strategy_return),
+        'cumulative_strategy': frame(cumulative_strategy),
+        'cumulative_benchmark': frame(cumulative_benchmark),
+    }
+    if cost is not None:
+        result['cost'] = frame(cost)
+    return result
+
+
+def summarize(result, periods=252):
+    """
+    汇总每个标的的总收益、夏普率、最大回撤和卡玛比率
+    参数:
+        result: momentum_backtest的返回值
+        periods: 年化周期数
+    返回:
+        以代码为索引的DataFrame，完整的指标见 绩效指标.tear_sheet
+    """
+    stats = tear_sheet(result['strategy_return'], periods, positions=result['signal'])
+    return pd.DataFrame({
+        'strategy_total': result['cumulative_strategy'].iloc[-1] - 1,
+        'benchmark_total': result['cumulative_benchmark'].iloc[-1] - 1,
+        'sharpe': stats['sharpe'],
+        'max_drawdown': stats['max_drawdown'],
+        'calmar': stats['calmar'],
+        'turnover': stats['turnover'],
+    })
+
+
+def plot_results(result, symbols, report):
+    """
+    把部分标的的策略和基准净值登记到报告中，每个标的一张图，由report.finish()统一(并行)生成
+    参数:
+        result: momentum_backtest的返回值
+        symbols: 要画图的代码
+        report: 报告.Report
+    """
+    for symbol in symbols:
+        curves = pd.DataFrame({'策略净值': result['cumulative_strategy'][symbol],
+                               '基准净值': result['cumulative_benchmark'][symbol]})
+        report.line(str(symbol), curves, title=f'{symbol} 动量策略净值', ylabel='净值')
+
+
+def main():
+    # 用本地行情库中的全部ETF做一次动量回测，价格矩阵直接取紧凑面板，不需要pivot
+    prices = load_universe(['close']).wide('close')
+    print(f"价格矩阵: {prices.shape[0]} 个交易日 × {prices.shape[1]} 只ETF")
+    result = momentum_backtest(prices, window=20)
+    summary = summarize(result).sort_values('sharpe', ascending=False)
+    print(summary.head(20))
+    # 夏普率最高的20只画净值图，环境变量QUANT_REPORT=off时跳过
+    report = Report('动量回测')
+    plot_results(result, summary.index[:20], report)
+    paths = report.finish()
+    if paths:
+        print(f"已生成 {len(paths)} 张净值图: {report.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# 复权：本地只保存不复权的原始K线和分红、拆分折算事件，前复权(qfq)和后复权(hfq)价格在本地按需计算
+# 数据源的前复权历史会在每次分红后整体改变，按前复权保存的缓存随时会失效；原始K线一旦写入就不会再变
+#
+# 复权因子为后复权因子: 第一个事件之前为1，每个除权除息日乘以
+#   前一交易日收盘价 / 除权参考价，除权参考价 = (前一交易日收盘价 - 每份派现) / 拆分折算比例
+# 后复权价 = 原始价 × 因子；前复权价 = 原始价 × 因子 / 最新因子(最新价格和原始价格相同)
+#
+# 用法:
+#   factors = events_to_factors(events, bars)             # events: symbol, date, cash, split
+#   qfq = adjust_wide(panel.wide('close'), factors, 'qfq')
+#   hfq = adjust_long(store.load(['518880']), factors, 'hfq')
+
+import numpy as np
+import pandas as pd
+
+# 需要复权的价格列，成交量和成交额保持原样
+PRICE_FIELDS = ('open', 'high', 'low', 'close')
+
+EVENT_COLUMNS = ['symbol', 'date', 'cash', 'split']
+FACTOR_COLUMNS = EVENT_COLUMNS + ['prev_close', 'factor']
+
+ADJUSTS = ('', 'qfq', 'hfq')
+
+
+def empty_factors():
+    """没有任何事件时的因子表"""
+    return pd.DataFrame({'symbol': pd.Series(dtype=str), 'date': pd.Series(dtype='datetime64[ns]'),
+                         **{col: pd.Series(dtype=np.float64) for col in FACTOR_COLUMNS[2:]}})
+
+
+def normalize_events(events):
+    """代码转成字符串、日期转成datetime64[ns]，同一天的多个事件合并(派现相加，折算比例相乘)"""
+    events = pd.DataFrame(events)
+    if events.empty:
+        return empty_factors()[EVENT_COLUMNS]
+    events = events.assign(symbol=events['symbol'].astype(str),
+                           date=pd.to_datetime(events['date']).astype('datetime64[ns]'),
+                           cash=events.get('cash', 0.0), split=events.get('split', 1.0))
+    events = events.fillna({'cash': 0.0, 'split': 1.0})
+    return events.groupby(['symbol', 'date'], as_index=False, sort=True).agg(
+        cash=('cash', 'sum'), split=('split', 'prod'))
+
+
+def events_to_factors(events, bars):
+    """
+    由分红和拆分折算事件计算后复权因子
+    参数:
+        events: 包含symbol、date(除权除息日)、cash(每份派现，元)、split(拆分折算比例，1份变成多少份)的DataFrame
+        bars: 不复权的长表，包含symbol、date、close，用来查除权除息日前一交易日的收盘价
+    返回:
+        每个事件一行，列为symbol、date、cash、split、prev_close、factor(从这一天起生效的累计因子)，
+        按(symbol, date)排序；本地行情开始之前的事件查不到收盘价，按不改变价格处理，
+        它们对前复权没有影响，后复权则以本地第一根K线为基准；
+        除权除息日晚于本地最后一根K线的事件(已公告、未实施的分红)还没有生效，也按不改变价格处理，
+        保留在表里，补齐K线后重新计算时才生效，最新的前复权价格始终等于原始价格
+    """
+    events = normalize_events(events)
+    if events.empty:
+        return empty_factors()
+    closes = pd.DataFrame({'symbol': bars['symbol'].astype(str),
+                           'date': pd.to_datetime(bars['date']).astype('datetime64[ns]'),
+                           'prev_close': bars['close'].astype(np.float64)})
+    closes = closes[closes['prev_close'] > 0].sort_values('date')
+    # 严格早于除权除息日的最后一根K线
+    merged = pd.merge_asof(events.sort_values('date'), closes, on='date', by='symbol',
+                           allow_exact_matches=False)
+    merged = merged.sort_values(['symbol', 'date']).reset_index(drop=True)
+    last_bar = closes.groupby('symbol')['date'].max()
+    pending = (merged['date'] > merged['symbol'].map(last_bar)).to_numpy()
+    merged.loc[pending, 'prev_close'] = np.nan
+    prev_close = merged['prev_close'].to_numpy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ratio = prev_close * merged['split'].to_numpy() / (prev_close - merged['cash'].to_numpy())
+    ratio = np.where(np.isfinite(ratio) & (ratio > 0), ratio, 1.0)
+    merged['factor'] = pd.Series(ratio).groupby(merged['symbol'].to_numpy()).cumprod().to_numpy()
+    return merged[FACTOR_COLUMNS]
+
+
+def latest_factors(factors, symbols):
+    """每个代码的最新因子，没有事件的代码为1"""
+    last = factors.groupby('symbol', sort=False)['factor'].last()
+    return last.reindex([str(symbol) for symbol in symbols]).fillna(1.0).to_numpy()
+
+
+def factor_matrix(index, columns, factors):
+    """
+    日期×代码的因子矩阵
+    参数:
+        index: 交易日(DatetimeIndex)
+        columns: 代码
+        factors: events_to_factors的结果
+    返回:
+        len(index)×len(columns)的数组，每个位置是当天生效的累计因子
+    """
+    index = pd.DatetimeIndex(index)
+    out = np.full((len(index), len(columns)), np.nan)
+    if len(factors) and len(index):
+        col = pd.Index([str(c) for c in columns]).get_indexer(factors['symbol'].astype(str))
+        # 除权除息日不是交易日时落在之后的第一个交易日；区间之前的事件落在第一行，作为初始因子
+        row = index.searchsorted(pd.DatetimeIndex(factors['date']).as_unit(index.unit))
+        keep = (col >= 0) & (row < len(index))
+        cells = pd.DataFrame({'row': row[keep], 'col': col[keep],
+                              'factor': factors['factor'].to_numpy()[keep]})
+        # 落在同一格的多个事件，按日期排在最后的就是累计因子
+        cells = cells.drop_duplicates(['row', 'col'], keep='last')
+        out[cells['row'].to_numpy(), cells['col'].to_numpy()] = cells['factor'].to_numpy()
+    out = pd.DataFrame(out).ffill().to_numpy()
+    return np.where(np.isnan(out), 1.0, out)
+
+
+def adjust_wide(prices, factors, how='qfq'):
+    """
+    日期×代码的宽表复权，整个ETF池一次完成
+    参数:
+        prices: 以日期为索引、代码为列的不复权价格
+        factors: events_to_factors的结果
+        how: 'qfq'前复权，'hfq'后复权，''不复权
+    返回:
+        和prices同形状的DataFrame
+    """
+    if how not in ADJUSTS:
+        raise ValueError(f"不支持的复权方式{how}，可选: {ADJUSTS}")
+    if not how:
+        return prices
+    scale = factor_matrix(prices.index, prices.columns, factors)
+    if how == 'qfq':
+        scale = scale / latest_factors(factors, prices.columns)
+    return prices * scale
+
+
+def adjust_long(df, factors, how='qfq', fields=PRICE_FIELDS):
+    """
+    长表复权
+    参数:
+        df: 包含symbol、date和价格列的长表
+        factors: events_to_factors的结果
+        how: 'qfq'前复权，'hfq'后复权，''不复权
+        fields: 要复权的列，df中没有的列会被忽略
+    返回:
+        价格列复权后的DataFrame，行的顺序不变
+    """
+    if how not in ADJUSTS:
+        raise ValueError(f"不支持的复权方式{how}，可选: {ADJUSTS}")
+    fields = [field for field in fields if field in df]
+    if not how or not fields or df.empty:
+        return df
+    codes, symbols = pd.factorize(df['symbol'].astype(str))
+    keys = pd.DataFrame({'symbol': symbols.to_numpy()[codes],
+                         'date': pd.to_datetime(df['date']).astype('datetime64[ns]').to_numpy(),
+                         'pos': np.arange(len(df))}).sort_values('date', kind='stable')
+    table = factors[['symbol', 'date', 'factor']].astype({'symbol': str, 'date': 'datetime64[ns]'})
+    # 每行取当天生效的最后一个因子，第一个事件之前为1
+    matched = pd.merge_asof(keys, table.sort_values('date'), on='date', by='symbol')
+    scale = np.empty(len(df))
+    scale[matched['pos'].to_numpy()] = matched['factor'].fillna(1.0).to_numpy()
+    if how == 'qfq':
+        scale /= latest_factors(factors, symbols)[codes]
+    out = df.copy()
+    for field in fields:
+        out[field] = (df[field].to_numpy(dtype=np.float64) * scale).astype(df[field].dtype)
+    return out
@@ -0,0 +1,324 @@
+# 性能剖析：在获取、特征、策略和评估等关键阶段记录耗时、处理行数、数据字节数和内存峰值，导出json或Chrome trace
+# 默认关闭，关闭时span()返回一个共用的空上下文，@profiled只多一次布尔判断，可以一直留在热点函数上
+# 开启方式(环境变量QUANT_PROFILE或configure设置):
+#   QUANT_PROFILE=1        进程退出时把记录写到 A股ETF/性能剖析/
+#   QUANT_PROFILE=目录     写到指定目录
+#   QUANT_PROFILE_MEMORY=1 用tracemalloc统计每个阶段的Python内存峰值(会让程序变慢)；不开时只记录进程的最大常驻内存
+#                          tracemalloc的峰值是整个进程共用的，只有主线程上的阶段记录peak_mb(包含同时运行的其他线程的分配)，
+#                          工作线程(例如多线程下载中每只ETF的记录)不记录，也不会重置峰值
+# Chrome trace用 chrome://tracing 或 https://ui.perfetto.dev 打开，多线程下载时每个线程一行，慢的代码一眼能看出来
+#
+# 用法:
+#   from 性能剖析 import profiled, span
+#   @profiled('get_daily_data')                        # 返回DataFrame时自动记录行数和字节数
+#   def get_daily_data(...): ...
+#   with span('fetch', symbol=code) as s:
+#       df = fetch(code)
+#       s.add(rows=len(df), bytes=frame_bytes(df))
+#   python 黄金etf日频动量策略.py 之前 export QUANT_PROFILE=1
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块，不记录进程的最大常驻内存
+    resource = None
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A股ETF', '性能剖析')
+
+_enabled = False
+_memory = False
+_out_dir = None
+_records = []
+_lock = threading.Lock()
+_local = threading.local()
+_origin = time.perf_counter_ns()
+_exit_registered = False
+
+
+class _NullSpan:
+    """关闭时使用的空记录，所有方法都不做任何事"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, rows=0, bytes=0):
+        pass
+
+    def set(self, **meta):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    一个阶段的记录，用作上下文管理器
+    参数:
+        name: 阶段名
+        meta: 附加信息，例如symbol，导出时原样保存
+    """
+
+    def __init__(self, name, meta):
+        self.name = name
+        self.meta = meta
+        self.rows = 0
+        self.bytes = 0
+        self._peak = 0
+
+    def add(self, rows=0, bytes=0):
+        """累加处理的行数和字节数"""
+        self.rows += int(rows)
+        self.bytes += int(bytes)
+
+    def set(self, **meta):
+        """补充附加信息"""
+        self.meta.update(meta)
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self._parent = stack[-1] if stack else None
+        stack.append(self)
+        self._track = _memory and threading.current_thread() is threading.main_thread()
+        if self._track:
+            import tracemalloc
+            # 重置峰值之前先把父阶段到目前为止的峰值记下来
+            if self._parent is not None:
+                self._parent._peak = max(self._parent._peak, tracemalloc.get_traced_memory()[1])
+            self._base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        _local.stack.pop()
+        record = {
+            'name': self.name,
+            'start_us': (self._start - _origin) / 1000,
+            'wall_ms': (end - self._start) / 1e6,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'thread': threading.current_thread().name,
+            'tid': threading.get_ident(),
+            'depth': len(_local.stack),
+            'parent': self._parent.name if self._parent is not None else None,
+            'error': None if exc_type is None else exc_type.__name__,
+        }
+        if self._track:
+            import tracemalloc
+            # 子阶段开始时重置过峰值，父阶段的峰值取自己剩下的部分和所有子阶段中的最大值
+            peak = max(tracemalloc.get_traced_memory()[1], self._peak) - self._base
+            record['peak_mb'] = max(peak, 0) / 1e6
+            if self._parent is not None:
+                self._parent._peak = max(self._parent._peak, self._peak, tracemalloc.get_traced_memory()[1])
+        if resource is not None:
+            # ru_maxrss在Linux上单位是KB，macOS上是字节
+            scale = 1e6 if sys.platform == 'darwin' else 1e3
+            record['maxrss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+        if self.meta:
+            record['meta'] = self.meta
+        with _lock:
+            _records.append(record)
+        return False
+
+
+def configure(enabled=True, out_dir=None, memory=None):
+    """
+    开启或关闭记录
+    参数:
+        enabled: 是否记录
+        out_dir: 进程退出时写出记录的目录，None表示不自动写出
+        memory: 是否用tracemalloc统计内存峰值，None时看环境变量QUANT_PROFILE_MEMORY
+    """
+    global _enabled, _memory, _out_dir, _exit_registered
+    _enabled = bool(enabled)
+    _out_dir = out_dir
+    if memory is None:
+        memory = os.environ.get('QUANT_PROFILE_MEMORY', '') not in ('', '0')
+    _memory = bool(memory) and _enabled
+    if _memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+    if _enabled and out_dir is not None and not _exit_registered:
+        atexit.register(_write_at_exit)
+        _exit_registered = True
+
+
+def is_enabled():
+    return _enabled
+
+
+def span(name, **meta):
+    """
+    记录一个阶段的上下文管理器，关闭时返回共用的空记录
+    参数:
+        name: 阶段名
+        meta: 附加信息，例如symbol
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, meta)
+
+
+def frame_bytes(df):
+    """DataFrame或数组占用的字节数(不统计字符串对象本身)"""
+    if hasattr(df, 'memory_usage'):
+        usage = df.memory_usage(index=True, deep=False)
+        return int(usage.sum() if hasattr(usage, 'sum') else usage)
+    return int(getattr(df, 'nbytes', 0))
+
+
+def _argument(func, args, kwargs, name):
+    """按参数名取调用时传入的值，没有传入时为None"""
+    if name in kwargs:
+        return kwargs[name]
+    names = func.__code__.co_varnames[:func.__code__.co_argcount]
+    if name in names and names.index(name) < len(args):
+        return args[names.index(name)]
+    return None
+
+
+def profiled(name=None, symbol_arg=None, rows_arg=None):
+    """
+    记录函数调用的装饰器；默认返回值有len()时记为行数，DataFrame还记录字节数
+    参数:
+        name: 阶段名，默认为函数名
+        symbol_arg: 把这个参数的值记为symbol(例如'symbol'或'code')，方便找出慢的代码
+        rows_arg: 按这个参数(例如'df')而不是返回值统计行数和字节数，用于返回值是汇总结果的函数
+    """
+    def decorator(func):
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            meta = {}
+            if symbol_arg is not None:
+                value = _argument(func, args, kwargs, symbol_arg)
+                if value is not None:
+                    meta['symbol'] = str(value)
+            with Span(label, meta) as s:
+                result = func(*args, **kwargs)
+                data = result if rows_arg is None else _argument(func, args, kwargs, rows_arg)
+                if hasattr(data, '__len__') and not isinstance(data, (str, dict, tuple)):
+                    s.add(rows=len(data), bytes=frame_bytes(data))
+            return result
+        return wrapper
+    return decorator
+
+
+def records():
+    """目前为止的所有记录(列表的副本)"""
+    with _lock:
+        return list(_records)
+
+
+def reset():
+    with _lock:
+        _records.clear()
+
+
+def summary(items=None):
+    """
+    按阶段汇总
+    返回:
+        DataFrame，以阶段名为索引，列为calls、total_ms、mean_ms、max_ms、rows、bytes、slowest(最慢一次的symbol)，按total_ms降序
+    """
+    import pandas as pd
+    items = records() if items is None else items
+    columns = ['calls', 'total_ms', 'mean_ms', 'max_ms', 'rows', 'bytes', 'slowest']
+    if not items:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame({'name': [r['name'] for r in items],
+                       'wall_ms': [r['wall_ms'] for r in items],
+                       'rows': [r['rows'] for r in items],
+                       'bytes': [r['bytes'] for r in items],
+                       'symbol': [r.get('meta', {}).get('symbol') for r in items]})
+    grouped = df.groupby('name', sort=False)
+    out = grouped.agg(calls=('wall_ms', 'size'), total_ms=('wall_ms', 'sum'), mean_ms=('wall_ms', 'mean'),
+                      max_ms=('wall_ms', 'max'), rows=('rows', 'sum'), bytes=('bytes', 'sum'))
+    out['slowest'] = df.loc[grouped['wall_ms'].idxmax(), ['name', 'symbol']].set_index('name')['symbol']
+    return out.sort_values('total_ms', ascending=False)[columns]
+
+
+def print_summary(items=None):
+    table = summary(items)
+    if len(table):
+        print(table.round(2).to_string())
+
+
+def to_chrome_trace(items=None):
+    """Chrome trace格式(完整事件'X')，时间单位为微秒"""
+    items = records() if items is None else items
+    pid = os.getpid()
+    events = []
+    threads = {}
+    for r in items:
+        threads.setdefault(r['tid'], r['thread'])
+        args = {'rows': r['rows'], 'bytes': r['bytes'], **r.get('meta', {})}
+        for key in ('peak_mb', 'maxrss_mb', 'error'):
+            if r.get(key) is not None:
+                args[key] = r[key]
+        events.append({'name': r['name'], 'ph': 'X', 'ts': r['start_us'], 'dur': r['wall_ms'] * 1000,
+                       'pid': pid, 'tid': r['tid'], 'args': args})
+    # 线程名显示在每一行的左边
+    events.extend({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread}}
+                  for tid, thread in threads.items())
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def save(out_dir=PROFILE_DIR, prefix=None, items=None):
+    """
+    写出记录: prefix.json为原始记录，prefix.trace.json为Chrome trace
+    参数:
+        prefix: 文件名前缀，默认为时间戳和进程号
+    返回:
+        (记录路径, trace路径)，没有记录时为None
+    """
+    items = records() if items is None else items
+    if not items:
+        return None
+    os.makedirs(out_dir, exist_ok=True)
+    prefix = prefix or f"{datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}"
+    json_path = os.path.join(out_dir, f'{prefix}.json')
+    trace_path = os.path.join(out_dir, f'{prefix}.trace.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump({'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'), 'pid': os.getpid(),
+                   'records': items}, f, ensure_ascii=False, indent=1)
+    with open(trace_path, 'w', encoding='utf-8') as f:
+        json.dump(to_chrome_trace(items), f, ensure_ascii=False)
+    return json_path, trace_path
+
+
+def _write_at_exit():
+    paths = save(_out_dir)
+    if paths is not None:
+        print_summary()
+        print(f"性能记录已保存: {paths[0]}，Chrome trace: {paths[1]}")
+
+
+def _configure_from_env():
+    value = os.environ.get('QUANT_PROFILE', '')
+    if value in ('', '0'):
+        return
+    configure(True, PROFILE_DIR if value == '1' else value)
+
+
+_configure_from_env()
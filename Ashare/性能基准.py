@@ -0,0 +1,331 @@
+# 性能基准：用合成的日线和分钟线数据，对数据读取、指标计算、策略和评估代码计时
+# 全部离线运行，不访问网络；结果保存为json，并和保存的基线比较，明显变慢的项目会被标出来
+#
+# 用法:
+#   python 性能基准.py                          # 运行small和medium两档，和基线比较
+#   python 性能基准.py --sizes small,medium,large
+#   python 性能基准.py --save-baseline          # 把这次的结果保存为基线
+#   python 性能基准.py --only indicators,load_store
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import matplotlib
+matplotlib.use('Agg')
+# 图表里的中文字体在没有安装的机器上会刷屏警告，基准测试不关心图表内容
+logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+import numpy as np
+import pandas as pd
+
+ASHARE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ASHARE_DIR, 'AshareGOLDetf'))
+
+RESULT_DIR = os.path.join(ASHARE_DIR, 'A股ETF', 'benchmark')
+BASELINE_PATH = os.path.join(RESULT_DIR, 'baseline.json')
+
+# 数据规模: 代码数 × 交易日数，分钟线为交易日数 × 每天240根
+SIZES = {
+    'small': {'symbols': 20, 'days': 500, 'minute_days': 20},
+    'medium': {'symbols': 200, 'days': 2500, 'minute_days': 120},
+    'large': {'symbols': 1000, 'days': 5000, 'minute_days': 500},
+}
+
+
+def synthetic_daily(n_symbols, n_days, seed=0, start='2005-01-04'):
+    """
+    生成合成的日线数据
+    返回:
+        {字段: 日期×代码的宽表}，字段为open、high、low、close、volume、amount
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range(start, periods=n_days, name='date')
+    symbols = pd.Index([f'{i:06d}' for i in range(n_symbols)], name='symbol')
+    shape = (n_days, n_symbols)
+    close = 4.0 * np.exp(np.cumsum(rng.normal(0.0002, 0.012, shape), axis=0))
+    open_ = close * (1 + rng.normal(0, 0.003, shape))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, shape)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, shape)))
+    volume = rng.integers(1_000, 1_000_000, shape).astype(np.float64) * 100
+    frames = {'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume,
+              'amount': volume * close}
+    return {field: pd.DataFrame(values, index=dates, columns=symbols) for field, values in frames.items()}
+
+
+def synthetic_minutes(n_days, seed=0, start='2020-01-02'):
+    """
+    生成合成的1分钟线，A股交易时段9:31-11:30、13:01-15:00，每天240根
+    返回:
+        以datetime为索引、列为open/high/low/close/volume的DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range(start, periods=n_days)
+    offsets = pd.timedelta_range('09:31:00', '11:30:00', freq='1min').append(
+        pd.timedelta_range('13:01:00', '15:00:00', freq='1min'))
+    index = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel(), name='datetime')
+    n = len(index)
+    close = 4.0 * np.exp(np.cumsum(rng.normal(0, 0.0008, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.0003, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.0003, n)))
+    volume = rng.integers(100, 10_000, n).astype(np.float64) * 100
+    return pd.DataFrame({'open': open_, 'high': high, 'low': low, 'close': close, 'volume': volume},
+                        index=index)
+
+
+def to_long(frames):
+    """宽表转成本地行情库格式的长表 {symbol: DataFrame}"""
+    out = {}
+    for symbol in frames['close'].columns:
+        df = pd.DataFrame({field: frame[symbol].to_numpy() for field, frame in frames.items()})
+        df.insert(0, 'date', frames['close'].index)
+        out[symbol] = df
+    return out
+
+
+def build_cases(size, workdir):
+    """
+    准备一档规模的全部测试项目
+    返回:
+        [(名称, 计时函数, 处理的行数), ...]
+    """
+    from 本地行情库 import LocalStore
+    from 紧凑面板 import CompactPanel
+    from 数据源 import FakeSource, ResponseCache, get_bars, register_source
+    from 指标库 import IndicatorSet, clear_cache
+    from 向量化回测 import momentum_backtest, plot_results
+    from 报告 import Report
+    from 组合优化 import rolling_weights
+    from 黄金etf日频动量策略 import daily_momentum_strategy, evaluate_strategy
+    from 黄金etf高频动量策略 import intraday_momentum_strategy
+    from 双均线滚动预测 import build_features, walk_forward_fit
+    from 日内事件回测 import bars_from_frame, simulate
+    from 噪声区间特征 import noise_area_features, stop_lines
+    from 重采样 import resample_bars
+    from 性能剖析 import span
+    from sklearn.linear_model import LinearRegression
+
+    spec = SIZES[size]
+    n_symbols, n_days = spec['symbols'], spec['days']
+    frames = synthetic_daily(n_symbols, n_days)
+    long = to_long(frames)
+    cells = n_symbols * n_days
+
+    # 本地行情库和紧凑面板
+    store = LocalStore(os.path.join(workdir, 'store'))
+    start = frames['close'].index[0].strftime('%Y%m%d')
+    end = frames['close'].index[-1].strftime('%Y%m%d')
+    # 用单独的主机名，不影响同一进程里真实下载的限速
+    store.update_universe(list(long), lambda symbol, s, e: long[symbol], start, end,
+                          host='benchmark', rate=0, verbose=False)
+    panel_dir = os.path.join(workdir, 'panel')
+    CompactPanel.from_store(root=store.root).save(panel_dir)
+
+    # 数据源: 本地假数据 + 磁盘缓存，第一次请求后都命中缓存
+    register_source(FakeSource(frames=long), name='benchmark')
+    cache = ResponseCache(os.path.join(workdir, 'cache'))
+    first = frames['close'].columns[0]
+
+    def data_source():
+        for symbol in frames['close'].columns[:20]:
+            get_bars(symbol, start, end, source='benchmark', cache=cache)
+
+    def indicators():
+        clear_cache()
+        ind = IndicatorSet(frames['close'], frames['high'], frames['low'])
+        ind.sma(55), ind.sma(60), ind.momentum(20), ind.macd(), ind.rsi(14), ind.kdj()
+
+    # 单个标的的日线，对应黄金ETF日频脚本
+    single = pd.DataFrame({field: frame[first] for field, frame in frames.items()})
+    daily_result = daily_momentum_strategy(single.copy())
+    features = build_features(single['close'])
+    train = features.dropna()
+
+    def linear_fit():
+        LinearRegression().fit(train[['S1', 'S2']], train['next_day_price'])
+        walk_forward_fit(features, min_train=250)
+
+    # 分钟线
+    minutes = synthetic_minutes(spec['minute_days'])
+    bars = bars_from_frame(minutes)
+
+    def intraday_event():
+        f = noise_area_features(bars, lookback=14)
+        stop_long, stop_short = stop_lines(f)
+        simulate(bars, f['upper'], f['lower'], stop_long, stop_short,
+                 trade_times=['10:00', '10:30', '11:00', '11:30', '13:30', '14:00', '14:30'])
+
+    # 组合优化: 每日调仓的风险平价，协方差窗口增量更新
+    returns = frames['close'].pct_change()
+
+    def portfolio_weights():
+        rolling_weights(returns, method='risk_parity', window=252, rebalance=1)
+
+    # 批量出图: 8个标的的净值图，无界面模式并行渲染
+    chart_result = momentum_backtest(frames['close'].iloc[:, :8], window=20)
+
+    def report_render():
+        report = Report('benchmark', out_dir=os.path.join(workdir, 'report'), mode='save')
+        plot_results(chart_result, frames['close'].columns[:8], report)
+        report.finish()
+
+    # 性能剖析关闭时留在热点路径上的开销: 十万次空的span
+    def profile_disabled():
+        for _ in range(100_000):
+            with span('noop'):
+                pass
+
+    min_len = min(len(df) for df in long.values())
+    return [
+        ('load_store', lambda: store.load(columns=['close', 'amount']), cells),
+        ('load_panel_mmap', lambda: CompactPanel.load(panel_dir).wide('close'), cells),
+        ('data_source_cached', data_source, 20 * min_len),
+        ('indicators', indicators, cells),
+        ('momentum_backtest', lambda: momentum_backtest(frames['close'], window=20), cells),
+        ('portfolio_weights', portfolio_weights, cells),
+        ('daily_momentum_strategy', lambda: daily_momentum_strategy(single.copy(), window=20), n_days),
+        ('evaluate_strategy', lambda: evaluate_strategy(daily_result), n_days),
+        ('linear_fit', linear_fit, n_days),
+        ('intraday_momentum_strategy', lambda: intraday_momentum_strategy(minutes.copy(), window=30),
+         len(minutes)),
+        ('intraday_event', intraday_event, len(minutes)),
+        ('resample', lambda: [resample_bars(minutes, freq) for freq in ('5min', '15min', '30min', '60min', 'daily')],
+         5 * len(minutes)),
+        ('report_render', report_render, 8 * n_days),
+        ('profile_disabled', profile_disabled, 100_000),
+    ]
+
+
+def time_case(func, repeat=3, warmup=1):
+    """运行func，返回每次的耗时(秒)；预热的那次不计(numba编译、缓存填充)"""
+    for _ in range(warmup):
+        func()
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return times
+
+
+def run_suite(sizes=('small', 'medium'), repeat=3, only=None, verbose=True):
+    """
+    运行基准测试
+    参数:
+        sizes: 要运行的规模
+        repeat: 每项重复次数，取最短时间
+        only: 只运行这些项目，None表示全部
+    返回:
+        结果dict，results的键为'规模/项目'
+    """
+    results = {}
+    cwd = os.getcwd()
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            # 策略评估会在当前目录保存图片，放到临时目录里
+            os.chdir(workdir)
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    cases = build_cases(size, workdir)
+                for name, func, rows in cases:
+                    if only and name not in only:
+                        continue
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        times = time_case(func, repeat)
+                    best = min(times)
+                    results[f'{size}/{name}'] = {
+                        'best': best,
+                        'median': float(np.median(times)),
+                        'rows': rows,
+                        'rows_per_sec': rows / best if best > 0 else None,
+                    }
+                    if verbose:
+                        print(f"{size:>6} {name:<28} {best * 1000:10.2f} ms  {rows / best:14,.0f} 行/秒")
+            finally:
+                os.chdir(cwd)
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold=1.25, min_delta=0.005):
+    """
+    和基线比较，找出变慢的项目
+    参数:
+        threshold: 耗时超过基线的多少倍算变慢
+        min_delta: 耗时差小于多少秒时忽略(计时噪声)
+    返回:
+        [(项目, 基线耗时, 本次耗时, 倍数), ...]
+    """
+    regressions = []
+    for key, result in current['results'].items():
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        ratio = result['best'] / base['best']
+        if ratio > threshold and result['best'] - base['best'] > min_delta:
+            regressions.append((key, base['best'], result['best'], ratio))
+    return regressions
+
+
+def save_json(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线性能基准')
+    parser.add_argument('--sizes', default='small,medium', help='规模，逗号分隔: ' + ','.join(SIZES))
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    parser.add_argument('--only', default=None, help='只运行这些项目，逗号分隔')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基线文件')
+    parser.add_argument('--threshold', type=float, default=1.25, help='耗时超过基线多少倍算变慢')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in args.sizes.split(',') if s]
+    only = set(args.only.split(',')) if args.only else None
+    current = run_suite(sizes, args.repeat, only)
+
+    path = os.path.join(RESULT_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    save_json(current, path)
+    print(f"结果已保存到 {path}")
+
+    if args.save_baseline:
+        save_json(current, args.baseline)
+        print(f"已保存为基线 {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("没有基线，使用 --save-baseline 保存本次结果作为基线")
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold)
+    if not regressions:
+        print(f"没有项目比基线慢{args.threshold:.2f}倍以上")
+        return 0
+    print("以下项目比基线明显变慢:")
+    for key, base, now, ratio in regressions:
+        print(f"  {key:<36} {base * 1000:10.2f} ms -> {now * 1000:10.2f} ms  ({ratio:.2f}x)")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+# 批量下载工具：有界线程池 + 按主机限速 + 指数退避重试 + 失败清单
+# 用法见 ETF获取.py，fetch_func 可以替换成本地的假接口用于测试
+
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+
+class RateLimiter:
+    """
+    令牌桶限速器，线程安全
+    参数:
+        rate: 每秒允许的请求数，<=0 表示不限速
+        burst: 允许的突发请求数
+    """
+
+    def __init__(self, rate=5.0, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """阻塞直到拿到一个令牌"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# 每个主机共用一个限速器，不同脚本/线程访问同一个数据源时互相约束
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host, rate=5.0, burst=1):
+    """
+    获取某个主机的限速器，第一次调用时按给定参数创建，之后参数不同时按新参数重新创建
+    参数:
+        host: 主机标识，例如'eastmoney'、'sina'
+        rate: 每秒请求数
+        burst: 突发请求数
+    返回:
+        RateLimiter
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None or limiter.rate != float(rate) or limiter.capacity != max(1, int(burst)):
+            limiter = _limiters[host] = RateLimiter(rate=rate, burst=burst)
+        return limiter
+
+
+def fetch_with_retry(fetch_func, code, limiter=None, max_retries=3, backoff=1.0):
+    """
+    带限速和指数退避的单次获取
+    参数:
+        fetch_func: 获取函数，fetch_func(code) -> DataFrame
+        code: 代码
+        limiter: 限速器，None表示不限速
+        max_retries: 失败后的最大重试次数
+        backoff: 退避基数(秒)，第n次重试等待 backoff * 2**n 再加一点随机抖动
+    返回:
+        fetch_func的返回值，重试耗尽后抛出最后一次的异常
+    """
+    attempt = 0
+    while True:
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return fetch_func(code)
+        except Exception:
+            if attempt >= max_retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.1))
+            attempt += 1
+
+
+def download_universe(codes, fetch_func, host='eastmoney', max_workers=8, rate=5.0, burst=1,
+                      max_retries=3, backoff=1.0, manifest_path=None, verbose=True, on_result=None):
+    """
+    并发下载一批代码的数据
+    参数:
+        codes: 代码列表
+        fetch_func: 获取函数，fetch_func(code) -> DataFrame
+        host: 数据源主机标识，同一主机共享限速
+        max_workers: 线程池大小
+        rate: 每秒请求数上限
+        burst: 突发请求数
+        max_retries: 单个代码的最大重试次数
+        backoff: 退避基数(秒)
+        manifest_path: 失败清单的保存路径(json)，None表示不保存
+        verbose: 是否打印进度
+        on_result: 每个代码成功后在主线程中调用 on_result(code, result)，可以用来分批落盘
+    返回:
+        (results, failed, stats)
+        results: {code: DataFrame}
+        failed: {code: 错误信息}，只包含获取失败的代码
+        stats: 统计信息，包含耗时和吞吐量(codes/sec)；on_result出错时callback_errors为{code: 错误信息}
+    """
+    codes = [str(code) for code in codes]
+    limiter = get_rate_limiter(host, rate=rate, burst=burst)
+    results = {}
+    failed = {}
+    callback_errors = {}
+    start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(fetch_with_retry, fetch_func, code, limiter, max_retries, backoff): code
+            for code in codes
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            code = futures[future]
+            try:
+                results[code] = future.result()
+            except Exception as e:
+                failed[code] = str(e)[:200]
+                if verbose:
+                    print(f"获取 {code} 数据时出错: {str(e)[:100]}")
+            else:
+                # 获取成功之后的处理(例如落盘)出错不算获取失败，单独记录
+                if on_result is not None:
+                    try:
+                        on_result(code, results[code])
+                    except Exception as e:
+                        callback_errors[code] = str(e)[:200]
+                        if verbose:
+                            print(f"处理 {code} 的数据时出错: {str(e)[:100]}")
+            if verbose and i % 100 == 0:
+                elapsed = time.perf_counter() - start
+                print(f"进度: {i}/{len(codes)}，{i / elapsed:.1f} codes/sec")
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        'total': len(codes),
+        'ok': len(results),
+        'failed': len(failed),
+        'elapsed': elapsed,
+        'codes_per_sec': len(codes) / elapsed if elapsed > 0 else float('inf'),
+        'callback_errors': callback_errors,
+    }
+    if verbose:
+        print(f"下载完成: 成功 {stats['ok']}，失败 {stats['failed']}，"
+              f"耗时 {elapsed:.1f}s，吞吐量 {stats['codes_per_sec']:.1f} codes/sec"
+              + (f"，{len(callback_errors)} 个代码获取成功但处理出错" if callback_errors else ''))
+
+    if manifest_path is not None:
+        save_failed_manifest(manifest_path, failed, stats)
+    return results, failed, stats
+
+
+def save_failed_manifest(path, failed, stats=None):
+    """
+    保存失败清单，没有失败时也会覆盖旧清单
+    参数:
+        path: json路径
+        failed: {code: 错误信息}
+        stats: 本次下载的统计信息
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    manifest = {
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'stats': stats or {},
+        'failed': [{'code': code, 'error': error} for code, error in sorted(failed.items())],
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def load_failed_codes(path):
+    """
+    读取失败清单中的代码，用于重试
+    参数:
+        path: json路径
+    返回:
+        代码列表，文件不存在时返回空列表
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        manifest = json.load(f)
+    return [item['code'] for item in manifest.get('failed', [])]
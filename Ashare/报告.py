@@ -0,0 +1,178 @@
+# 报告：脚本中的图表先登记，到最后统一生成，不再在计算过程中调用plt.show()阻塞进程
+# 三种模式(环境变量QUANT_REPORT或configure设置):
+#   show: 弹出窗口，所有图表在最后一次性显示，整个脚本只调用一次plt.show()
+#   save: 无界面模式，使用Agg后端，图表在多个子进程里并行渲染成png，适合定时任务和批量运行
+#   off:  不生成图表
+# 没有图形界面的Linux(服务器、定时任务)默认为save，其他情况默认为show
+#
+# 用法:
+#   report = Report('黄金ETF')
+#   report.line('净值', df[['strategy_nv', 'bmk_nv']], title='净值曲线', ylabel='净值')
+#   report.finish()                          # save模式返回生成的文件路径
+
+import multiprocessing
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+REPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A股ETF', '报告')
+
+MODES = ('show', 'save', 'off')
+
+# 中文字体设置，每个渲染进程都要重新设置
+DEFAULT_RC = {
+    'font.sans-serif': ['SimHei', 'WenQuanYi Micro Hei', 'Heiti TC', 'DejaVu Sans'],
+    'axes.unicode_minus': False,
+}
+
+_mode = None
+
+
+def default_mode():
+    """环境变量QUANT_REPORT优先，否则有图形界面时为show，没有时为save"""
+    mode = os.environ.get('QUANT_REPORT')
+    if mode:
+        if mode not in MODES:
+            raise ValueError(f"不支持的报告模式{mode}，可选: {MODES}")
+        return mode
+    if sys.platform.startswith('linux') and not (os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY')):
+        return 'save'
+    return 'show'
+
+
+def configure(mode=None):
+    """
+    设置报告模式，非show模式切换到Agg后端(不需要图形界面)
+    参数:
+        mode: 'show'、'save'或'off'，None表示default_mode()
+    返回:
+        实际使用的模式
+    """
+    global _mode
+    _mode = mode or default_mode()
+    if _mode not in MODES:
+        raise ValueError(f"不支持的报告模式{_mode}，可选: {MODES}")
+    if _mode != 'show':
+        matplotlib.use('Agg')
+    return _mode
+
+
+def get_mode():
+    return _mode or configure()
+
+
+def plot_lines(ax, data, title='', xlabel='', ylabel='', colors=None, legend=None, grid=False):
+    """
+    折线图，data的每一列一条线
+    参数:
+        legend: 图例文字，None时使用列名，False时不显示图例
+    """
+    data.plot(ax=ax, color=colors, legend=False)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    if legend is not False:
+        ax.legend(list(data.columns) if legend is None else legend)
+    if grid:
+        ax.grid(True)
+
+
+def _draw(spec):
+    """在当前进程中生成一张图，返回Figure"""
+    import matplotlib.pyplot as plt
+    with plt.style.context(spec['style'] or 'default'), matplotlib.rc_context(spec['rc']):
+        fig, ax = plt.subplots(figsize=spec['figsize'])
+        spec['func'](ax, *spec['args'], **spec['kwargs'])
+    return fig
+
+
+def _render(spec):
+    """生成一张图并保存，在渲染进程中执行"""
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    fig = _draw(spec)
+    fig.savefig(spec['path'], dpi=spec['dpi'], bbox_inches='tight')
+    plt.close(fig)
+    return spec['path']
+
+
+class Report:
+    """
+    一组延后生成的图表
+    参数:
+        name: 报告名，作为文件名前缀
+        out_dir: save模式下图片的保存目录
+        mode: 'show'、'save'或'off'，None表示使用全局设置
+        max_workers: save模式的渲染进程数，1表示在当前进程中渲染；
+            默认在Linux上为CPU核数，其他系统为1(spawn方式的子进程会重新执行没有__main__保护的脚本)
+        style: matplotlib样式，例如'seaborn-v0_8-darkgrid'
+        rc: 额外的matplotlib参数，默认设置中文字体
+        dpi: 图片分辨率
+    """
+
+    def __init__(self, name='', out_dir=REPORT_DIR, mode=None, max_workers=None, style=None, rc=None, dpi=100):
+        self.name = name
+        self.out_dir = out_dir
+        self.mode = mode or get_mode()
+        self.max_workers = max_workers
+        self.style = style
+        self.rc = {**DEFAULT_RC, **(rc or {})}
+        self.dpi = dpi
+        self.specs = []
+
+    def __len__(self):
+        return len(self.specs)
+
+    def add(self, name, func, *args, figsize=(15, 8), **kwargs):
+        """
+        登记一张图
+        参数:
+            name: 图名，用于文件名
+            func: 画图函数func(ax, *args, **kwargs)，save模式下要在子进程中调用，必须是模块级函数
+        """
+        if self.mode == 'off':
+            return
+        safe = re.sub(r'[\\/:*?"<>|\s]+', '_', f'{self.name}_{name}' if self.name else name)
+        self.specs.append({
+            'func': func, 'args': args, 'kwargs': kwargs, 'figsize': figsize, 'style': self.style,
+            'rc': self.rc, 'dpi': self.dpi, 'path': os.path.join(self.out_dir, f'{safe}.png'),
+        })
+
+    def line(self, name, data, figsize=(15, 8), **kwargs):
+        """登记一张折线图，标题默认为图名，其他参数见plot_lines"""
+        kwargs.setdefault('title', name)
+        self.add(name, plot_lines, data, figsize=figsize, **kwargs)
+
+    def finish(self):
+        """
+        生成登记的全部图表
+        返回:
+            save模式下生成的文件路径列表，其他模式为空列表
+        """
+        specs, self.specs = self.specs, []
+        if not specs or self.mode == 'off':
+            return []
+        if self.mode == 'show':
+            import matplotlib.pyplot as plt
+            for spec in specs:
+                _draw(spec)
+            plt.show()
+            return []
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        # 进程里还有其他线程(例如在流程的线程池中调用)时fork可能死锁，不用fork
+        linux = sys.platform.startswith('linux')
+        fork = linux and threading.active_count() == 1
+        max_workers = self.max_workers or ((os.cpu_count() or 1) if fork else 1)
+        max_workers = min(max_workers, len(specs))
+        if max_workers == 1:
+            return [_render(spec) for spec in specs]
+        # 每张图在独立的进程里生成，matplotlib的绘图是单线程的，多张图并行才能用上多核
+        # Linux上用fork方式启动，子进程不会重新导入主脚本；有其他线程时用forkserver
+        context = multiprocessing.get_context('fork' if fork else 'forkserver') if linux else None
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            return list(executor.map(_render, specs))
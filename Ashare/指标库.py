@@ -0,0 +1,184 @@
+# 指标库：在 日期×代码 的矩阵上计算常用技术指标(均线、滚动和、动量、EMA、MACD、RSI、KDJ)
+# 滚动类指标用累计和相减(O(n))，递推类指标用pandas的ewm按列向量化
+# 结果按(代码集合, 指标, 参数, 数据版本)缓存，同一份数据上重复计算同一个指标只是一次字典查找
+#
+# 用法:
+#   ind = IndicatorSet(close)          # close为日期×代码的收盘价宽表
+#   ind.sma(55), ind.sma(60)           # 第二次调用直接命中缓存
+#   ind.macd()['macd'], ind.rsi(14)
+
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# 进程内共享的缓存，不同的IndicatorSet只要数据版本相同就能共用
+_CACHE = {}
+
+
+def clear_cache():
+    """清空进程内缓存"""
+    _CACHE.clear()
+
+
+def data_version(*frames):
+    """
+    计算数据版本号(内容哈希)，数据有任何变化版本号都会改变
+    参数:
+        frames: 一个或多个DataFrame
+    返回:
+        十六进制字符串
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for df in frames:
+        if df is None:
+            h.update(b'none')
+            continue
+        h.update(np.asarray(df.index.values).tobytes())
+        h.update('|'.join(map(str, df.columns)).encode('utf-8'))
+        h.update(np.ascontiguousarray(df.to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+def rolling_sum(values, window):
+    """
+    O(n)的滚动和，窗口内有缺失值时为NaN
+    参数:
+        values: T×N数组
+        window: 窗口长度
+    返回:
+        T×N数组，前window-1行为NaN
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(values.shape, np.nan)
+    if window > len(values):
+        return out
+    valid = ~np.isnan(values)
+    cs = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    cnt = np.cumsum(valid, axis=0)
+    cs = np.concatenate([np.zeros_like(cs[:1]), cs])
+    cnt = np.concatenate([np.zeros_like(cnt[:1]), cnt])
+    out[window - 1:] = cs[window:] - cs[:-window]
+    out[window - 1:][(cnt[window:] - cnt[:-window]) < window] = np.nan
+    return out
+
+
+class IndicatorSet:
+    """
+    一组标的上的指标计算器，所有结果都会缓存
+    参数:
+        close: 日期×代码的收盘价宽表
+        high: 最高价宽表，KDJ需要
+        low: 最低价宽表，KDJ需要
+        version: 数据版本号，默认按内容计算；数据来自本地行情库时也可以传入更新时间等
+        cache_dir: 磁盘缓存目录，None表示只缓存在内存里
+    """
+
+    def __init__(self, close, high=None, low=None, version=None, cache_dir=None):
+        if isinstance(close, pd.Series):
+            close = close.to_frame()
+            high = None if high is None else high.to_frame()
+            low = None if low is None else low.to_frame()
+        self.close = close
+        self.high = high
+        self.low = low
+        self.symbols = tuple(str(col) for col in close.columns)
+        self.version = version or data_version(close, high, low)
+        self.cache_dir = cache_dir
+
+    def _frame(self, values):
+        return pd.DataFrame(values, index=self.close.index, columns=self.close.columns)
+
+    def _cached(self, name, params, compute):
+        key = (self.symbols, name, params, self.version)
+        if key in _CACHE:
+            return _CACHE[key]
+        path = None
+        if self.cache_dir is not None:
+            digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=16).hexdigest()
+            path = os.path.join(self.cache_dir, f'{name}_{digest}.pkl')
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    _CACHE[key] = pickle.load(f)
+                return _CACHE[key]
+        result = compute()
+        _CACHE[key] = result
+        if path is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                pickle.dump(result, f)
+            os.replace(path + '.tmp', path)
+        return result
+
+    def returns(self):
+        """日收益率"""
+        def compute():
+            values = self.close.to_numpy(dtype=np.float64)
+            ret = np.full_like(values, np.nan)
+            ret[1:] = values[1:] / values[:-1] - 1
+            return self._frame(ret)
+        return self._cached('returns', (), compute)
+
+    def sma(self, window):
+        """简单移动平均，等价于close.rolling(window).mean()"""
+        return self._cached('sma', (window,), lambda: self._frame(
+            rolling_sum(self.close.to_numpy(), window) / window))
+
+    def return_sum(self, window):
+        """收益率的滚动和，等价于close.pct_change().rolling(window).sum()"""
+        return self._cached('return_sum', (window,), lambda: self._frame(
+            rolling_sum(self.returns().to_numpy(), window)))
+
+    def momentum(self, window):
+        """动量，等价于close.pct_change(periods=window)"""
+        def compute():
+            values = self.close.to_numpy(dtype=np.float64)
+            out = np.full_like(values, np.nan)
+            out[window:] = values[window:] / values[:-window] - 1
+            return self._frame(out)
+        return self._cached('momentum', (window,), compute)
+
+    def ema(self, span):
+        """指数移动平均(adjust=False的递推形式)"""
+        return self._cached('ema', (span,), lambda: self.close.ewm(span=span, adjust=False).mean())
+
+    def macd(self, fast=12, slow=26, signal=9):
+        """
+        MACD
+        返回:
+            dict: dif(快慢EMA之差)、dea(dif的EMA)、macd(2*(dif-dea)，即柱状图)
+        """
+        def compute():
+            dif = self.ema(fast) - self.ema(slow)
+            dea = dif.ewm(span=signal, adjust=False).mean()
+            return {'dif': dif, 'dea': dea, 'macd': 2 * (dif - dea)}
+        return self._cached('macd', (fast, slow, signal), compute)
+
+    def rsi(self, window=14):
+        """RSI，使用Wilder平滑(alpha=1/window)"""
+        def compute():
+            diff = self.close.diff()
+            gain = diff.clip(lower=0).ewm(alpha=1 / window, adjust=False).mean()
+            loss = (-diff).clip(lower=0).ewm(alpha=1 / window, adjust=False).mean()
+            return 100 - 100 / (1 + gain / loss)
+        return self._cached('rsi', (window,), compute)
+
+    def kdj(self, n=9, m1=3, m2=3):
+        """
+        KDJ
+        返回:
+            dict: k、d、j
+        """
+        if self.high is None or self.low is None:
+            raise ValueError("KDJ需要最高价和最低价")
+
+        def compute():
+            lowest = self.low.rolling(n, min_periods=1).min()
+            highest = self.high.rolling(n, min_periods=1).max()
+            rsv = (self.close - lowest) / (highest - lowest) * 100
+            k = rsv.ewm(alpha=1 / m1, adjust=False).mean()
+            d = k.ewm(alpha=1 / m2, adjust=False).mean()
+            return {'k': k, 'd': d, 'j': 3 * k - 2 * d}
+        return self._cached('kdj', (n, m1, m2), compute)
@@ -0,0 +1,308 @@
+# 统一的数据源：各个数据源(akshare、yfinance、本地假数据)用适配器接入，返回统一的英文列名和固定类型
+# 所有请求先查磁盘缓存，缓存的键是请求内容(数据源、代码、频率、日期区间、复权方式)的哈希，
+# 在区间最后一天收盘之后请求到的数据永久有效，其他(包含盘中不完整K线)的按ttl过期；重复运行研究脚本不会再访问网络
+#
+# 用法:
+#   from 数据源 import get_bars
+#   df = get_bars('518880', '20240101', '20250101')                      # akshare日线
+#   df = get_bars('518880', '20250101', '20250110', freq='5min')         # akshare 5分钟线
+#   df = get_bars('GLD', '20130801', '20250808', source='yfinance')      # yfinance日线
+#   设置环境变量 QUANT_DATA_SOURCE=fake 后所有默认请求都由本地假数据提供，不需要网络
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from 本地行情库 import COLUMN_TYPES, normalize_columns
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A股ETF', '缓存')
+
+# 支持的频率
+FREQS = ('daily', '1min', '5min', '15min', '30min', '60min')
+
+# 收盘前请求到的数据(最后一根K线可能不完整)多久之后重新请求(秒)，收盘后请求到的数据不会过期
+RECENT_TTL = 3600
+# 区间最后一天零点之后多少小时请求到的数据才算收盘后的完整数据(覆盖A股15:00和美股在北京时间次日凌晨的收盘)
+SETTLE_HOURS = 36
+
+
+def _to_day(date):
+    """把'YYYYMMDD'、'YYYY-MM-DD'或datetime统一成'YYYYMMDD'"""
+    return pd.Timestamp(date).strftime('%Y%m%d')
+
+
+def _check_freq(freq):
+    if freq not in FREQS:
+        raise ValueError(f"不支持的频率{freq}，可选: {FREQS}")
+
+
+class AkshareSource:
+    """
+    akshare适配器(东方财富接口)
+    参数:
+        ak_module: akshare模块，默认在第一次请求时导入
+    """
+    name = 'akshare'
+
+    # 分钟线接口的列名
+    MINUTE_MAPPING = {'时间': 'date', '开盘价': 'open', '最高价': 'high', '最低价': 'low',
+                      '收盘价': 'close'}
+
+    def __init__(self, ak_module=None):
+        self._ak = ak_module
+
+    @property
+    def ak(self):
+        if self._ak is None:
+            import akshare as ak
+            self._ak = ak
+        return self._ak
+
+    def fetch(self, symbol, start_date, end_date, freq='daily', adjust=''):
+        if freq == 'daily':
+            df = self.ak.fund_etf_hist_em(symbol=str(symbol), period='daily', start_date=start_date,
+                                          end_date=end_date, adjust=adjust)
+        else:
+            # 分钟线接口的日期带时分秒
+            start = datetime.strptime(start_date, '%Y%m%d').strftime('%Y-%m-%d 09:00:00')
+            end = datetime.strptime(end_date, '%Y%m%d').strftime('%Y-%m-%d 15:30:00')
+            df = self.ak.fund_etf_hist_min_em(symbol=str(symbol), period=freq[:-3], start_date=start,
+                                              end_date=end, adjust=adjust)
+            df = df.rename(columns=self.MINUTE_MAPPING)
+        return df
+
+
+class YFinanceSource:
+    """
+    yfinance适配器，国外数据源，一般需要代理
+    参数:
+        proxy: 代理地址，例如'http://127.0.0.1:10090'，None表示使用系统设置
+    """
+    name = 'yfinance'
+
+    INTERVALS = {'daily': '1d', '1min': '1m', '5min': '5m', '15min': '15m', '30min': '30m', '60min': '60m'}
+
+    def __init__(self, proxy=None):
+        self.proxy = proxy
+
+    def fetch(self, symbol, start_date, end_date, freq='daily', adjust=''):
+        import yfinance as yf
+        if self.proxy:
+            os.environ['HTTP_PROXY'] = self.proxy
+            os.environ['HTTPS_PROXY'] = self.proxy
+        # yfinance的end不包含当天，往后多取一天和akshare保持一致
+        end = (datetime.strptime(end_date, '%Y%m%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        df = yf.download(symbol, start=datetime.strptime(start_date, '%Y%m%d').strftime('%Y-%m-%d'),
+                         end=end, interval=self.INTERVALS[freq], auto_adjust=adjust != '', progress=False)
+        if isinstance(df.columns, pd.MultiIndex):
+            # 新版本的yfinance即使只下载一个代码也返回(字段, 代码)两层列名
+            df.columns = df.columns.get_level_values(0)
+        df = df.rename(columns=str.lower).rename_axis('date').reset_index()
+        if df['date'].dt.tz is not None:
+            df['date'] = df['date'].dt.tz_localize(None)
+        df['amount'] = df['close'] * df['volume']
+        return df
+
+
+class FakeSource:
+    """
+    本地假数据源，按代码生成固定的随机游走行情，测试和离线调试时代替真实接口
+    参数:
+        frames: {代码: DataFrame}，提供时直接返回这些数据(按日期截取)，否则生成随机数据
+        seed: 随机种子
+    """
+    name = 'fake'
+
+    def __init__(self, frames=None, seed=0):
+        self.frames = frames or {}
+        self.seed = seed
+        self.calls = 0
+
+    def _generate(self, symbol, start_date, end_date, freq):
+        days = pd.bdate_range(start_date, end_date)
+        if freq == 'daily':
+            index = days
+        else:
+            # A股交易时段 9:30-11:30、13:00-15:00，K线时间为区间结束时刻
+            step = int(freq[:-3])
+            morning = pd.timedelta_range('09:30:00', '11:30:00', freq=f'{step}min')[1:]
+            afternoon = pd.timedelta_range('13:00:00', '15:00:00', freq=f'{step}min')[1:]
+            offsets = morning.append(afternoon)
+            index = pd.DatetimeIndex((days.values[:, None] + offsets.values[None, :]).ravel())
+        # 种子由代码和频率决定，同样的请求总是得到同样的数据
+        digest = hashlib.blake2b(f'{self.seed}|{symbol}|{freq}'.encode('utf-8'), digest_size=4).digest()
+        rng = np.random.default_rng(int.from_bytes(digest, 'little'))
+        n = len(index)
+        close = 4.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+        open_ = close * (1 + rng.normal(0, 0.002, n))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.003, n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.003, n)))
+        volume = rng.integers(1_000, 100_000, n) * 100
+        return pd.DataFrame({'date': index, 'open': open_, 'close': close, 'high': high, 'low': low,
+                             'volume': volume, 'amount': volume * close})
+
+    def fetch(self, symbol, start_date, end_date, freq='daily', adjust=''):
+        self.calls += 1
+        if symbol in self.frames:
+            df = self.frames[symbol]
+            dates = pd.to_datetime(df['date'])
+            end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+            return df[(dates >= pd.Timestamp(start_date)) & (dates < end)]
+        return self._generate(symbol, start_date, end_date, freq)
+
+
+# 数据源注册表，新的数据源只需要实现fetch(symbol, start_date, end_date, freq, adjust)并注册
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def register_source(source, name=None):
+    """
+    注册数据源，已有同名数据源时会被替换
+    参数:
+        source: 实现了fetch方法的适配器
+        name: 名字，默认用source.name
+    """
+    with _sources_lock:
+        _sources[name or source.name] = source
+
+
+def get_source(name=None):
+    """
+    按名字取数据源，None表示默认数据源(环境变量QUANT_DATA_SOURCE，未设置时为akshare)
+    """
+    name = name or os.environ.get('QUANT_DATA_SOURCE', 'akshare')
+    with _sources_lock:
+        if name not in _sources:
+            defaults = {'akshare': AkshareSource, 'yfinance': YFinanceSource, 'fake': FakeSource}
+            if name not in defaults:
+                raise KeyError(f"未注册的数据源: {name}")
+            _sources[name] = defaults[name]()
+        return _sources[name]
+
+
+class ResponseCache:
+    """
+    按请求内容寻址的磁盘缓存，每个请求的结果存为一个Parquet文件
+    参数:
+        root: 缓存目录
+        recent_ttl: 包含今天的数据的有效期(秒)
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, recent_ttl=RECENT_TTL, settle_hours=SETTLE_HOURS):
+        self.root = root
+        self.recent_ttl = recent_ttl
+        self.settle_hours = settle_hours
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source, symbol, start_date, end_date, freq, adjust):
+        text = '|'.join([source, str(symbol), start_date, end_date, freq, adjust])
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f'{key}.parquet')
+
+    def ttl(self, end_date, fetched_at):
+        """
+        在区间最后一天收盘之后请求到的数据不会再变，永久有效(None)；
+        盘中请求到的数据最后一根K线不完整，即使日期已经过去也按recent_ttl过期
+        参数:
+            fetched_at: 请求时间(缓存文件的修改时间，时间戳)
+        """
+        settled = datetime.strptime(end_date, '%Y%m%d') + timedelta(hours=self.settle_hours)
+        return None if fetched_at >= settled.timestamp() else self.recent_ttl
+
+    def get(self, key, end_date):
+        path = self.path(key)
+        if os.path.exists(path):
+            ttl = self.ttl(end_date, os.path.getmtime(path))
+            if ttl is None or time.time() - os.path.getmtime(path) < ttl:
+                self.hits += 1
+                return pd.read_parquet(path)
+        self.misses += 1
+        return None
+
+    def put(self, key, df):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，中断时不会留下不完整的缓存
+        tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        df.to_parquet(tmp, index=False)
+        os.replace(tmp, path)
+
+    def clear(self):
+        """删除全部缓存文件"""
+        import shutil
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+_default_cache = None
+
+
+def get_cache():
+    """默认的缓存，目录可以用环境变量QUANT_CACHE_DIR修改"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResponseCache(os.environ.get('QUANT_CACHE_DIR', DEFAULT_CACHE_DIR))
+    return _default_cache
+
+
+def normalize_bars(df):
+    """
+    把适配器返回的数据转换成统一格式
+    返回:
+        列和类型与本地行情库COLUMN_TYPES一致的DataFrame，按date排序并去重；
+        分钟线的date包含时间，数据源没有的字段(例如yfinance的换手率)为空值
+    """
+    df = normalize_columns(df)
+    df = df.dropna(subset=['date']).sort_values('date')
+    return df.drop_duplicates('date', keep='last').reset_index(drop=True)
+
+
+def get_bars(symbol, start_date, end_date=None, freq='daily', source=None, adjust='', cache=True):
+    """
+    获取一个代码的K线
+    参数:
+        symbol: 代码，例如'518880'、'GLD'
+        start_date: 开始日期，'YYYYMMDD'或'YYYY-MM-DD'
+        end_date: 结束日期(包含)，默认今天
+        freq: 'daily'或'1min'/'5min'/'15min'/'30min'/'60min'
+        source: 数据源名字，None表示默认数据源
+        adjust: 复权方式，""不复权，"qfq"前复权，"hfq"后复权
+        cache: 是否使用磁盘缓存，也可以传入ResponseCache
+    返回:
+        DataFrame，列为date、open、close、high、low、volume、amount等(见本地行情库COLUMN_TYPES)
+    """
+    _check_freq(freq)
+    adapter = get_source(source)
+    start_date = _to_day(start_date)
+    end_date = _to_day(end_date or datetime.now())
+    if cache is False:
+        return normalize_bars(adapter.fetch(symbol, start_date, end_date, freq=freq, adjust=adjust))
+
+    cache = get_cache() if cache is True else cache
+    key = cache.key(adapter.name, symbol, start_date, end_date, freq, adjust)
+    df = cache.get(key, end_date)
+    if df is None:
+        df = normalize_bars(adapter.fetch(symbol, start_date, end_date, freq=freq, adjust=adjust))
+        cache.put(key, df)
+    # 读回来的类型和直接请求的保持一致
+    return df.astype(COLUMN_TYPES)
+
+
+def daily_fetcher(source=None, adjust=''):
+    """
+    本地行情库使用的日线获取函数，行情库本身就是增量缓存，所以这里不再经过磁盘缓存
+    返回:
+        fetch(symbol, start_date, end_date) -> DataFrame
+    """
+    def fetch(symbol, start_date, end_date):
+        return get_bars(symbol, start_date, end_date, source=source, adjust=adjust, cache=False)
+    return fetch
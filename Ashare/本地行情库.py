@@ -0,0 +1,376 @@
+# 本地行情库：按年份分区的Parquet列式存储，记录每个代码已有的最后日期，只向数据源请求缺失的尾部
+# 中断后重新运行同样的 update_universe 会跳过已完成的代码，从中断处继续
+# 目录结构:
+#   行情库/_meta.json      每个代码的元数据
+#   行情库/{year}.parquet  当年所有代码的数据，按(symbol, date)排序，列名统一为英文并且有固定类型
+#   行情库/_factors.parquet 分红、拆分折算事件和复权因子，K线只保存不复权的原始数据，复权价格读取时计算(见 复权.py)
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pyarrow.dataset as ds
+
+from 批量下载 import download_universe
+from 交易日历 import parse_dates
+from 复权 import EVENT_COLUMNS, FACTOR_COLUMNS, adjust_long, empty_factors, events_to_factors, normalize_events
+
+DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A股ETF', '行情库')
+
+# akshare中文列名 -> 英文列名
+COLUMN_MAPPING = {
+    '日期': 'date',
+    '开盘': 'open',
+    '收盘': 'close',
+    '最高': 'high',
+    '最低': 'low',
+    '成交量': 'volume',
+    '成交额': 'amount',
+    '振幅': 'amplitude',
+    '涨跌幅': 'pct_chg',
+    '涨跌额': 'change',
+    '换手率': 'turnover',
+}
+
+# 列类型，价格和成交额保留float64，百分比类字段用float32节省空间
+COLUMN_TYPES = {
+    'date': 'datetime64[ns]',
+    'open': 'float64',
+    'close': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'volume': 'int64',
+    'amount': 'float64',
+    'amplitude': 'float32',
+    'pct_chg': 'float32',
+    'change': 'float32',
+    'turnover': 'float32',
+}
+
+
+def _to_day(date):
+    """把'YYYYMMDD'、'YYYY-MM-DD'或datetime统一成'YYYYMMDD'"""
+    return pd.Timestamp(date).strftime('%Y%m%d')
+
+
+def _shift_day(day, days):
+    return (datetime.strptime(day, '%Y%m%d') + timedelta(days=days)).strftime('%Y%m%d')
+
+
+def normalize_columns(df):
+    """
+    把数据源返回的中文列转换成英文列名和固定类型，多余的列会被丢掉，缺失的列补空值
+    参数:
+        df: akshare返回的DataFrame
+    返回:
+        列和类型与COLUMN_TYPES一致的DataFrame
+    """
+    df = df.rename(columns=COLUMN_MAPPING)
+    # 所有分区文件的列保持一致，读取多个代码时才能拼在一起
+    df = df.reindex(columns=list(COLUMN_TYPES))
+    # 同一个日期字符串在长表里重复出现很多次，只解析不重复的值
+    df['date'] = parse_dates(df['date'])
+    df['volume'] = pd.to_numeric(df['volume'], errors='coerce').fillna(0)
+    return df.astype(COLUMN_TYPES)
+
+
+class LocalStore:
+    """
+    按年份分区的本地日线库
+    参数:
+        root: 存放目录
+        row_group_size: Parquet行组大小，按代码读取时可以跳过不相关的行组
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, row_group_size=20000):
+        self.root = root
+        self.row_group_size = row_group_size
+        os.makedirs(root, exist_ok=True)
+        self._meta = None
+
+    def path(self, year):
+        return os.path.join(self.root, f'{year}.parquet')
+
+    def meta_path(self):
+        return os.path.join(self.root, '_meta.json')
+
+    def factor_path(self):
+        return os.path.join(self.root, '_factors.parquet')
+
+    def _all_meta(self):
+        if self._meta is None:
+            self._meta = {}
+            if os.path.exists(self.meta_path()):
+                with open(self.meta_path(), encoding='utf-8') as f:
+                    self._meta = json.load(f)
+        return self._meta
+
+    def symbols(self):
+        """本地已有的代码列表"""
+        return sorted(self._all_meta())
+
+    def meta(self, symbol):
+        """
+        读取代码的元数据
+        返回:
+            {'start': 已覆盖的开始日期, 'last_date': 已有的最后日期, 'checked': 已确认到的日期}
+            不存在时返回None
+        """
+        return self._all_meta().get(str(symbol))
+
+    def last_date(self, symbol):
+        meta = self.meta(symbol)
+        return None if meta is None else meta['last_date']
+
+    def years(self, start_date=None, end_date=None):
+        """日期区间内涉及的年份分区"""
+        first = -1 if start_date is None else pd.Timestamp(start_date).year
+        last = 9999 if end_date is None else pd.Timestamp(end_date).year
+        years = sorted(int(name[:-8]) for name in os.listdir(self.root)
+                       if name.endswith('.parquet') and name[:-8].isdigit())
+        return [year for year in years if first <= year <= last]
+
+    def read(self, symbol, start_date=None, end_date=None, columns=None, adjust=''):
+        """
+        读取单个代码的本地数据
+        参数:
+            symbol: 代码
+            start_date: 开始日期，格式'YYYYMMDD'
+            end_date: 结束日期，格式'YYYYMMDD'
+            columns: 需要的列，默认全部
+            adjust: 复权方式，""不复权，"qfq"前复权，"hfq"后复权
+        返回:
+            按日期排序的DataFrame，没有数据时返回空DataFrame
+        """
+        df = self.load([symbol], columns=columns, start_date=start_date, end_date=end_date, adjust=adjust)
+        return df.drop(columns='symbol')
+
+    def load(self, symbols=None, columns=None, start_date=None, end_date=None, adjust=''):
+        """
+        读取多个代码的长表数据，只读取需要的年份分区、行组和列
+        参数:
+            symbols: 代码列表，默认全部
+            columns: 需要的列，默认全部，date列总会带上
+            start_date: 开始日期，格式'YYYYMMDD'
+            end_date: 结束日期，格式'YYYYMMDD'
+            adjust: 复权方式，""不复权，"qfq"前复权，"hfq"后复权，由本地的复权因子计算
+        返回:
+            包含symbol和date列、按(symbol, date)排序的DataFrame，symbol为分类类型
+        """
+        if columns is None:
+            columns = list(COLUMN_TYPES)
+        columns = ['symbol', 'date'] + [col for col in columns if col not in ('date', 'symbol')]
+        paths = [self.path(year) for year in self.years(start_date, end_date)]
+        if not paths:
+            return normalize_columns(pd.DataFrame(columns=['date'])).assign(symbol='')[columns]
+
+        expr = None
+        if symbols is not None:
+            symbols = [str(symbol) for symbol in symbols]
+            expr = ds.field('symbol').isin(symbols)
+        if start_date is not None:
+            cond = ds.field('date') >= pd.Timestamp(start_date)
+            expr = cond if expr is None else expr & cond
+        if end_date is not None:
+            cond = ds.field('date') <= pd.Timestamp(end_date)
+            expr = cond if expr is None else expr & cond
+        table = ds.dataset(paths, format='parquet').to_table(columns=columns, filter=expr)
+        # symbol直接在arrow里转成分类类型，避免生成大量Python字符串
+        df = table.to_pandas(strings_to_categorical=True)
+
+        categories = symbols if symbols is not None else sorted(df['symbol'].cat.categories)
+        df['symbol'] = df['symbol'].cat.set_categories(categories)
+        # 每个年份文件内部已经按(symbol, date)排好序，按年份拼接后只需要对symbol做稳定排序
+        df = df.sort_values('symbol', kind='stable').reset_index(drop=True)
+        return adjust_long(df, self.factors(symbols), adjust) if adjust else df
+
+    def factors(self, symbols=None):
+        """
+        读取复权因子
+        参数:
+            symbols: 代码列表，默认全部
+        返回:
+            复权.events_to_factors格式的DataFrame，没有任何事件时为空表
+        """
+        if not os.path.exists(self.factor_path()):
+            return empty_factors()
+        factors = pd.read_parquet(self.factor_path())
+        if symbols is not None:
+            factors = factors[factors['symbol'].isin([str(symbol) for symbol in symbols])]
+        return factors.reset_index(drop=True)
+
+    def update_factors(self, events):
+        """
+        合并新的分红、拆分折算事件，并用本地的不复权收盘价重新计算这些代码的复权因子
+        参数:
+            events: 包含symbol、date、cash、split列的DataFrame
+        返回:
+            新增的事件数
+        """
+        old = self.factors()[EVENT_COLUMNS]
+        new = normalize_events(events)
+        # 同一代码同一天以新获取的事件为准(新数据里同一天的分红和拆分已经合并)
+        merged = pd.concat([old, new], ignore_index=True).drop_duplicates(['symbol', 'date'], keep='last')
+        added = len(merged) - len(old)
+        # 本地行情补齐之后，之前查不到前收盘价的事件也要重新计算，所以每次都全部重算
+        bars = self.load(merged['symbol'].unique(), columns=['close'])
+        factors = events_to_factors(merged, bars)[FACTOR_COLUMNS]
+        factors.to_parquet(self.factor_path() + '.tmp', index=False)
+        os.replace(self.factor_path() + '.tmp', self.factor_path())
+        return added
+
+    def _commit(self, batch):
+        """
+        把一批代码的新数据写入对应的年份分区并更新元数据
+        参数:
+            batch: {symbol: (新数据DataFrame或None, 新的元数据)}
+        """
+        frames = [df.assign(symbol=str(symbol)) for symbol, (df, _) in batch.items()
+                  if df is not None and len(df) > 0]
+        if frames:
+            new = pd.concat(frames, ignore_index=True)
+            for year, part in new.groupby(new['date'].dt.year):
+                path = self.path(year)
+                if os.path.exists(path):
+                    part = pd.concat([pd.read_parquet(path), part], ignore_index=True)
+                # 同一代码同一日期以新数据为准
+                part = part.drop_duplicates(subset=['symbol', 'date'], keep='last')
+                part = part.sort_values(['symbol', 'date'])[['symbol'] + list(COLUMN_TYPES)]
+                # 先写临时文件再替换，中断时不会留下写了一半的文件
+                part.to_parquet(path + '.tmp', index=False, row_group_size=self.row_group_size)
+                os.replace(path + '.tmp', path)
+
+        all_meta = self._all_meta()
+        for symbol, (_, meta) in batch.items():
+            all_meta[str(symbol)] = meta
+        tmp = self.meta_path() + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(all_meta, f, ensure_ascii=False)
+        os.replace(tmp, self.meta_path())
+
+    def fetch_missing(self, symbol, fetch_func, start_date, end_date=None):
+        """
+        请求[start_date, end_date]区间内本地缺失的数据，不写盘
+        参数:
+            symbol: 代码
+            fetch_func: 获取函数，fetch_func(symbol, start_date, end_date) -> DataFrame
+            start_date: 开始日期，格式'YYYYMMDD'
+            end_date: 结束日期，格式'YYYYMMDD'，默认今天
+        返回:
+            (新数据DataFrame或None, 新的元数据)，本地已经覆盖该区间时返回None
+        """
+        start_date = _to_day(start_date)
+        today = datetime.now().strftime('%Y%m%d')
+        end_date = today if end_date is None else _to_day(end_date)
+        meta = self.meta(symbol)
+
+        # 需要请求的区间
+        ranges = []
+        if meta is None:
+            ranges.append((start_date, end_date))
+        else:
+            if start_date < meta['start']:
+                ranges.append((start_date, _shift_day(meta['start'], -1)))
+            if end_date > meta['checked']:
+                # 从最后一根K线开始请求，顺便刷新盘中拿到的不完整K线
+                ranges.append((meta['last_date'] or meta['checked'], end_date))
+        if not ranges:
+            return None
+
+        new = [fetch_func(symbol, a, b) for a, b in ranges]
+        new = [normalize_columns(df) for df in new if df is not None and len(df) > 0]
+        new = pd.concat(new, ignore_index=True) if new else None
+
+        start = start_date if meta is None else min(start_date, meta['start'])
+        checked = end_date if meta is None else max(end_date, meta['checked'])
+        # 今天的K线可能还没收盘，不记为已确认，下次运行会重新请求
+        checked = min(checked, _shift_day(today, -1))
+        last_date = None if meta is None else meta['last_date']
+        if new is not None:
+            last_date = max(last_date or '', _to_day(new['date'].max()))
+        meta = {
+            'start': start,
+            'last_date': last_date,
+            'checked': checked,
+            'updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        return new, meta
+
+    def update(self, symbol, fetch_func, start_date, end_date=None):
+        """
+        补齐单个代码在[start_date, end_date]区间内本地缺失的数据，参数见fetch_missing
+        返回:
+            请求到的行数
+        """
+        result = self.fetch_missing(symbol, fetch_func, start_date, end_date)
+        if result is None:
+            return 0
+        self._commit({str(symbol): result})
+        return 0 if result[0] is None else len(result[0])
+
+    def get(self, symbol, fetch_func, start_date, end_date=None):
+        """先补齐缺失数据再读取区间内的数据"""
+        self.update(symbol, fetch_func, start_date, end_date)
+        return self.read(symbol, start_date, end_date)
+
+    def update_universe(self, symbols, fetch_func, start_date, end_date=None, flush_every=100,
+                        **download_kwargs):
+        """
+        并发补齐一批代码，已经覆盖到end_date的代码不会再请求，中断后重新运行即可续传
+        参数:
+            symbols: 代码列表
+            fetch_func: 获取函数，fetch_func(symbol, start_date, end_date) -> DataFrame
+            start_date: 开始日期，格式'YYYYMMDD'
+            end_date: 结束日期，格式'YYYYMMDD'，默认今天
+            flush_every: 每获取多少个代码写一次盘，中断时最多损失这一批
+            download_kwargs: 传给批量下载.download_universe的参数
+        返回:
+            (新增行数 {symbol: rows}, 失败 {symbol: 错误信息}, 统计信息)
+        """
+        batch = {}
+
+        def fetch_one(symbol):
+            return self.fetch_missing(symbol, fetch_func, start_date, end_date)
+
+        def on_result(symbol, result):
+            if result is not None:
+                batch[symbol] = result
+            if len(batch) >= flush_every:
+                self._commit(batch)
+                batch.clear()
+
+        try:
+            results, failed, stats = download_universe(symbols, fetch_one, on_result=on_result,
+                                                       **download_kwargs)
+        finally:
+            if batch:
+                self._commit(batch)
+        rows = {symbol: 0 if result is None or result[0] is None else len(result[0])
+                for symbol, result in results.items()}
+        return rows, failed, stats
+
+    def import_long_csv(self, path, symbol_col='symbol'):
+        """
+        把旧的all_etf_data.csv长表导入到本地行情库
+        参数:
+            path: csv路径
+            symbol_col: 代码列名
+        返回:
+            导入的代码数量
+        """
+        df = pd.read_csv(path, dtype={symbol_col: str})
+        batch = {}
+        for symbol, part in df.groupby(symbol_col):
+            part = normalize_columns(part)
+            start, end = part['date'].min(), part['date'].max()
+            batch[symbol] = self.fetch_missing(symbol, lambda *args: part, start, end)
+        self._commit({symbol: result for symbol, result in batch.items() if result is not None})
+        return len(batch)
+
+
+def load_panel(symbols=None, columns=None, start_date=None, end_date=None, root=DEFAULT_ROOT, adjust=''):
+    """
+    从本地行情库读取长表，参数见LocalStore.load
+    """
+    return LocalStore(root).load(symbols, columns, start_date, end_date, adjust)
@@ -0,0 +1,378 @@
+# 每日流程：把 ETF获取 -> 紧凑面板 -> 指标 -> 筛选 -> 信号 -> 报告 串成一个有依赖关系的流程(DAG)，一条命令完成每天的更新
+# 每个阶段的输入(参数、外部输入和上游阶段输出文件的指纹)算一个哈希，和上次成功运行时相同并且输出文件没有变化就跳过；
+# 没有依赖关系的阶段(指标和信号)在线程池里同时运行；每个阶段的耗时追加写入timing.jsonl
+# 数据没有变化时再次运行，所有阶段都会被跳过，只需要检查一遍文件状态
+#
+# 用法:
+#   python 每日流程.py                      # 运行整个流程
+#   python 每日流程.py --offline            # 不下载，只用本地行情库已有的数据
+#   python 每日流程.py --force screen       # 强制重跑某些阶段，all表示全部；输出有变化时下游也会重跑
+#   定时任务(工作日16:30收盘后): 30 16 * * 1-5 cd /path/to/Ashare && QUANT_REPORT=save python 每日流程.py
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from 本地行情库 import DEFAULT_ROOT, LocalStore
+from 紧凑面板 import PANEL_ADJUST, PANEL_DIR, CompactPanel
+from 报告 import REPORT_DIR
+from 性能剖析 import span
+
+ASHARE_DIR = os.path.dirname(os.path.abspath(__file__))
+PIPELINE_DIR = os.path.join(ASHARE_DIR, 'A股ETF', '流程')
+STATE_PATH = os.path.join(PIPELINE_DIR, 'state.json')
+TIMING_PATH = os.path.join(PIPELINE_DIR, 'timing.jsonl')
+
+# 流程参数，修改后受影响的阶段会自动重跑
+DEFAULT_CONFIG = {
+    'start_date': '20240901',
+    'lookback_days': 365,
+    'momentum_window': 20,
+    'liquidity_window': 20,
+    'min_amount': 1e7,
+    'min_days': 120,
+    'max_drawdown': -0.3,
+    'top_n': 20,
+    # 下载失败的ETF超过这个比例时fetch阶段记为失败，下次运行会重试
+    'max_failed_ratio': 0.05,
+}
+
+# 这个时刻之后下载到的当天K线才是收盘后的完整数据
+SETTLED_TIME = '15:30'
+
+
+def fingerprint(paths):
+    """
+    输出文件的指纹: 每个文件的相对路径、大小和修改时间，目录会递归展开
+    只读取文件状态不读内容，流程被跳过时检查一遍也很快
+    返回:
+        十六进制字符串，任何一个路径不存在时返回None
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for path in paths:
+        if not os.path.exists(path):
+            return None
+        files = [path] if os.path.isfile(path) else sorted(
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+        for file in files:
+            stat = os.stat(file)
+            h.update(f'{os.path.relpath(file, ASHARE_DIR)}|{stat.st_size}|{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def save_if_changed(df, path):
+    """
+    内容和已有文件相同时不重写，文件指纹保持不变，下游阶段就不会因为上游重跑而重跑
+    返回:
+        是否写入了文件
+    """
+    if os.path.exists(path):
+        try:
+            if pd.read_parquet(path).equals(df):
+                return False
+        except Exception:
+            pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    df.to_parquet(path + '.tmp')
+    os.replace(path + '.tmp', path)
+    return True
+
+
+class Stage:
+    """
+    流程中的一个阶段
+    参数:
+        name: 阶段名
+        func: func(config)，把结果写到outputs中的文件
+        deps: 上游阶段名
+        outputs: 输出的文件或目录，它们的指纹传给下游阶段
+        params: config中影响这个阶段结果的键
+        inputs: inputs(config) -> 额外的输入(例如日期)，可选
+        main_thread: 是否等其他阶段都结束后在主线程里运行(会启动子进程的阶段，例如并行出图)
+    """
+
+    def __init__(self, name, func, deps=(), outputs=(), params=(), inputs=None, main_thread=False):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.outputs = tuple(outputs)
+        self.params = tuple(params)
+        self.inputs = inputs
+        self.main_thread = main_thread
+
+    def input_hash(self, config, upstream):
+        """参数、外部输入和上游输出指纹的哈希"""
+        key = {
+            'params': {name: config[name] for name in self.params},
+            'inputs': None if self.inputs is None else self.inputs(config),
+            'upstream': {dep: upstream[dep] for dep in self.deps},
+        }
+        text = json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.blake2b(f'{self.name}|{text}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def _load_state(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(state, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def _timed(func, config, name=None):
+    t = time.perf_counter()
+    # QUANT_PROFILE=1时每个阶段也写进Chrome trace，并行的阶段按线程排开
+    with span(name or func.__name__):
+        func(config)
+    return time.perf_counter() - t
+
+
+def run_pipeline(stages, config=None, force=(), skip=(), max_workers=4, state_path=STATE_PATH,
+                 timing_path=TIMING_PATH):
+    """
+    按依赖关系运行各阶段，输入没有变化的阶段直接跳过
+    参数:
+        stages: Stage列表，上游阶段必须排在下游阶段之前
+        config: 流程参数，默认DEFAULT_CONFIG
+        force: 强制重跑的阶段名，'all'表示全部；重跑后输出有变化的，下游阶段也会重跑
+        skip: 不运行的阶段名(例如离线时的fetch)，直接使用它们现有的输出
+        max_workers: 同时运行的阶段数
+    返回:
+        {阶段名: {'status': 'ran'/'skipped'/'failed'/'blocked', 'seconds': 耗时}}
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    by_name = {}
+    for stage in stages:
+        missing = [dep for dep in stage.deps if dep not in by_name]
+        if missing:
+            raise ValueError(f"阶段{stage.name}的上游{missing}不存在或排在它后面")
+        by_name[stage.name] = stage
+    force_all = 'all' in force
+
+    state = _load_state(state_path)
+    upstream = {}     # 已完成阶段的输出指纹
+    results = {}
+    running = {}      # future -> (stage, input_hash)
+    run_id = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def finish(stage, status, seconds=0.0, key=None, error=None):
+        results[stage.name] = {'status': status, 'seconds': seconds}
+        if status in ('ran', 'skipped'):
+            upstream[stage.name] = fingerprint(stage.outputs)
+        if status == 'ran':
+            state[stage.name] = {'input': key, 'output': upstream[stage.name], 'seconds': seconds,
+                                 'finished': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            _save_state(state, state_path)
+        record = {'run': run_id, 'stage': stage.name, 'status': status, 'seconds': round(seconds, 4)}
+        if error is not None:
+            record['error'] = error
+        os.makedirs(os.path.dirname(timing_path), exist_ok=True)
+        with open(timing_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        print(f"[{stage.name}] {status} {seconds:.2f}s" + (f" {error}" if error else ''))
+
+    pending = list(stages)
+    deferred = []     # 等待在主线程运行的阶段
+    executor = None
+    try:
+        while pending or running or deferred:
+            # 上游全部完成的阶段: 输入没变就跳过，否则提交运行
+            for stage in list(pending):
+                status = [results.get(dep, {}).get('status') for dep in stage.deps]
+                if any(s in ('failed', 'blocked') for s in status):
+                    pending.remove(stage)
+                    finish(stage, 'blocked')
+                    continue
+                if any(s is None for s in status):
+                    continue
+                pending.remove(stage)
+                if stage.name in skip:
+                    finish(stage, 'skipped')
+                    continue
+                key = stage.input_hash(config, upstream)
+                last = state.get(stage.name, {})
+                if not (force_all or stage.name in force) and last.get('input') == key \
+                        and last.get('output') is not None and last.get('output') == fingerprint(stage.outputs):
+                    finish(stage, 'skipped')
+                    continue
+                if stage.main_thread:
+                    deferred.append((stage, key))
+                    continue
+                # 线程池按需创建，运行主线程阶段之前关闭，结束所有工作线程
+                executor = executor or ThreadPoolExecutor(max_workers=max_workers)
+                running[executor.submit(_timed, stage.func, config, stage.name)] = (stage, key)
+            if not running:
+                # 其他阶段都结束、线程池关闭之后才运行主线程阶段，进程里有其他线程时fork子进程可能死锁
+                if deferred:
+                    if executor is not None:
+                        executor.shutdown()
+                        executor = None
+                    stage, key = deferred.pop(0)
+                    try:
+                        finish(stage, 'ran', _timed(stage.func, config, stage.name), key)
+                    except Exception as exc:
+                        finish(stage, 'failed', error=f'{type(exc).__name__}: {exc}')
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, key = running.pop(future)
+                try:
+                    finish(stage, 'ran', future.result(), key)
+                except Exception as exc:
+                    finish(stage, 'failed', error=f'{type(exc).__name__}: {exc}')
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+# ---------- 各阶段 ----------
+METRICS_PATH = os.path.join(PIPELINE_DIR, 'metrics.parquet')
+SHORTLIST_PATH = os.path.join(PIPELINE_DIR, 'shortlist.parquet')
+SIGNALS_PATH = os.path.join(PIPELINE_DIR, 'signals.parquet')
+SUMMARY_PATH = os.path.join(PIPELINE_DIR, 'summary.csv')
+
+
+def _today(config):
+    return datetime.now().strftime('%Y%m%d')
+
+
+def _fetch_session(config):
+    """
+    fetch阶段的外部输入: 日期加上盘中/收盘后，盘中运行过之后，收盘后再运行还会重新下载当天的完整K线
+    """
+    now = datetime.now()
+    return f"{now:%Y%m%d}-{'closed' if now.strftime('%H:%M') >= SETTLED_TIME else 'intraday'}"
+
+
+def fetch_stage(config):
+    """增量下载全部ETF的不复权日线和分红、拆分事件到本地行情库"""
+    from ETF获取 import MANIFEST_PATH, get_etf_codes, make_fetch_func, update_adjust_events
+    store = LocalStore()
+    codes = get_etf_codes()
+    rows, failed, stats = store.update_universe(codes, make_fetch_func(), config['start_date'],
+                                                _today(config), host='eastmoney', max_workers=8, rate=5.0,
+                                                manifest_path=MANIFEST_PATH)
+    print(f"新增 {sum(rows.values())} 行，失败 {len(failed)} 只，"
+          f"新增 {update_adjust_events(store, config['start_date'])} 个分红/拆分事件")
+    # 大面积失败(断网、接口变化)时不能记为成功，否则当天不会再重试
+    if len(failed) > config['max_failed_ratio'] * len(codes):
+        raise RuntimeError(f"{len(failed)}/{len(codes)} 只ETF下载失败，超过{config['max_failed_ratio']:.0%}")
+
+
+def panel_stage(config):
+    """从本地行情库重建前复权的紧凑面板，指标、筛选和信号都按复权价格计算"""
+    CompactPanel.from_store(root=DEFAULT_ROOT, adjust=PANEL_ADJUST).save(PANEL_DIR)
+
+
+def _factors_fingerprint(config):
+    # 复权因子变化时前复权价格整体改变，离线运行(跳过fetch)时也要重建面板
+    return fingerprint([LocalStore().factor_path()])
+
+
+def _recent_start(config):
+    # 回看区间的起点随日期变化，作为外部输入
+    return (pd.Timestamp.now().normalize() - pd.Timedelta(days=config['lookback_days'])).strftime('%Y%m%d')
+
+
+def _recent_panel(config, fields):
+    return CompactPanel.load(PANEL_DIR, fields).select(start_date=_recent_start(config))
+
+
+def metrics_stage(config):
+    """计算整个ETF池的筛选指标"""
+    from ETF筛选 import compute_metrics
+    df = _recent_panel(config, ['close', 'amount']).to_long()
+    metrics = compute_metrics(df, config['momentum_window'], config['liquidity_window'])
+    save_if_changed(metrics, METRICS_PATH)
+
+
+def screen_stage(config):
+    """按流动性、上市时长和回撤过滤后按动量排序"""
+    from ETF筛选 import screen_etfs
+    shortlist = screen_etfs(pd.read_parquet(METRICS_PATH), min_amount=config['min_amount'],
+                            min_days=config['min_days'], max_drawdown=config['max_drawdown'],
+                            top_n=config['top_n'])
+    save_if_changed(shortlist, SHORTLIST_PATH)
+
+
+def signals_stage(config):
+    """全部ETF的动量信号: 最新一天收盘后的持仓建议"""
+    from 向量化回测 import momentum_backtest, summarize
+    prices = _recent_panel(config, ['close']).wide('close')
+    result = momentum_backtest(prices, window=config['momentum_window'])
+    signals = summarize(result)
+    signals['momentum'] = result['momentum'].iloc[-1]
+    signals['signal'] = (signals['momentum'] > 0).astype(np.int8)
+    signals['date'] = prices.index[-1]
+    save_if_changed(signals, SIGNALS_PATH)
+
+
+def report_stage(config):
+    """入选ETF的指标和信号汇总表，以及它们的动量策略净值图"""
+    from 报告 import Report
+    from 向量化回测 import momentum_backtest, plot_results
+    shortlist = pd.read_parquet(SHORTLIST_PATH)
+    signals = pd.read_parquet(SIGNALS_PATH)
+    summary = shortlist.join(signals[['signal', 'sharpe', 'strategy_total']], how='left')
+    summary.to_csv(SUMMARY_PATH, encoding='utf-8-sig')
+    print(summary[['rank', 'momentum', 'volatility', 'signal']])
+
+    symbols = [str(symbol) for symbol in shortlist.index]
+    prices = _recent_panel(config, ['close']).wide('close')[symbols]
+    # 图表目录也是这个阶段的输出，QUANT_REPORT=off时也要存在，否则每次都会被当成输出缺失而重跑
+    out_dir = os.path.join(REPORT_DIR, '每日流程')
+    os.makedirs(out_dir, exist_ok=True)
+    report = Report('每日流程', out_dir=out_dir)
+    plot_results(momentum_backtest(prices, window=config['momentum_window']), symbols, report)
+    report.finish()
+
+
+STAGES = [
+    Stage('fetch', fetch_stage, outputs=[DEFAULT_ROOT], params=['start_date'], inputs=_fetch_session),
+    Stage('panel', panel_stage, deps=['fetch'], outputs=[PANEL_DIR], inputs=_factors_fingerprint),
+    Stage('metrics', metrics_stage, deps=['panel'], outputs=[METRICS_PATH],
+          params=['lookback_days', 'momentum_window', 'liquidity_window'], inputs=_recent_start),
+    Stage('signals', signals_stage, deps=['panel'], outputs=[SIGNALS_PATH],
+          params=['lookback_days', 'momentum_window'], inputs=_recent_start),
+    Stage('screen', screen_stage, deps=['metrics'], outputs=[SHORTLIST_PATH],
+          params=['min_amount', 'min_days', 'max_drawdown', 'top_n']),
+    Stage('report', report_stage, deps=['screen', 'signals'],
+          outputs=[SUMMARY_PATH, os.path.join(REPORT_DIR, '每日流程')], params=['lookback_days', 'momentum_window'],
+          main_thread=True),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='每日流程')
+    parser.add_argument('--offline', action='store_true', help='不下载，使用本地行情库现有的数据')
+    parser.add_argument('--force', default='', help='强制重跑的阶段，逗号分隔，all表示全部')
+    parser.add_argument('--workers', type=int, default=4, help='同时运行的阶段数')
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    results = run_pipeline(STAGES, force=[s for s in args.force.split(',') if s],
+                           skip=['fetch'] if args.offline else [], max_workers=args.workers)
+    ran = [name for name, result in results.items() if result['status'] == 'ran']
+    failed = [name for name, result in results.items() if result['status'] in ('failed', 'blocked')]
+    print(f"完成，用时 {time.perf_counter() - t:.2f}s，运行 {len(ran)} 个阶段，"
+          f"跳过 {len(results) - len(ran) - len(failed)} 个" + (f"，失败 {failed}" if failed else ''))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
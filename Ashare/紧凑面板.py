@@ -0,0 +1,286 @@
+# 紧凑面板：整个ETF池的行情用 交易日×代码 的float32矩阵保存，每个字段一个矩阵
+# 代码用int32编号(分类类型的codes)、交易日用int32序号(在dates中的位置)，不再每行重复保存symbol字符串
+# 和长表相比，一只ETF一天的收盘价只占4字节；宽表直接是矩阵的视图，不需要pivot
+#
+# 面板可以保存成一组.npy文件，读取时用内存映射，多个研究进程打开同一份文件时共用操作系统的页缓存；
+# 每次保存写一个新的版本目录再原子地切换指针，正在读旧版本的进程不受影响
+#   panel = CompactPanel.from_store(fields=['close', 'amount'])
+#   panel.save(PANEL_DIR)
+#   panel = CompactPanel.load(PANEL_DIR)          # 内存映射，几乎不占额外内存
+#   prices = panel.wide('close')                 # 日期×代码的DataFrame
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from 本地行情库 import COLUMN_TYPES, DEFAULT_ROOT, LocalStore
+from 交易日历 import NS_PER_DAY, TradingCalendar, parse_dates
+
+PANEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'A股ETF', '面板')
+
+# 默认保存的字段，百分比类字段可以由价格算出来，不放进面板
+DEFAULT_FIELDS = ('open', 'high', 'low', 'close', 'volume', 'amount')
+
+# 保存的ETF池面板使用前复权价格，现金分红不会表现为价格下跌(动量、回撤、波动率都按复权价格计算)
+PANEL_ADJUST = 'qfq'
+
+# 面板目录下指向当前版本的指针文件
+CURRENT_FILE = 'CURRENT'
+
+
+class CompactPanel:
+    """
+    交易日×代码的紧凑面板
+    参数:
+        dates: 交易日，升序的datetime64数组，行号就是交易日序号
+        symbols: 代码列表，列号就是代码编号
+        fields: {字段: T×N的float32矩阵}，没有数据的位置为NaN
+        present: T×N的布尔矩阵，该代码在该交易日是否有数据，默认按fields中任一字段非空判断
+    """
+
+    def __init__(self, dates, symbols, fields, present=None):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        self.symbols = [str(symbol) for symbol in symbols]
+        self.fields = fields
+        if present is None:
+            present = np.zeros((len(self.dates), len(self.symbols)), dtype=bool)
+            for matrix in fields.values():
+                present |= ~np.isnan(matrix)
+        self.present = present
+        self._code = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._calendar = None
+        self._index = None
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols)
+
+    @property
+    def nbytes(self):
+        """面板数据占用的字节数(内存映射时为文件大小)"""
+        return sum(m.nbytes for m in self.fields.values()) + self.present.nbytes + self.dates.nbytes
+
+    # ---------- 编号 ----------
+    def codes(self, symbols):
+        """代码 -> int32编号，不存在的代码为-1"""
+        return np.array([self._code.get(str(symbol), -1) for symbol in symbols], dtype=np.int32)
+
+    @property
+    def index(self):
+        """交易日的DatetimeIndex，只构造一次，各字段的宽表共用"""
+        if self._index is None:
+            self._index = pd.DatetimeIndex(self.dates, name='date')
+        return self._index
+
+    @property
+    def daily(self):
+        """是否是日线面板(所有时间都是零点)"""
+        return not (self.dates.view(np.int64) % NS_PER_DAY).any()
+
+    @property
+    def calendar(self):
+        """面板的交易日历，第一次使用时构造；分钟线面板的日历是有数据的日期，序号和行号不同"""
+        if self._calendar is None:
+            self._calendar = TradingCalendar(self.dates)
+        return self._calendar
+
+    def ordinals(self, dates):
+        """
+        日期 -> int32行号，不在面板中的时间取之前最近的一行，早于第一行为-1
+        日线面板查交易日历的按日展开表；分钟线面板一天有多行，按完整时间二分查找
+        """
+        if self.daily:
+            return self.calendar.ordinals(dates)
+        return (np.searchsorted(self.dates, parse_dates(dates), side='right') - 1).astype(np.int32)
+
+    # ---------- 构造 ----------
+    @classmethod
+    def from_long(cls, df, fields=None):
+        """
+        由长表构造
+        参数:
+            df: 包含symbol、date列的长表，例如LocalStore.load的结果
+            fields: 需要的字段，默认为DEFAULT_FIELDS中长表里有的列
+        """
+        fields = [f for f in (fields or DEFAULT_FIELDS) if f in df.columns]
+        symbol = df['symbol']
+        if hasattr(symbol, 'cat'):
+            symbols = list(symbol.cat.categories)
+            code = symbol.cat.codes.to_numpy().astype(np.int32)
+        else:
+            code, symbols = pd.factorize(symbol, sort=True)
+            code = code.astype(np.int32)
+        date_values = df['date'].to_numpy(dtype='datetime64[ns]')
+        if len(date_values) and not (date_values.view(np.int64) % NS_PER_DAY).any():
+            # 日线: 交易日序号直接查交易日历的按日展开表，不需要排序和二分查找
+            calendar = TradingCalendar(date_values)
+            dates, ordinal = calendar.dates, calendar.ordinals(date_values, 'exact')
+        else:
+            dates = np.unique(date_values)
+            ordinal = np.searchsorted(dates, date_values).astype(np.int32)
+
+        shape = (len(dates), len(symbols))
+        present = np.zeros(shape, dtype=bool)
+        present[ordinal, code] = True
+        matrices = {}
+        for field in fields:
+            matrix = np.full(shape, np.nan, dtype=np.float32)
+            matrix[ordinal, code] = df[field].to_numpy(dtype=np.float32, na_value=np.nan)
+            matrices[field] = matrix
+        return cls(dates, symbols, matrices, present)
+
+    @classmethod
+    def from_wide(cls, frames):
+        """
+        由宽表构造
+        参数:
+            frames: {字段: 日期×代码的DataFrame}，所有宽表的索引和列相同
+        """
+        first = next(iter(frames.values()))
+        matrices = {field: frame.to_numpy(dtype=np.float32) for field, frame in frames.items()}
+        return cls(first.index.to_numpy(), first.columns, matrices)
+
+    @classmethod
+    def from_store(cls, symbols=None, fields=None, start_date=None, end_date=None, root=DEFAULT_ROOT, adjust=''):
+        """从本地行情库读取，参数见LocalStore.load"""
+        fields = list(fields or DEFAULT_FIELDS)
+        df = LocalStore(root).load(symbols, fields, start_date, end_date, adjust)
+        return cls.from_long(df, fields)
+
+    # ---------- 转换 ----------
+    def wide(self, field='close', dtype=None):
+        """
+        某个字段的 日期×代码 宽表
+        参数:
+            dtype: 为None时直接包装面板中的float32矩阵(不复制)，也可以指定np.float64
+        """
+        matrix = self.fields[field]
+        if dtype is not None:
+            matrix = matrix.astype(dtype)
+        return pd.DataFrame(matrix, index=self.index,
+                            columns=pd.Index(self.symbols, name='symbol'), copy=False)
+
+    def to_long(self, fields=None):
+        """
+        转回按(symbol, date)排序的长表，只保留有数据的行，symbol为分类类型
+        和LocalStore.load的结果格式相同，可以直接交给ETF筛选.compute_metrics
+        """
+        fields = list(fields or self.fields)
+        T, N = self.shape
+        # 矩阵转置后按行展开就是按代码、再按日期的顺序
+        keep = self.present.T.ravel()
+        code = np.repeat(np.arange(N, dtype=np.int32), T)[keep]
+        ordinal = np.tile(np.arange(T, dtype=np.int32), N)[keep]
+        df = pd.DataFrame({
+            'symbol': pd.Categorical.from_codes(code, categories=self.symbols),
+            'date': self.dates[ordinal],
+        })
+        for field in fields:
+            df[field] = self.fields[field].T.ravel()[keep]
+        return df
+
+    def select(self, symbols=None, start_date=None, end_date=None):
+        """
+        截取部分代码和日期，日期区间是矩阵的切片，不复制数据
+        """
+        lo = 0 if start_date is None else int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date))))
+        hi = len(self.dates) if end_date is None else \
+            int(np.searchsorted(self.dates, np.datetime64(pd.Timestamp(end_date)), side='right'))
+        cols = slice(None)
+        names = self.symbols
+        if symbols is not None:
+            cols = self.codes(symbols)
+            if (cols < 0).any():
+                missing = [s for s, c in zip(symbols, cols) if c < 0]
+                raise KeyError(f"面板中没有这些代码: {missing}")
+            names = [self.symbols[c] for c in cols]
+        fields = {field: m[lo:hi][:, cols] for field, m in self.fields.items()}
+        return CompactPanel(self.dates[lo:hi], names, fields, self.present[lo:hi][:, cols])
+
+    # ---------- 保存和内存映射读取 ----------
+    def save(self, path, keep=2):
+        """
+        保存为一组.npy文件和meta.json
+        每次保存写到path下一个新的版本目录，全部写完后再用os.replace替换指针文件CURRENT切换版本；
+        已经内存映射旧版本的进程不受影响，中途中断时CURRENT仍然指向完整的旧版本
+        参数:
+            keep: 保留最近几个版本，更早的版本在切换后删除(Windows上仍被映射的文件删不掉，下次再删)
+        """
+        os.makedirs(path, exist_ok=True)
+        version = f"v{pd.Timestamp.now():%Y%m%d%H%M%S%f}_{os.getpid()}"
+        folder = os.path.join(path, version)
+        os.makedirs(folder)
+        np.save(os.path.join(folder, 'dates.npy'), self.dates.astype('datetime64[ns]'))
+        np.save(os.path.join(folder, 'present.npy'), self.present)
+        for field, matrix in self.fields.items():
+            np.save(os.path.join(folder, f'{field}.npy'), np.ascontiguousarray(matrix, dtype=np.float32))
+        meta = {'symbols': self.symbols, 'fields': list(self.fields), 'shape': list(self.shape)}
+        with open(os.path.join(folder, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        pointer = os.path.join(path, CURRENT_FILE)
+        with open(pointer + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(pointer + '.tmp', pointer)
+        # 版本名按时间排序，删掉更早的版本
+        versions = sorted(name for name in os.listdir(path)
+                          if name.startswith('v') and os.path.isdir(os.path.join(path, name)))
+        for name in versions[:-keep] if keep > 0 else []:
+            if name != version:
+                shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+        return folder
+
+    @staticmethod
+    def current(path):
+        """path下当前版本的目录；没有CURRENT时为path本身(旧版本直接保存在path下的面板)"""
+        pointer = os.path.join(path, CURRENT_FILE)
+        if not os.path.exists(pointer):
+            return path
+        with open(pointer, encoding='utf-8') as f:
+            return os.path.join(path, f.read().strip())
+
+    @classmethod
+    def load(cls, path, fields=None, mmap=True):
+        """
+        读取保存的面板(当前版本)
+        参数:
+            fields: 需要的字段，默认全部
+            mmap: 是否用只读内存映射，多个进程可以共用同一份数据
+        """
+        path = cls.current(path)
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        mode = 'r' if mmap else None
+        matrices = {field: np.load(os.path.join(path, f'{field}.npy'), mmap_mode=mode)
+                    for field in (fields or meta['fields'])}
+        return cls(np.load(os.path.join(path, 'dates.npy')), meta['symbols'], matrices,
+                   np.load(os.path.join(path, 'present.npy'), mmap_mode=mode))
+
+
+def load_universe(fields=None, start_date=None, end_date=None, path=PANEL_DIR, root=DEFAULT_ROOT):
+    """
+    读取整个ETF池的面板: 保存的面板比本地行情库新时直接内存映射，否则从行情库重建并保存
+    参数:
+        fields: 需要的字段，默认DEFAULT_FIELDS
+        start_date: 开始日期
+        end_date: 结束日期
+    返回:
+        CompactPanel
+    """
+    fields = list(fields or DEFAULT_FIELDS)
+    meta_file = os.path.join(CompactPanel.current(path), 'meta.json')
+    store = LocalStore(root)
+    store_meta = store.meta_path()
+    # 复权因子更新后前复权价格整体改变，面板也要重建
+    sources = [store_meta] + [p for p in [store.factor_path()] if os.path.exists(p)]
+    fresh = os.path.exists(meta_file) and os.path.exists(store_meta) \
+        and all(os.path.getmtime(meta_file) >= os.path.getmtime(p) for p in sources)
+    if fresh:
+        with open(meta_file, encoding='utf-8') as f:
+            fresh = set(fields) <= set(json.load(f)['fields'])
+    if not fresh:
+        saved = sorted(set(fields) | set(DEFAULT_FIELDS), key=list(COLUMN_TYPES).index)
+        CompactPanel.from_store(fields=saved, root=root, adjust=PANEL_ADJUST).save(path)
+    return CompactPanel.load(path, fields).select(start_date=start_date, end_date=end_date)
@@ -0,0 +1,344 @@
+# 组合优化：在ETF池的收益率矩阵上滚动估计协方差(Ledoit-Wolf收缩)，在每个调仓日求解
+# 最小方差、均值-方差、风险平价三种只做多、满仓的权重
+#
+# 窗口内收益率的和与叉积和按行累加，窗口前进时只加上新进入的行、减去移出的行，
+# 协方差不需要在每个调仓日重新计算；收缩强度只用到每行收益的平方和，O(窗口×标的数)
+# 每次求解都从上一个调仓日的权重开始，相邻调仓日的协方差变化很小，通常很快收敛
+#
+# 用法:
+#   prices = load_universe(['close']).wide('close', np.float64)
+#   weights, info = rolling_weights(prices.pct_change(), method='risk_parity', window=252, rebalance=1)
+#   result = backtest_weights(weights, prices, cost_model=CostModel.etf())
+
+import numpy as np
+import pandas as pd
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+from 紧凑面板 import load_universe
+from 交易成本 import CostModel
+from 绩效指标 import print_summary, tear_sheet
+
+METHODS = ('min_variance', 'mean_variance', 'risk_parity')
+
+
+def _shrink(sample, centered):
+    """
+    Ledoit-Wolf(2004)收缩: 向 平均方差×单位阵 收缩
+    参数:
+        sample: 样本协方差(除以样本数)
+        centered: 去均值后的收益率，T×n
+    返回:
+        (收缩后的协方差, 收缩强度)
+    """
+    T, n = centered.shape
+    mu = np.trace(sample) / n
+    norm2 = (sample * sample).sum()
+    # 样本协方差和收缩目标的距离 ||S - mu*I||²
+    d2 = norm2 - 2 * mu * np.trace(sample) + n * mu * mu
+    # 样本协方差的估计误差 Σ_t ||x_t x_tᵀ - S||² / T²，其中 ||x_t x_tᵀ||² = ||x_t||⁴
+    b2 = ((centered * centered).sum(axis=1) ** 2).sum() / T - norm2
+    shrinkage = 0.0 if d2 <= 0 else min(max(b2 / T, 0.0), d2) / d2
+    cov = (1 - shrinkage) * sample
+    cov[np.diag_indices(n)] += shrinkage * mu
+    return cov, shrinkage
+
+
+def ledoit_wolf(returns):
+    """
+    一个样本的Ledoit-Wolf收缩协方差，结果和sklearn.covariance.ledoit_wolf相同
+    参数:
+        returns: T×N收益率，不能有缺失
+    返回:
+        (协方差矩阵, 收缩强度)
+    """
+    r = np.asarray(returns, dtype=np.float64)
+    centered = r - r.mean(axis=0)
+    return _shrink(centered.T @ centered / len(r), centered)
+
+
+class RollingCovariance:
+    """
+    滚动窗口协方差，窗口前进时增量更新
+    缺失的收益按0累加，只有窗口内数据完整的标的参与估计，对这些标的累加结果是精确的
+    参数:
+        values: T×N收益率数组，缺失为NaN
+        window: 窗口长度
+        refresh: 增量更新的行数超过这个数时从窗口重新计算一次，避免浮点误差累积
+    """
+
+    def __init__(self, values, window, refresh=1000):
+        self.values = values
+        self.window = window
+        self.refresh = refresh
+        N = values.shape[1]
+        self.valid = np.zeros(N)        # 窗口内每个标的的有效行数
+        self.s1 = np.zeros(N)           # Σ r_i
+        self.s2 = np.zeros((N, N))      # Σ r_i r_j
+        self.lo = self.hi = 0           # 当前窗口为 values[lo:hi]
+        self._updated = 0
+
+    def _update(self, lo, hi, sign):
+        block = self.values[lo:hi]
+        if len(block) == 0:
+            return
+        valid = ~np.isnan(block)
+        r = np.where(valid, block, 0.0)
+        self.valid += sign * valid.sum(axis=0)
+        self.s1 += sign * r.sum(axis=0)
+        self.s2 += sign * (r.T @ r)
+        self._updated += len(r)
+
+    def advance(self, t):
+        """把窗口移动到以第t行结束"""
+        hi = t + 1
+        lo = max(0, hi - self.window)
+        if lo >= self.hi or self._updated > self.refresh:
+            # 新窗口和旧窗口没有重叠，或者需要消除累积误差时，直接重新计算
+            self.valid[:], self.s1[:], self.s2[:] = 0.0, 0.0, 0.0
+            self._updated = 0
+            self._update(lo, hi, 1)
+        else:
+            self._update(self.hi, hi, 1)
+            self._update(self.lo, lo, -1)
+        self.lo, self.hi = lo, hi
+
+    @property
+    def count(self):
+        return self.hi - self.lo
+
+    def complete(self):
+        """窗口内数据完整的标的编号"""
+        return np.flatnonzero(self.valid == self.count)
+
+    def mean(self, assets):
+        return self.s1[assets] / self.count
+
+    def covariance(self, assets, shrink=True):
+        """
+        部分标的的协方差矩阵(除以样本数，和Ledoit-Wolf原文一致)
+        参数:
+            assets: 标的编号，应当是complete()中的标的
+            shrink: 是否做Ledoit-Wolf收缩
+        返回:
+            (协方差矩阵, 收缩强度)
+        """
+        T = self.count
+        m = self.mean(assets)
+        full = len(assets) == len(self.s1)
+        s2 = self.s2 if full else self.s2[np.ix_(assets, assets)]
+        sample = s2 / T - np.outer(m, m)
+        if not shrink or len(assets) < 2:
+            return sample, 0.0
+        window = self.values[self.lo:self.hi]
+        centered = (window if full else window[:, assets]) - m
+        return _shrink(sample, centered)
+
+
+# ---------- 求解器 ----------
+def solve_mean_variance(cov, expected=None, risk_aversion=1.0, w0=None, tol=1e-9, max_iter=None):
+    """
+    只做多、满仓的均值-方差组合: max expectedᵀw - risk_aversion/2 · wᵀΣw，expected为None时就是最小方差组合
+    用原始积极集法: 每步只在非零权重的标的上解一个线性方程组，不满足约束时沿可行方向退回边界，
+    满足时检查零权重标的的乘子，把最该加入的标的加入
+    w0(上一期的权重)直接给出初始的非零集合，相邻调仓日的非零集合几乎不变，通常一两步就收敛
+    返回:
+        (权重, 迭代次数)
+    """
+    n = len(cov)
+    gamma = risk_aversion
+    mu = np.zeros(n) if expected is None else np.asarray(expected, dtype=np.float64)
+    if w0 is None or np.sum(w0) <= 0:
+        # 冷启动: 从单独持有时目标最好的标的开始，逐个加入
+        w = np.zeros(n)
+        w[np.argmin(0.5 * gamma * np.diag(cov) - mu)] = 1.0
+    else:
+        w = np.maximum(np.asarray(w0, dtype=np.float64), 0.0)
+        w /= w.sum()
+    free = w > 0
+    for it in range(1, (max_iter or 10 * n) + 1):
+        F = np.flatnonzero(free)
+        # 等式约束下的最优解: w_F = Σ_FF⁻¹(mu_F - λ·1) / gamma，λ使权重和为1
+        x = np.linalg.solve(cov[np.ix_(F, F)], np.column_stack([np.ones(len(F)), mu[F]]))
+        lam = (x[:, 1].sum() - gamma) / x[:, 0].sum()
+        target = (x[:, 1] - lam * x[:, 0]) / gamma
+        if target.min() < 0:
+            # 沿当前点到最优解的方向走到第一个权重变为0的位置，把它移出非零集合
+            current = w[F]
+            shrinking = target < 0
+            steps = current[shrinking] / (current[shrinking] - target[shrinking])
+            alpha = steps.min()
+            w[F] = np.maximum(current + alpha * (target - current), 0.0)
+            w[F[np.flatnonzero(shrinking)[np.argmin(steps)]]] = 0.0
+            free = w > 0
+            continue
+        w[:] = 0.0
+        w[F] = target
+        # 零权重标的的乘子 gamma(Σw)_i - mu_i + λ 为负时加入它可以继续改进目标
+        grad = gamma * (cov @ w) - mu
+        multiplier = grad + lam
+        multiplier[free] = 0.0
+        worst = np.argmin(multiplier)
+        if multiplier[worst] >= -tol * np.abs(grad).max():
+            return w, it
+        free[worst] = True
+    return w, max_iter or 10 * n
+
+
+@njit(cache=True)
+def _risk_parity_ccd(cov, b, y, tol, max_iter):
+    """
+    循环坐标下降: 依次对每个y_i求解 Σ_ii y_i² + c_i y_i - b_i = 0 (c_i为其他标的的贡献)的正根
+    sy始终等于Σy，更新一个坐标只需要O(n)
+    """
+    sy = cov @ y
+    for it in range(max_iter):
+        if np.abs(y * sy - b).max() < tol:
+            return it
+        for i in range(len(y)):
+            a = cov[i, i]
+            c = sy[i] - a * y[i]
+            new = (-c + np.sqrt(c * c + 4 * a * b[i])) / (2 * a)
+            # 协方差对称，用第i行代替第i列，内存连续
+            sy += cov[i] * (new - y[i])
+            y[i] = new
+    return max_iter
+
+
+def solve_risk_parity(cov, budget=None, w0=None, tol=1e-10, max_iter=10000):
+    """
+    风险平价组合: 每个标的的风险贡献 w_i(Σw)_i 和预算budget成比例
+    等价于凸问题 min ½yᵀΣy - Σ b_i log y_i，w = y / Σy，用循环坐标下降求解，w0为迭代初值
+    返回:
+        (权重, 迭代轮数)
+    """
+    cov = np.ascontiguousarray(cov, dtype=np.float64)
+    n = len(cov)
+    b = np.full(n, 1.0 / n) if budget is None else np.asarray(budget, dtype=np.float64) / np.sum(budget)
+    y = np.full(n, 1.0 / n) if w0 is None else np.asarray(w0, dtype=np.float64)
+    y = np.where(y > 0, y, 1.0 / n)
+    # 最优解满足 yᵀΣy = Σb = 1，按这个尺度缩放初值
+    y = y / np.sqrt(y @ cov @ y)
+    iterations = _risk_parity_ccd(cov, b, y, tol, max_iter)
+    return y / y.sum(), iterations
+
+
+# ---------- 滚动调仓 ----------
+def rolling_weights(returns, method='min_variance', window=252, rebalance=21, shrink=True,
+                    risk_aversion=5.0, expected_returns=None, min_assets=2, refresh=1000):
+    """
+    滚动窗口估计协方差，在每个调仓日求解组合权重
+    参数:
+        returns: 日期×代码的收益率宽表，缺失表示未上市或停牌
+        method: 'min_variance'、'mean_variance'或'risk_parity'
+        window: 估计窗口(交易日)，只有窗口内数据完整的标的参与当期组合
+        rebalance: 每隔多少个交易日调仓一次，1为每日调仓
+        shrink: 是否使用Ledoit-Wolf收缩
+        risk_aversion: 均值-方差的风险厌恶系数(日收益率尺度)
+        expected_returns: 和returns同形状的预期收益宽表(例如动量信号)，默认用窗口内的平均收益
+        min_assets: 可投资标的少于这个数时跳过该调仓日
+        refresh: 累加/移出的行数超过这个数时从窗口重新计算一次，避免浮点误差累积
+    返回:
+        (weights, info):
+        weights: 调仓日×代码的权重，调仓日收盘时确定，不在组合中的标的为0
+        info: 每个调仓日的标的数、收缩强度和求解迭代次数
+    """
+    if method not in METHODS:
+        raise ValueError(f"不支持的方法{method}，可选: {METHODS}")
+    values = returns.to_numpy(dtype=np.float64)
+    if expected_returns is not None:
+        expected_returns = expected_returns.reindex(index=returns.index, columns=returns.columns) \
+            .to_numpy(dtype=np.float64)
+    T, N = values.shape
+    rolling = RollingCovariance(values, window, refresh)
+    previous = np.zeros(N)
+    rows, weights, info = [], [], []
+
+    for t in range(window - 1, T, rebalance):
+        rolling.advance(t)
+        assets = rolling.complete()
+        if len(assets) < min_assets:
+            continue
+        cov, shrinkage = rolling.covariance(assets, shrink)
+        # 上一期的权重作为初值，新进入的标的由求解器决定是否加入
+        w0 = previous[assets]
+        if method == 'risk_parity':
+            w, iterations = solve_risk_parity(cov, w0=w0)
+        elif method == 'min_variance':
+            w, iterations = solve_mean_variance(cov, w0=w0)
+        else:
+            expected = rolling.mean(assets) if expected_returns is None else \
+                np.nan_to_num(expected_returns[t, assets])
+            w, iterations = solve_mean_variance(cov, expected, risk_aversion, w0=w0)
+        previous = np.zeros(N)
+        previous[assets] = w
+        rows.append(t)
+        weights.append(previous)
+        info.append((len(assets), shrinkage, iterations))
+
+    index = returns.index[rows]
+    weights = pd.DataFrame(np.array(weights).reshape(len(rows), N), index=index, columns=returns.columns)
+    info = pd.DataFrame(info, index=index, columns=['n_assets', 'shrinkage', 'iterations'])
+    return weights, info
+
+
+def backtest_weights(weights, prices, cost_model=None, amount=None):
+    """
+    按调仓日的目标权重持有到下一个调仓日
+    参数:
+        weights: rolling_weights返回的调仓日×代码权重
+        prices: 日期×代码的价格宽表
+        cost_model: 交易成本.CostModel，None表示不计成本
+        amount: 日期×代码的成交额宽表，用于估算冲击成本，可选
+    返回:
+        dict: position(每日实际持仓权重)、portfolio_return、cumulative，计成本时增加cost(每日成本合计)
+    """
+    target = weights.reindex(index=prices.index, columns=prices.columns).ffill().fillna(0.0)
+    # 调仓日收盘确定权重，从下一个交易日开始持有，和其他策略的信号滞后一日相同
+    signal = target.shift(1).fillna(0.0)
+    returns = prices.pct_change()
+    if cost_model is None:
+        position, asset_return, cost = signal, signal * returns, None
+    else:
+        if amount is not None:
+            amount = amount.reindex(index=prices.index, columns=prices.columns)
+        executed = cost_model.backtest(signal, prices, amount, returns=returns)
+        position, asset_return, cost = executed['position'], executed['net_return'], executed['cost']
+    portfolio_return = asset_return.sum(axis=1)
+    result = {
+        'position': position,
+        'portfolio_return': portfolio_return,
+        'cumulative': (1 + portfolio_return).cumprod(),
+    }
+    if cost is not None:
+        result['cost'] = cost.sum(axis=1)
+    return result
+
+
+def main():
+    # 用本地行情库中的全部ETF做三种组合的滚动优化，每月调仓，扣除ETF交易成本
+    panel = load_universe(['close', 'amount'])
+    prices = panel.wide('close', np.float64)
+    amount = panel.wide('amount', np.float64)
+    returns = prices.pct_change()
+    print(f"收益率矩阵: {returns.shape[0]} 个交易日 × {returns.shape[1]} 只ETF")
+
+    portfolio = {}
+    for method in METHODS:
+        weights, info = rolling_weights(returns, method=method, window=252, rebalance=21)
+        result = backtest_weights(weights, prices, cost_model=CostModel.etf(), amount=amount)
+        portfolio[method] = result['portfolio_return']
+        print(f"{method}: {len(weights)} 个调仓日，平均 {info['n_assets'].mean():.0f} 只ETF，"
+              f"平均收缩强度 {info['shrinkage'].mean():.2f}，平均迭代 {info['iterations'].mean():.1f} 次")
+        print(weights.iloc[-1].nlargest(5).round(3).to_dict())
+    print_summary(tear_sheet(pd.DataFrame(portfolio), periods=252))
+
+
+if __name__ == "__main__":
+    main()
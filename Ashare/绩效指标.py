@@ -0,0 +1,243 @@
+# 绩效指标：在 时间×策略 的收益率矩阵上一次性计算所有列的指标，不按列循环
+# 收益率中的NaN表示没有数据(未上市、信号未形成)，计算均值/波动率时跳过，计算净值时按0收益处理
+#
+# 用法:
+#   tear_sheet(df[['strategy_return', 'return']])     # 每列一行的指标表
+#   rolling_sharpe(returns, window=60)                  # 滚动夏普率，累计和相减，O(T)
+#   bootstrap_sharpe(returns, n_boot=1000, block=20)    # 分块自助法的夏普率置信区间
+
+import numpy as np
+import pandas as pd
+
+
+def _as_matrix(returns):
+    """把Series/DataFrame/数组统一成 T×N 的float64数组，同时返回列名和索引"""
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=np.float64), returns.columns, returns.index
+    values = np.asarray(returns, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, pd.RangeIndex(values.shape[1]), pd.RangeIndex(values.shape[0])
+
+
+def _moments(r):
+    """每列的有效样本数、均值和样本标准差(ddof=1)，跳过NaN"""
+    valid = ~np.isnan(r)
+    n = valid.sum(axis=0)
+    r0 = np.where(valid, r, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = r0.sum(axis=0) / n
+        var = (np.where(valid, r - mean, 0.0) ** 2).sum(axis=0) / (n - 1)
+    return n, mean, np.sqrt(var)
+
+
+def nav(returns):
+    """净值曲线，NaN按0收益处理"""
+    return np.cumprod(1 + np.nan_to_num(np.asarray(returns, dtype=np.float64)), axis=0)
+
+
+def total_return(returns):
+    """每列的总收益率"""
+    return nav(returns)[-1] - 1
+
+
+def sharpe_ratio(returns, periods=252, risk_free=0.0):
+    """
+    每列的年化夏普率
+    参数:
+        returns: T×N收益率数组
+        periods: 年化周期数，日线252
+        risk_free: 年化无风险利率
+    """
+    r = np.asarray(returns, dtype=np.float64) - risk_free / periods
+    _, mean, std = _moments(r)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sqrt(periods) * mean / std
+
+
+def max_drawdown(returns, curve=None):
+    """每列的最大回撤(负数)，已经算好净值时可以直接传入curve"""
+    curve = nav(returns) if curve is None else curve
+    return (curve / np.maximum.accumulate(curve, axis=0) - 1).min(axis=0)
+
+
+def drawdown_duration(returns, curve=None):
+    """每列最长的水下期(从前高到重新创新高之间的周期数)"""
+    curve = nav(returns) if curve is None else curve
+    T = curve.shape[0]
+    at_high = curve >= np.maximum.accumulate(curve, axis=0)
+    steps = np.arange(T)[:, None]
+    # 每个位置最近一次创新高的位置，和当前位置的差就是已经水下的周期数
+    last_high = np.maximum.accumulate(np.where(at_high, steps, 0), axis=0)
+    return (steps - last_high).max(axis=0)
+
+
+def tear_sheet(returns, periods=252, positions=None, risk_free=0.0):
+    """
+    计算每列的完整绩效指标
+    参数:
+        returns: 收益率，Series、DataFrame(每列一个策略)或T×N数组
+        periods: 年化周期数，日线252
+        positions: 和returns同形状的持仓，提供时计算换手率
+        risk_free: 年化无风险利率，只影响夏普率和索提诺比率
+    返回:
+        每列一行的DataFrame，列为:
+        periods, total_return, annual_return, annual_volatility, sharpe, sortino, max_drawdown,
+        max_drawdown_duration, calmar, hit_rate(有收益的周期中盈利的比例), profit_factor(盈利总和/亏损总和),
+        best, worst, turnover(平均每周期持仓变化，提供positions时)
+    """
+    r, columns, _ = _as_matrix(returns)
+    n, mean, std = _moments(r)
+    excess = r - risk_free / periods
+    _, excess_mean, _ = _moments(excess)
+    r0 = np.nan_to_num(r)
+
+    curve = nav(r0)
+    total = curve[-1] - 1
+    mdd = max_drawdown(r0, curve)
+    downside = np.sqrt((np.minimum(np.nan_to_num(excess), 0) ** 2).sum(axis=0) / n)
+    active = (r0 != 0).sum(axis=0)
+    gains = np.where(r0 > 0, r0, 0).sum(axis=0)
+    losses = -np.where(r0 < 0, r0, 0).sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        annual_return = (1 + total) ** (periods / n) - 1
+        stats = {
+            'periods': n,
+            'total_return': total,
+            'annual_return': annual_return,
+            'annual_volatility': std * np.sqrt(periods),
+            'sharpe': np.sqrt(periods) * excess_mean / std,
+            'sortino': np.sqrt(periods) * excess_mean / downside,
+            'max_drawdown': mdd,
+            'max_drawdown_duration': drawdown_duration(r0, curve),
+            'calmar': annual_return / np.abs(mdd),
+            'hit_rate': (r0 > 0).sum(axis=0) / active,
+            'profit_factor': gains / losses,
+            'best': np.where(n > 0, np.where(np.isnan(r), -np.inf, r).max(axis=0), np.nan),
+            'worst': np.where(n > 0, np.where(np.isnan(r), np.inf, r).min(axis=0), np.nan),
+        }
+    if positions is not None:
+        pos, _, _ = _as_matrix(positions)
+        change = np.abs(np.diff(np.nan_to_num(pos), axis=0, prepend=0.0))
+        stats['turnover'] = change.mean(axis=0)
+    return pd.DataFrame(stats, index=columns)
+
+
+def _window_sums(values, window):
+    """窗口内的和、平方和、有效个数，累计和相减得到"""
+    valid = ~np.isnan(values)
+    v0 = np.where(valid, values, 0.0)
+    out = []
+    for x in (v0, v0 * v0, valid.astype(np.float64)):
+        cs = np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+        s = np.full(x.shape, np.nan)
+        if window <= len(x):
+            s[window - 1:] = cs[window:] - cs[:-window]
+        out.append(s)
+    return out
+
+
+def rolling_sharpe(returns, window=60, periods=252, min_periods=None):
+    """
+    滚动年化夏普率
+    参数:
+        returns: 收益率，Series、DataFrame或T×N数组
+        window: 窗口长度
+        min_periods: 窗口内至少需要的有效样本数，默认等于window
+    返回:
+        和returns同形状的DataFrame
+    """
+    r, columns, index = _as_matrix(returns)
+    s1, s2, n = _window_sums(r, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = s1 / n
+        var = (s2 - n * mean * mean) / (n - 1)
+        out = np.sqrt(periods) * mean / np.sqrt(np.maximum(var, 0))
+    out[n < (min_periods or window)] = np.nan
+    return pd.DataFrame(out, index=index, columns=columns)
+
+
+def rolling_volatility(returns, window=60, periods=252, min_periods=None):
+    """滚动年化波动率，参数同rolling_sharpe"""
+    r, columns, index = _as_matrix(returns)
+    s1, s2, n = _window_sums(r, window)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        var = (s2 - s1 * s1 / n) / (n - 1)
+        out = np.sqrt(np.maximum(var, 0) * periods)
+    out[n < (min_periods or window)] = np.nan
+    return pd.DataFrame(out, index=index, columns=columns)
+
+
+def rolling_return(returns, window=60):
+    """滚动window个周期的复利收益率，用对数收益的累计和相减得到"""
+    r, columns, index = _as_matrix(returns)
+    log_r = np.log1p(np.nan_to_num(r))
+    cs = np.concatenate([np.zeros((1, r.shape[1])), np.cumsum(log_r, axis=0)])
+    out = np.full(r.shape, np.nan)
+    if window <= len(r):
+        out[window - 1:] = np.expm1(cs[window:] - cs[:-window])
+    return pd.DataFrame(out, index=index, columns=columns)
+
+
+def bootstrap_sharpe(returns, n_boot=1000, block=20, ci=0.95, periods=252, seed=0, chunk=250):
+    """
+    分块自助法(moving block bootstrap)估计夏普率的置信区间，保留收益率的短期自相关
+    每个自助样本由随机抽取的若干段长度为block的连续收益拼成，每段的和与平方和由累计和相减得到，
+    一个样本的统计量就是 各段被抽中的次数 × 各段的和，所有样本和所有列一次矩阵乘法算完
+    参数:
+        returns: 收益率，Series、DataFrame或T×N数组
+        n_boot: 自助样本数
+        block: 每段的长度
+        ci: 置信水平
+        seed: 随机种子
+        chunk: 每次处理多少个自助样本，控制内存占用
+    返回:
+        每列一行的DataFrame，列为sharpe(原样本)、std_error、lower、upper
+    """
+    r, columns, _ = _as_matrix(returns)
+    T = r.shape[0]
+    block = max(1, min(block, T))
+    valid = ~np.isnan(r)
+    r0 = np.where(valid, r, 0.0)
+
+    # 所有可能的起点上每段的和、平方和、有效个数: (S, N)
+    def block_sums(x):
+        cs = np.concatenate([np.zeros((1, x.shape[1])), np.cumsum(x, axis=0)])
+        return cs[block:] - cs[:-block]
+    b1, b2, bn = block_sums(r0), block_sums(r0 * r0), block_sums(valid.astype(np.float64))
+    n_starts = b1.shape[0]
+    n_blocks = -(-T // block)
+
+    rng = np.random.default_rng(seed)
+    samples = np.empty((n_boot, r.shape[1]))
+    for lo in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - lo)
+        starts = rng.integers(0, n_starts, (size, n_blocks))
+        # 每个样本中各个起点被抽中的次数
+        flat = (np.arange(size)[:, None] * n_starts + starts).ravel()
+        counts = np.bincount(flat, minlength=size * n_starts).reshape(size, n_starts).astype(np.float64)
+        s1, s2, n = counts @ b1, counts @ b2, counts @ bn
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = s1 / n
+            std = np.sqrt(np.maximum((s2 - n * mean * mean) / (n - 1), 0))
+            samples[lo:lo + size] = np.sqrt(periods) * mean / std
+
+    alpha = (1 - ci) / 2
+    with np.errstate(invalid='ignore'):
+        lower, upper = np.nanquantile(samples, [alpha, 1 - alpha], axis=0)
+    return pd.DataFrame({
+        'sharpe': sharpe_ratio(r, periods),
+        'std_error': np.nanstd(samples, axis=0, ddof=1),
+        'lower': lower,
+        'upper': upper,
+    }, index=columns)
+
+
+def print_summary(stats):
+    """打印tear_sheet的常用指标，每列一行"""
+    for name, row in stats.iterrows():
+        print(f"{name}: 总收益率 {row['total_return']:.2%}，年化收益率 {row['annual_return']:.2%}，"
+              f"夏普率 {row['sharpe']:.2f}，最大回撤 {row['max_drawdown']:.2%}，"
+              f"卡玛比率 {row['calmar']:.2f}，胜率 {row['hit_rate']:.2%}")
@@ -0,0 +1,171 @@
+# 重采样：只下载最细的分钟线(1分钟，拿不到时5分钟)，5/15/30/60分钟线和日线在本地聚合
+# A股交易时段9:30-11:30、13:00-15:00，K线时间为区间结束时刻；按交易分钟编号(1-240)分组，午休不会落进任何一根K线，
+# 60分钟线为10:30、11:30、14:00、15:00，和交易所、行情软件一致；9:30的集合竞价K线并入第一根
+# 只聚合有数据的交易日，节假日和停牌不会产生空K线；全部用numpy的分段归约完成，没有按天或按K线的Python循环
+#
+# 用法:
+#   bars, base = get_finest_bars('518880', '20250101', '20250110')     # 1分钟线，下载一次后读磁盘缓存
+#   bars_15 = resample_bars(bars, '15min')
+#   frames = get_resampled_bars('518880', '20250101', '20250110')     # {频率: DataFrame}
+
+import numpy as np
+import pandas as pd
+
+from 数据源 import get_bars
+
+# 交易时段(分钟)，K线时间为区间结束时刻
+MORNING_OPEN, MORNING_CLOSE = 9 * 60 + 30, 11 * 60 + 30
+AFTERNOON_OPEN, AFTERNOON_CLOSE = 13 * 60, 15 * 60
+SESSION_MINUTES = MORNING_CLOSE - MORNING_OPEN
+DAY_MINUTES = 2 * SESSION_MINUTES
+
+# 依次尝试的原始频率，akshare的1分钟线只有最近几个交易日
+BASE_FREQS = ('1min', '5min')
+
+RESAMPLE_FREQS = ('5min', '15min', '30min', '60min', '120min', 'daily')
+
+_NS_PER_DAY = 86_400_000_000_000
+_NS_PER_MINUTE = 60_000_000_000
+
+
+def _step(freq):
+    """频率对应的交易分钟数，daily为一整天"""
+    if freq == 'daily':
+        return DAY_MINUTES
+    if not freq.endswith('min') or not freq[:-3].isdigit():
+        raise ValueError(f"不支持的频率{freq}，可选: {RESAMPLE_FREQS}")
+    step = int(freq[:-3])
+    # 每根K线都要落在同一个交易时段内，上午收盘11:30必须是K线的边界
+    if step <= 0 or SESSION_MINUTES % step:
+        raise ValueError(f"频率{freq}不能整除一个交易时段({SESSION_MINUTES}分钟)")
+    return step
+
+
+def session_minutes(index):
+    """
+    K线结束时刻在当天的交易分钟编号，9:31为1，11:30为120，13:01为121，15:00为240
+    集合竞价(9:30及之前)记为1，收盘之后记为240
+    参数:
+        index: DatetimeIndex或datetime64数组
+    返回:
+        int64数组
+    """
+    ns = np.asarray(index, dtype='datetime64[ns]').view(np.int64)
+    minute = (ns % _NS_PER_DAY) // _NS_PER_MINUTE
+    k = np.where(minute <= MORNING_CLOSE, minute - MORNING_OPEN,
+                 minute - AFTERNOON_OPEN + SESSION_MINUTES)
+    return np.clip(k, 1, DAY_MINUTES)
+
+
+def _label_offsets(step):
+    """每根聚合K线的结束时刻相对当天零点的分钟数"""
+    ends = np.arange(step, DAY_MINUTES + 1, step)
+    return np.where(ends <= SESSION_MINUTES, MORNING_OPEN + ends, AFTERNOON_OPEN + ends - SESSION_MINUTES)
+
+
+def resample_bars(df, freq='5min'):
+    """
+    把分钟线聚合成更粗的频率
+    参数:
+        df: 分钟线，以datetime为索引或者有date列，列为open/high/low/close/volume，可以有amount；
+            有symbol列时按代码分别聚合，此时需要按(symbol, 时间)排序
+        freq: '5min'、'15min'、'30min'、'60min'、'120min'或'daily'
+    返回:
+        和输入格式相同的DataFrame: 开盘价取第一根，收盘价取最后一根，最高/最低取极值，成交量和成交额求和；
+        分钟线的时间为K线结束时刻，日线的时间为当天零点
+    """
+    step = _step(freq)
+    indexed = 'date' not in df
+    times = (df.index if indexed else df['date']).to_numpy(dtype='datetime64[ns]')
+    n = len(times)
+    if n == 0:
+        return df.iloc[:0]
+    if 'symbol' not in df and n > 1 and (np.diff(times.view(np.int64)) < 0).any():
+        order = np.argsort(times, kind='stable')
+        df, times = df.iloc[order], times[order]
+
+    ns = times.view(np.int64)
+    day = ns // _NS_PER_DAY
+    bucket = (session_minutes(times) - 1) // step
+    change = np.empty(n, dtype=np.bool_)
+    change[0] = True
+    change[1:] = (day[1:] != day[:-1]) | (bucket[1:] != bucket[:-1])
+    if 'symbol' in df:
+        codes = pd.factorize(df['symbol'])[0]
+        change[1:] |= codes[1:] != codes[:-1]
+    starts = np.flatnonzero(change)
+    ends = np.r_[starts[1:], n] - 1
+
+    out = {}
+    if 'symbol' in df:
+        out['symbol'] = df['symbol'].to_numpy()[starts]
+    labels = day[starts] * _NS_PER_DAY
+    if freq != 'daily':
+        labels = labels + _label_offsets(step)[bucket[starts]] * _NS_PER_MINUTE
+    labels = labels.view('datetime64[ns]')
+    if not indexed:
+        out['date'] = labels
+    for col in df.columns:
+        if col in ('symbol', 'date'):
+            continue
+        values = df[col].to_numpy()
+        if col == 'open':
+            out[col] = values[starts]
+        elif col == 'close':
+            out[col] = values[ends]
+        elif col == 'high':
+            out[col] = np.maximum.reduceat(values, starts)
+        elif col == 'low':
+            out[col] = np.minimum.reduceat(values, starts)
+        elif col in ('volume', 'amount'):
+            out[col] = np.add.reduceat(values, starts)
+        else:
+            # 其他列(例如换手率)取区间内最后一个值
+            out[col] = values[ends]
+    if indexed:
+        return pd.DataFrame(out, index=pd.DatetimeIndex(labels, name=df.index.name))
+    return pd.DataFrame(out)
+
+
+def get_finest_bars(symbol, start_date, end_date, source=None, base_freqs=BASE_FREQS, tolerance_days=7):
+    """
+    获取能覆盖整个区间的最细的分钟线，经过数据源的磁盘缓存，同一区间只下载一次
+    参数:
+        symbol: 代码
+        start_date: 开始日期，格式'YYYYMMDD'
+        end_date: 结束日期，格式'YYYYMMDD'
+        source: 数据源名，默认见 数据源.get_bars
+        base_freqs: 依次尝试的频率
+        tolerance_days: 第一根K线比start_date晚多少天以内算作覆盖(节假日)
+    返回:
+        (分钟线DataFrame, 频率)
+    """
+    errors = []
+    for i, freq in enumerate(base_freqs):
+        try:
+            df = get_bars(symbol, start_date, end_date, freq=freq, source=source)
+        except Exception as exc:
+            errors.append(f'{freq}: {str(exc)[:100]}')
+            continue
+        if len(df) == 0:
+            errors.append(f'{freq}: 没有数据')
+            continue
+        covered = df['date'].iloc[0] - pd.Timestamp(start_date) <= pd.Timedelta(days=tolerance_days)
+        # 最后一个候选即使覆盖不全也返回
+        if covered or i == len(base_freqs) - 1:
+            return df, freq
+        errors.append(f'{freq}: 只有{df["date"].iloc[0]:%Y-%m-%d}之后的数据')
+    raise ValueError(f"{symbol}没有可用的分钟线: {'; '.join(errors)}")
+
+
+def get_resampled_bars(symbol, start_date, end_date, freqs=('5min', '15min', '30min', '60min', 'daily'),
+                       source=None):
+    """
+    一次下载最细的分钟线，在本地聚合出多个频率
+    返回:
+        {频率: DataFrame}，列和get_bars相同；比原始频率还细的频率不会出现在结果中
+    """
+    bars, base = get_finest_bars(symbol, start_date, end_date, source=source)
+    base_step = _step(base)
+    return {freq: bars if freq == base else resample_bars(bars, freq)
+            for freq in freqs if _step(freq) >= base_step and _step(freq) % base_step == 0}